@@ -5,18 +5,18 @@ This module handles loading, saving, and processing audio files
 with various effects.
 """
 
-import librosa
-import soundfile as sf
 import numpy as np
-import scipy.signal
-import gc
+import os
 import resource
-import time
+from concurrent.futures import ThreadPoolExecutor
 
-from effects.robot_effect import RobotEffect
-from effects.pitch_effect import PitchEffect
-from effects.speed_effect import SpeedEffect
-from effects.echo_effect import EchoEffect
+from effects.registry import EffectRegistry
+from config import Config
+from metrics import StageTimer, effect_stage
+from pipeline import (
+    BufferArena, ChunkEngine, StreamingDecoder, StreamingEncoder, STFTAnalyzer, PeakBuilder,
+    SpectrogramBuilder
+)
 
 
 class AudioProcessor:
@@ -26,16 +26,20 @@ class AudioProcessor:
     It manages loading, saving, and applying audio effects.
     """
 
-    def __init__(self):
+    def __init__(self, decoded_cache=None, analysis_cache=None):
         """
         Initialize available effects.
+
+        Args:
+            decoded_cache (DecodedAudioCache): Optional cache of decoded
+                uploads; when set, each file is decoded and resampled once.
+            analysis_cache (AnalysisCache): Optional cache of STFT analyses;
+                when set, each upload is analyzed once per STFT setting.
         """
-        self.effects = {
-            'robot': RobotEffect(),
-            'pitch': PitchEffect(),
-            'speed': SpeedEffect(),
-            'echo': EchoEffect()
-        }
+        self.decoded_cache = decoded_cache
+        self.analysis_cache = analysis_cache
+        # Effect modules are imported when an effect is first used
+        self.effects = EffectRegistry()
 
     def get_available_effects(self):
         """
@@ -54,15 +58,63 @@ class AudioProcessor:
             name (str): Name of the effect.
             effect: Instance of the effect.
         """
-        self.effects[name] = effect
+        self.effects.register(name, effect)
 
-    def load_audio(self, file_path, duration=60):
+    def stream_audio(self, file_path, duration=Config.MAX_RENDER_DURATION, timer=None):
+        """
+        Opens an audio file for block-by-block decoding.
+
+        Blocks are mono float32 at no more than ``Config.TARGET_SAMPLE_RATE``.
+        Only the first ``duration`` seconds are read. When a decoded-audio
+        cache is set, blocks come from the memory-mapped sidecar if there is
+        one, and are written to a new sidecar otherwise.
+
+        Args:
+            file_path (str): Path to the audio file to load.
+            duration (int): Max duration in seconds to load
+                (default ``Config.MAX_RENDER_DURATION``).
+            timer (StageTimer): Optional timer of the 'decode' and
+                'resample' stages.
+
+        Returns:
+            tuple: (blocks (iterable[np.ndarray]), sample_rate (int),
+                num_samples (int))
+
+        Raises:
+            IOError: If the file cannot be opened.
+        """
+        decoder = StreamingDecoder(file_path, duration, timer=timer)
+        sample_rate = decoder.sample_rate
+
+        def timed(blocks):
+            return timer.iterate('decode', blocks) if timer is not None else blocks
+
+        if self.decoded_cache is not None:
+            audio_data = self.decoded_cache.load(file_path, sample_rate, duration)
+            if audio_data is not None:
+                print(f"Mapped decoded audio. Shape: {audio_data.shape}, SR: {sample_rate}")
+                step = decoder.block_frames
+                blocks = (audio_data[i:i + step] for i in range(0, len(audio_data), step))
+                return timed(blocks), sample_rate, len(audio_data)
+
+        print(f"Streaming audio with SoundFile: {file_path} "
+              f"({decoder.frames} frames, {decoder.channels} ch, "
+              f"{decoder.source_rate} -> {sample_rate} Hz)")
+        blocks = iter(decoder)
+        if self.decoded_cache is not None:
+            blocks = self.decoded_cache.tee(
+                file_path, sample_rate, duration, decoder.num_samples, blocks
+            )
+        return timed(blocks), sample_rate, decoder.num_samples
+
+    def load_audio(self, file_path, duration=Config.MAX_RENDER_DURATION):
         """
         Loads an audio file.
 
         Args:
             file_path (str): Path to the audio file to load.
-            duration (int): Max duration in seconds to load (default 60s).
+            duration (int): Max duration in seconds to load
+                (default ``Config.MAX_RENDER_DURATION``).
 
         Returns:
             tuple: (audio_data (np.ndarray), sample_rate (int))
@@ -71,62 +123,219 @@ class AudioProcessor:
             IOError: If loading fails.
         """
         try:
-            print(f"Loading audio with SoundFile: {file_path}")
-            # Use SoundFile instead of Librosa for lighter memory footprint
-            audio_data, sample_rate = sf.read(file_path)
-            
-            # Limit duration
-            max_samples = int(duration * sample_rate)
-            if len(audio_data) > max_samples:
-                print(f"Truncating audio from {len(audio_data)} to {max_samples} samples")
-                audio_data = audio_data[:max_samples]
-            
-            # Convert to mono if stereo
-            if audio_data.ndim > 1:
-                print("Converting stereo to mono")
-                audio_data = np.mean(audio_data, axis=1)
-
-            # DOWNSAMPLE TO SAVE MEMORY (Crucial for Librosa effects)
-            # Free tier has 512MB RAM. Hi-Res audio (48k) creates massive STFT matrices.
-            # Downsampling to 22050Hz reduces memory by >50%.
-            TARGET_SR = 22050
-            if sample_rate > TARGET_SR:
-                print(f"Downsampling from {sample_rate} to {TARGET_SR} Hz...")
-                new_num_samples = int(len(audio_data) * TARGET_SR / sample_rate)
-                audio_data = scipy.signal.resample(audio_data, new_num_samples)
-                sample_rate = TARGET_SR
-                
-            audio_data = audio_data.astype(np.float32)
-            
-            gc.collect() # Force cleanup
+            blocks, sample_rate, num_samples = self.stream_audio(file_path, duration)
+            audio_data = np.zeros(num_samples, dtype=np.float32)
+            position = 0
+            for block in blocks:
+                n = min(len(block), num_samples - position)
+                audio_data[position:position + n] = block[:n]
+                position += n
+            audio_data = audio_data[:position]
+
             print(f"Audio loaded successfully. Shape: {audio_data.shape}, SR: {sample_rate}")
             return audio_data, sample_rate
         except Exception as e:
             print(f"Error loading audio: {e}")
             raise IOError(f'Error loading audio: {str(e)}') from e
 
-    def save_audio(self, audio_data, sample_rate, output_path):
+    def analyze(self, file_path, n_fft=None, hop_length=None, window='hann',
+                duration=Config.MAX_RENDER_DURATION):
         """
-        Saves an audio file.
+        Returns the STFT analysis of an audio file, from the analysis cache
+        when possible.
+
+        Args:
+            file_path (str): Path to the audio file.
+            n_fft (int): Frame size (default ``Config.STFT_N_FFT``).
+            hop_length (int): Hop size (default ``Config.STFT_HOP_LENGTH``).
+            window (str): Window name.
+            duration (int): Max duration in seconds to analyze
+                (default ``Config.MAX_RENDER_DURATION``).
+
+        Returns:
+            tuple: (analysis (STFTAnalysis), sample_rate (int))
+
+        Raises:
+            IOError: If the file cannot be opened.
+        """
+        n_fft = n_fft or Config.STFT_N_FFT
+        hop_length = hop_length or Config.STFT_HOP_LENGTH
+        blocks, sample_rate, num_samples = self.stream_audio(file_path, duration)
+
+        if self.analysis_cache is None:
+            return STFTAnalyzer(n_fft, hop_length, window).analyze(blocks), sample_rate
+
+        settings = (n_fft, hop_length, window)
+        analysis = self.analysis_cache.load(
+            file_path, sample_rate, duration, num_samples, *settings
+        )
+        if analysis is not None:
+            print(f"Mapped STFT analysis {settings}. Frames: {analysis.num_frames}")
+            return analysis, sample_rate
+
+        print(f"Computing STFT analysis {settings}")
+        analysis = self.analysis_cache.compute(
+            file_path, sample_rate, duration, num_samples, blocks, *settings
+        )
+        return analysis, sample_rate
+
+    def peak_envelope(self, file_path, duration=Config.MAX_RENDER_DURATION):
+        """
+        Builds the waveform envelope of an audio file in one streaming pass.
+
+        Args:
+            file_path (str): Path to the audio file.
+            duration (int): Max duration in seconds to read
+                (default ``Config.MAX_RENDER_DURATION``).
+
+        Returns:
+            PeakEnvelope: min / max / RMS envelope of the decoded signal.
+
+        Raises:
+            IOError: If the file cannot be opened.
+        """
+        blocks, sample_rate, _ = self.stream_audio(file_path, duration)
+        return PeakBuilder(sample_rate).build(blocks)
+
+    def spectrogram(self, file_path, scale='linear', duration=Config.MAX_RENDER_DURATION):
+        """
+        Builds the spectrogram image of an audio file from its STFT
+        analysis, shared with the spectral effects through the analysis
+        cache.
+
+        Args:
+            file_path (str): Path to the audio file.
+            scale (str): Frequency scale, 'linear' or 'mel'.
+            duration (int): Max duration in seconds to analyze
+                (default ``Config.MAX_RENDER_DURATION``).
+
+        Returns:
+            Spectrogram: Multi-resolution spectrogram of the decoded signal.
+
+        Raises:
+            IOError: If the file cannot be opened.
+            ValueError: If the scale is unknown.
+        """
+        analysis, sample_rate = self.analyze(file_path, duration=duration)
+        return SpectrogramBuilder(sample_rate, scale=scale).build_from_analysis(analysis)
+
+    def save_audio(self, audio_data, sample_rate, output_path, output_format='wav',
+                   bit_depth=None):
+        """
+        Saves an audio file, encoding it chunk by chunk.
 
         Args:
             audio_data (np.ndarray): Audio data to save.
             sample_rate (int): Sampling rate.
             output_path (str): Path to the output file.
+            output_format (str): 'wav', 'flac' or 'opus'.
+            bit_depth (int): Bit depth of lossless formats (default 16).
 
         Returns:
             bool: True if save is successful.
 
         Raises:
+            ValueError: If the format or bit depth is not supported.
             IOError: If saving fails.
         """
+        block_size = int(Config.CHUNK_DURATION * sample_rate)
+        blocks = (audio_data[start:start + block_size]
+                  for start in range(0, len(audio_data), block_size))
         try:
-            sf.write(output_path, audio_data, sample_rate)
+            self.write_blocks(blocks, sample_rate, output_path, output_format, bit_depth)
             return True
+        except ValueError:
+            raise
         except Exception as e:
             raise IOError(f'Error saving audio: {str(e)}') from e
 
-    def process_audio(self, input_path, effect_name, parameters):
+    def estimate_memory(self, chain, duration, sample_rate,
+                        max_duration=Config.MAX_RENDER_DURATION, threads=1):
+        """
+        Estimates the peak memory of rendering a chain, for admission
+        control.
+
+        Counts the decoded signal and the STFT analysis (both memory-mapped
+        and read whole), the chunk engine's block buffers and each effect's
+        own working set, on top of ``Config.JOB_BASE_MEMORY``. An effect
+        rendered in parallel holds one working set per segment in flight.
+
+        Args:
+            chain (list[tuple]): ``(effect_name, parameters)`` pairs.
+            duration (float): Duration of the input in seconds.
+            sample_rate (int): Sample rate of the input.
+            max_duration (int): Duration limit of the decoder
+                (default ``Config.MAX_RENDER_DURATION``).
+            threads (int): Threads of the render (see ``render_chain``).
+
+        Returns:
+            int: Bytes.
+        """
+        sample_rate = min(int(sample_rate), Config.TARGET_SAMPLE_RATE)
+        num_samples = int(min(duration, max_duration) * sample_rate)
+        block_size = int(Config.CHUNK_DURATION * sample_rate)
+        total = Config.JOB_BASE_MEMORY + num_samples * 4
+
+        def segments_in_flight(effect, parameters):
+            try:
+                if threads > 1 and effect.segment_context(**parameters) is not None:
+                    return threads + 1
+            except (TypeError, ValueError):
+                pass
+            return 1
+
+        first_effect, first_parameters = self.effects[chain[0][0]], chain[0][1]
+        settings = first_effect.analysis_settings(**first_parameters)
+        if settings is not None and segments_in_flight(first_effect, first_parameters) == 1:
+            total += self._analysis_memory(num_samples, settings)
+
+        for effect_name, parameters in chain:
+            effect = self.effects[effect_name]
+            try:
+                total += segments_in_flight(effect, parameters) * (
+                    Config.ENGINE_BLOCK_BUFFERS * block_size * 4
+                    + effect.estimate_memory(block_size, sample_rate, **parameters)
+                )
+                # The next effect receives blocks of the stretched length
+                block_size = int(block_size * effect.length_ratio(**parameters))
+            except (TypeError, ValueError, ZeroDivisionError):
+                # Invalid parameters fail in the render itself
+                pass
+        return total
+
+    def estimate_prepare_memory(self, duration, sample_rate, analysis_settings=(),
+                                max_duration=Config.MAX_RENDER_DURATION):
+        """
+        Estimates the peak memory of decoding an upload and computing its
+        STFT analyses (see ``jobs.prepare_input``), for admission control.
+
+        Args:
+            duration (float): Duration of the input in seconds.
+            sample_rate (int): Sample rate of the input.
+            analysis_settings (iterable[tuple]): ``(n_fft, hop_length, window)``
+                analyses to compute, one at a time.
+            max_duration (int): Duration limit of the decoder
+                (default ``Config.MAX_RENDER_DURATION``).
+
+        Returns:
+            int: Bytes.
+        """
+        sample_rate = min(int(sample_rate), Config.TARGET_SAMPLE_RATE)
+        num_samples = int(min(duration, max_duration) * sample_rate)
+        analyses = [self._analysis_memory(num_samples, settings)
+                    for settings in analysis_settings]
+        return Config.JOB_BASE_MEMORY + num_samples * 4 + max(analyses, default=0)
+
+    @staticmethod
+    def _analysis_memory(num_samples, settings):
+        """
+        Bytes of the STFT analysis ``settings`` of ``num_samples`` samples.
+        """
+        n_fft, hop_length = settings[0], settings[1]
+        itemsize = np.dtype(Config.ANALYSIS_DTYPE).itemsize
+        return 2 * (1 + num_samples // hop_length) * (n_fft // 2 + 1) * itemsize
+
+    def process_audio(self, input_path, effect_name, parameters, progress_callback=None):
         """
         Applies an audio effect on a file.
 
@@ -134,6 +343,9 @@ class AudioProcessor:
             input_path (str): Path to the audio file to process.
             effect_name (str): Name of the effect to apply.
             parameters (dict): Parameters of the effect.
+            progress_callback (callable): Optional ``callback(done, total)``
+                called with the number of chunks processed. It may raise to
+                abort the render.
 
         Returns:
             tuple: (processed_audio (np.ndarray), sample_rate (int))
@@ -141,47 +353,245 @@ class AudioProcessor:
         Raises:
             ValueError: If the requested effect does not exist.
         """
-        if effect_name not in self.effects:
-            raise ValueError(f'Effect {effect_name} not available')
+        return self.process_chain(input_path, [(effect_name, parameters)], progress_callback)
+
+    def process_chain(self, input_path, chain, progress_callback=None, threads=None,
+                      timer=None):
+        """
+        Applies an ordered chain of effects on a file and returns the whole
+        render in memory (see ``render_chain`` and ``write_blocks`` for
+        streamed output).
+
+        Args:
+            input_path (str): Path to the audio file to process.
+            chain (list[tuple]): ``(effect_name, parameters)`` pairs, applied
+                in order.
+            progress_callback (callable): Optional ``callback(done, total)``
+                called with the number of chunks processed. It may raise to
+                abort the render.
+            threads (int): Threads of the render (see ``render_chain``).
+            timer (StageTimer): Optional timer of the render stages
+                (see ``render_chain``) and of 'concatenate'.
+
+        Returns:
+            tuple: (processed_audio (np.ndarray), sample_rate (int))
+
+        Raises:
+            ValueError: If the chain is empty or an effect does not exist.
+        """
+        blocks, sample_rate, output_gain = self.render_chain(
+            input_path, chain, progress_callback, threads=threads, timer=timer
+        )
+        timer = timer if timer is not None else StageTimer()
+        # Rendered blocks live in reused buffers
+        processed_chunks = []
+        for block in blocks:
+            with timer.stage('concatenate'):
+                processed_chunks.append(block.copy())
+
+        if not processed_chunks:
+            return np.array([]), sample_rate
+
+        with timer.stage('concatenate'):
+            final_audio = np.concatenate(processed_chunks)
+            gain = output_gain() if output_gain is not None else 1.0
+            if gain != 1.0:
+                final_audio *= gain
+        return final_audio, sample_rate
+
+    def render_chain(self, input_path, chain, progress_callback=None, threads=None,
+                     timer=None):
+        """
+        Applies an ordered chain of effects on a file in a single pass,
+        yielding the output block by block.
+
+        The file is decoded once and every block flows through all the
+        effects before the next block is read; no intermediate file or
+        full-length intermediate signal is created. With several threads,
+        effects that support it render overlapping segments in parallel
+        (see ``ChunkEngine``); the others stay sequential.
+
+        Args:
+            input_path (str): Path to the audio file to process.
+            chain (list[tuple]): ``(effect_name, parameters)`` pairs, applied
+                in order.
+            progress_callback (callable): Optional ``callback(done, total)``
+                called with the number of chunks processed. It may raise to
+                abort the render.
+            threads (int): Threads rendering segments in parallel (default
+                ``Config.RENDER_THREADS``; 1 renders sequentially).
+            timer (StageTimer): Optional timer of the 'analysis', 'decode',
+                'resample' and per-effect stages (the last three are charged
+                as the blocks are consumed).
+
+        Returns:
+            tuple: (blocks (generator of np.ndarray), sample_rate (int),
+            output_gain (callable or None)). Blocks are float32 views of
+            buffers reused for the whole render: each one is only valid
+            until the next is requested. ``output_gain`` is None unless
+            an effect normalizes its output; once the blocks are exhausted,
+            ``output_gain()`` returns the factor to apply to the whole
+            render (below 1.0 when it exceeds full scale).
+
+        Raises:
+            ValueError: If the chain is empty or an effect does not exist.
+            IOError: If the file cannot be opened.
+        """
+        if not chain:
+            raise ValueError('No effect to apply')
+        for effect_name, _ in chain:
+            if effect_name not in self.effects:
+                raise ValueError(f'Effect {effect_name} not available')
+
+        # The first effect sees the decoded upload itself, so a spectral
+        # effect can read its STFT from the shared analysis cache.
+        first_effect, first_parameters = self.effects[chain[0][0]], chain[0][1]
+        settings = first_effect.analysis_settings(**first_parameters)
+        threads = max(1, int(threads or Config.RENDER_THREADS))
+        if threads > 1 and first_effect.segment_context(**first_parameters) is not None:
+            # Parallel segments are rendered from the samples, not the analysis
+            settings = None
 
-        audio_data, sample_rate = self.load_audio(input_path)
-        effect = self.effects[effect_name]
+        # Decoding is streamed too: blocks go straight from the file into the
+        # chunk engine, so memory no longer depends on the input length.
+        timer = timer if timer is not None else StageTimer()
+        try:
+            analysis = None
+            if settings is not None and self.analysis_cache is not None:
+                with timer.stage('analysis'):
+                    analysis, _ = self.analyze(input_path, *settings)
+            source, sample_rate, total_samples = self.stream_audio(input_path, timer=timer)
+        except Exception as e:
+            raise IOError(f'Error loading audio: {str(e)}') from e
         
         # CHUNK PROCESSING TO PREVENT OOM
         # 512MB RAM is very tight.
-        # We chunk into 5s segments.
-        CHUNK_DURATION = 5 
-        chunk_size = CHUNK_DURATION * sample_rate
-        total_samples = len(audio_data)
-        
-        processed_chunks = []
+        # The chunk engine streams Config.CHUNK_DURATION blocks through the
+        # effect, carrying state / overlapping windows across block seams.
+        # Output buffers come from one arena and are reused for every block,
+        # so memory stays flat without forcing garbage collections.
+        # FFTs and filters release the GIL, so segments run on threads.
+        arena = BufferArena()
+        executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        engines = [
+            ChunkEngine(self.effects[effect_name], sample_rate, parameters,
+                        analysis=analysis if i == 0 else None, arena=arena,
+                        executor=executor, workers=threads)
+            for i, (effect_name, parameters) in enumerate(chain)
+        ]
+        chunk_size = engines[0].block_size
+        total_chunks = -(-total_samples // chunk_size)
         
         print(f"Starting processing. Total samples: {total_samples}. Chunk size: {chunk_size}")
-        
-        # Process in chunks
-        for i in range(0, total_samples, chunk_size):
-            # Log memory
-            mem_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
-            print(f"Processing chunk {i}/{total_samples}. Mem: {mem_usage:.2f} MB")
-            
-            chunk = audio_data[i:i + chunk_size]
-            
+
+        def blocks():
+            position = 0
+            for n, block in enumerate(source):
+                if progress_callback is not None:
+                    progress_callback(min(n, total_chunks), total_chunks)
+                # Log memory
+                mem_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                print(f"Processing chunk {position}/{total_samples}. Mem: {mem_usage:.2f} MB")
+                position += len(block)
+                yield block
+
+        def render():
+            # Each engine consumes the block stream of the previous one
+            stream = blocks()
+            for (effect_name, _), engine in zip(chain, engines):
+                stream = timer.iterate(effect_stage(effect_name), engine.process(stream))
             try:
-                processed_chunk = effect.apply(chunk, sample_rate, **parameters)
-                processed_chunks.append(processed_chunk)
+                yield from stream
             except Exception as e:
-                print(f"Error processing chunk {i}: {e}")
+                print(f"Error processing chunks: {e}")
                 raise e
             finally:
-                # Force cleanup after every chunk
-                del chunk
-                if 'processed_chunk' in locals():
-                    del processed_chunk
-                gc.collect()
-        
-        # Concatenate results
-        if not processed_chunks:
-            return np.array([]), sample_rate
-            
-        final_audio = np.concatenate(processed_chunks)
-        return final_audio, sample_rate
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+            if progress_callback is not None:
+                progress_callback(total_chunks, total_chunks)
+
+        # Effects such as echo normalize the full render, not each chunk.
+        # In a chain this is applied once, to the final output.
+        if not any(engine.effect.normalize_output for engine in engines):
+            return render(), sample_rate, None
+
+        def output_gain():
+            peak = engines[-1].peak
+            return 1.0 / peak if peak > 1.0 else 1.0
+
+        return render(), sample_rate, output_gain
+
+    def write_blocks(self, blocks, sample_rate, output_path, output_format='wav',
+                     bit_depth=None, output_gain=None, observers=(), timer=None):
+        """
+        Encodes a stream of rendered blocks into a file.
+
+        Blocks are encoded as soon as they arrive, so the file grows while
+        the render runs and can be streamed to a client. When an output
+        gain is pending (normalizing chains), the render is first spooled
+        as float32 next to ``output_path`` and encoded in a second pass,
+        once the gain is known.
+
+        Args:
+            blocks (iterable[np.ndarray]): Rendered blocks (e.g. from
+                ``render_chain``).
+            sample_rate (int): Sample rate of the blocks.
+            output_path (str): Encoded file to write.
+            output_format (str): 'wav', 'flac' or 'opus'.
+            bit_depth (int): Bit depth of lossless formats (default 16).
+            output_gain (callable): Gain to apply once every block has been
+                rendered, as returned by ``render_chain``.
+            observers (iterable): Objects with a ``process(block)`` method
+                (e.g. ``PeakBuilder``) fed with every final output block.
+            timer (StageTimer): Optional timer of the 'encode' stage and,
+                for normalizing chains, of 'concatenate' (spooling the
+                whole render).
+
+        Returns:
+            int: Number of samples written (before any resampling of the
+            encoder).
+
+        Raises:
+            ValueError: If the format or bit depth is not supported.
+            IOError: If the file cannot be opened or written.
+        """
+        num_samples = 0
+        timer = timer if timer is not None else StageTimer()
+
+        def emit(encoder, block):
+            with timer.stage('encode'):
+                encoder.write(block)
+                for observer in observers:
+                    observer.process(block)
+
+        if output_gain is None:
+            with StreamingEncoder(output_path, sample_rate, output_format, bit_depth) as encoder:
+                for block in blocks:
+                    emit(encoder, block)
+                    num_samples += len(block)
+            return num_samples
+
+        # First pass: spool the render, second pass: scale and encode
+        spool_path = f"{output_path}.f32"
+        try:
+            with open(spool_path, 'wb') as spool:
+                for block in blocks:
+                    with timer.stage('concatenate'):
+                        np.asarray(block, dtype=np.float32).tofile(spool)
+                    num_samples += len(block)
+            gain = np.float32(output_gain())
+            block_size = int(Config.CHUNK_DURATION * sample_rate)
+            with StreamingEncoder(output_path, sample_rate, output_format, bit_depth) as encoder:
+                if num_samples:
+                    rendered = np.memmap(spool_path, dtype=np.float32, mode='r')
+                    scaled = np.empty(min(block_size, num_samples), dtype=np.float32)
+                    for start in range(0, num_samples, block_size):
+                        block = rendered[start:start + block_size]
+                        emit(encoder, np.multiply(block, gain, out=scaled[:len(block)]))
+                    del rendered
+        finally:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+        return num_samples
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Audio Vocoder backend.
+
+Run from the backend directory, e.g. ``python -m benchmarks.bench_resampler``.
+"""
@@ -0,0 +1,374 @@
+"""
+Effect benchmark suite.
+
+Renders synthetic speech-like signals (gliding harmonic stacks, noise
+bursts, chirps and pauses) at several sample rates and durations through:
+
+- ``effect``: each registered effect on its own, fed to a ``ChunkEngine``
+  in ``Config.CHUNK_DURATION`` blocks at the signal's own sample rate
+  (the signal is generated in memory before the render);
+- ``process_audio``: the full ``AudioProcessor.process_audio`` path, from
+  a 16-bit WAV file (decode, resampling to ``Config.TARGET_SAMPLE_RATE``,
+  the effect and the in-memory concatenation). ``process_audio`` reads at
+  most the first 60 seconds of a file, as uploads are rendered.
+
+Every case runs in a fresh process, after a one-second warm-up render, and
+reports the realtime factor (seconds of input audio rendered per second of
+wall time, from the fastest of ``--repeat`` renders, or more for cases
+shorter than ``MEASURE_DURATION``), the peak RSS growth, the minor page faults per second of audio
+(each fresh large allocation faults in new pages) and the largest amount
+of memory allocated within one block on top of what was held before it
+(traced over the first ``TRACE_DURATION`` seconds).
+
+Results are written as a JSON baseline with one entry per case, in a stable
+order, so that re-running the suite after a change shows regressions as a
+diff of the baseline; ``--compare`` prints the cases whose realtime factor
+dropped by more than ``--tolerance``.
+
+Usage:
+    python -m benchmarks.bench_effects [--effects robot pitch] [--rates 16000 48000]
+        [--durations 5 60] [--paths effect process_audio] [--repeat 1]
+        [--baseline benchmarks/baselines/effects.json] [--compare OLD.json]
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from config import Config
+from effects.registry import BUILTIN_EFFECTS
+
+SAMPLE_RATES = (16000, 22050, 44100, 48000)
+DURATIONS = (5, 30, 120, 600)
+PATHS = ('effect', 'process_audio')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'effects.json')
+
+# Seconds of audio rendered before measuring, and traced for allocations
+WARMUP_DURATION = 1
+TRACE_DURATION = 30
+# Short cases are rendered until this many seconds were measured (best
+# render kept), within MAX_RENDERS renders
+MEASURE_DURATION = 1.0
+MAX_RENDERS = 50
+# Seconds of signal generated at a time
+GENERATE_DURATION = 0.25
+
+# Speech-like pattern, repeated every 1.5 s: a voiced stretch with a gliding
+# pitch, a fricative-like noise burst, a short pause, then a rising chirp
+VOICED_END = 0.6
+NOISE_END = 0.9
+PAUSE_END = 1.0
+PATTERN_DURATION = 1.5
+HARMONICS = 12
+
+
+def speech_like(sample_rate, start, stop, seed=0):
+    """
+    Samples ``start`` to ``stop`` of a synthetic speech-like signal.
+
+    Blocks can be generated independently: the tonal parts are closed-form
+    functions of time, so consecutive blocks join without discontinuities.
+
+    Args:
+        sample_rate (int): Sample rate in Hz.
+        start (int): First sample.
+        stop (int): End sample (exclusive).
+        seed (int): Seed of the noise bursts.
+
+    Returns:
+        np.ndarray: Mono float32 samples in [-1, 1].
+    """
+    t = np.arange(start, stop) / sample_rate
+    position = t % PATTERN_DURATION
+    nyquist = sample_rate / 2
+
+    # Voiced: harmonic stack over f0 = 140 Hz +/- 40 Hz at 0.7 Hz, with a
+    # spectral tilt and a formant-like bump around 700 Hz
+    glide = 0.7
+    phase = 2 * np.pi * (140 * t - 40 / (2 * np.pi * glide) * np.cos(2 * np.pi * glide * t))
+    f0 = 140 + 40 * np.sin(2 * np.pi * glide * t)
+    voiced = np.zeros(len(t))
+    for k in range(1, HARMONICS + 1):
+        weight = (1 / k) * (1 + 2 * np.exp(-((k * f0 - 700) / 300) ** 2))
+        voiced += np.where(k * f0 < nyquist, weight, 0.0) * np.sin(k * phase)
+    voiced *= 0.15 * np.sin(np.pi * np.clip(position / VOICED_END, 0, 1))
+
+    # Noise burst
+    rng = np.random.default_rng([seed, start])
+    burst = (position >= VOICED_END) & (position < NOISE_END)
+    noise = np.where(burst, 0.1 * rng.standard_normal(len(t)), 0.0)
+
+    # Chirp from 200 Hz to 3 kHz (or Nyquist) over the end of the pattern
+    span = PATTERN_DURATION - PAUSE_END
+    top = min(3000.0, 0.9 * nyquist)
+    local = np.clip(position - PAUSE_END, 0, span)
+    chirp_phase = 2 * np.pi * (200 * local + (top - 200) / (2 * span) * local ** 2)
+    chirp = np.where(position >= PAUSE_END,
+                     0.2 * np.sin(np.pi * local / span) * np.sin(chirp_phase), 0.0)
+
+    return (voiced + noise + chirp).astype(np.float32)
+
+
+def write_signal(path, sample_rate, duration):
+    """
+    Write ``duration`` seconds of ``speech_like`` to a 16-bit WAV file,
+    block by block.
+    """
+    block = int(Config.CHUNK_DURATION * sample_rate)
+    length = int(duration * sample_rate)
+    with sf.SoundFile(path, 'w', sample_rate, 1, subtype='PCM_16') as f:
+        for i in range(0, length, block):
+            f.write(speech_like(sample_rate, i, min(i + block, length)))
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _effect_render(effect_name, sample_rate, duration):
+    """
+    Returns:
+        callable: ``render(observe=None)`` rendering ``duration`` seconds
+        through the effect, calling ``observe`` after every block, and
+        returning the seconds of input rendered.
+    """
+    from effects.registry import EffectRegistry
+    from pipeline import BufferArena, ChunkEngine
+
+    registry = EffectRegistry()
+    effect = registry[effect_name]
+    parameters = registry.validate(effect_name, {})
+    block = int(Config.CHUNK_DURATION * sample_rate)
+    # Generated up front so that only the effect is timed, in short pieces
+    # so that the temporaries do not raise the peak RSS above the render's
+    signal = np.empty(int(duration * sample_rate), dtype=np.float32)
+    piece = max(1, int(GENERATE_DURATION * sample_rate))
+    for i in range(0, len(signal), piece):
+        signal[i:i + piece] = speech_like(sample_rate, i, min(i + piece, len(signal)))
+    arena = BufferArena()
+
+    def render(observe=None):
+        engine = ChunkEngine(effect, sample_rate, parameters, arena=arena)
+        source = (signal[i:i + block] for i in range(0, len(signal), block))
+        for _ in engine.process(source):
+            if observe is not None:
+                observe()
+        return len(signal) / sample_rate
+
+    return render
+
+
+def _process_audio_render(effect_name, input_path):
+    """
+    Returns:
+        callable: ``render(observe=None)`` running ``process_audio`` on
+        ``input_path`` (``observe`` is called after every block) and
+        returning the seconds of input rendered.
+    """
+    from audio_processor import AudioProcessor
+
+    class Processor(AudioProcessor):
+        def stream_audio(self, *args, **kwargs):
+            blocks, sample_rate, num_samples = super().stream_audio(*args, **kwargs)
+            self.input_seconds = num_samples / sample_rate
+            if self.observe is None:
+                return blocks, sample_rate, num_samples
+            return self._observed(blocks), sample_rate, num_samples
+
+        def _observed(self, blocks):
+            for block in blocks:
+                yield block
+                self.observe()
+
+    processor = Processor()
+    parameters = processor.effects.validate(effect_name, {})
+
+    def render(observe=None):
+        processor.observe = observe
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            processor.process_audio(input_path, effect_name, parameters)
+        return processor.input_seconds
+
+    return render
+
+
+def _run_case(path, effect_name, sample_rate, duration, files, repeat, queue):
+    """
+    Render one case (after a warm-up render) and report its timing and
+    memory.
+    """
+    def renderer(seconds):
+        if path == 'effect':
+            return _effect_render(effect_name, sample_rate, seconds)
+        return _process_audio_render(effect_name, files[seconds])
+
+    renderer(WARMUP_DURATION)()
+    render = renderer(duration)
+
+    baseline = _peak_rss_mb()
+    best = None
+    renders = 0
+    measured = 0.0
+    while renders < repeat or (measured < MEASURE_DURATION and renders < MAX_RENDERS):
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        start = time.perf_counter()
+        rendered = render()
+        elapsed = time.perf_counter() - start
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+        renders += 1
+        measured += elapsed
+        if best is None or elapsed < best[0]:
+            best = (elapsed, faults)
+    peak_rss = _peak_rss_mb() - baseline
+
+    # Memory allocated within each block on top of what was held before it
+    traced = renderer(min(duration, TRACE_DURATION))
+    peaks = []
+    held = 0
+
+    def observe():
+        nonlocal held
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - held)
+        held = current
+        tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    traced(observe)
+    tracemalloc.stop()
+    # The first block sizes the reused buffers
+    peaks = peaks[1:] or peaks
+
+    elapsed, faults = best
+    queue.put({
+        'path': path,
+        'effect': effect_name,
+        'sample_rate': sample_rate,
+        'duration': duration,
+        'audio_seconds': round(rendered, 3),
+        'seconds': round(elapsed, 4),
+        'renders': renders,
+        'realtime_factor': round(rendered / elapsed, 1),
+        'peak_rss_mb': round(peak_rss, 1),
+        'page_faults_per_audio_second': round(faults / rendered),
+        'block_transient_mb': round(max(peaks) / (1024 * 1024), 2) if peaks else 0.0,
+    })
+
+
+def _case_key(result):
+    return result['path'], result['effect'], result['sample_rate'], result['duration']
+
+
+def _machine():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(terse=True),
+        'processor': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, previous, tolerance):
+    """
+    Print the cases whose realtime factor dropped by more than
+    ``tolerance`` (a fraction) compared to a previous baseline.
+
+    Returns:
+        int: Number of regressions.
+    """
+    before = {_case_key(result): result for result in previous['results']}
+    regressions = 0
+    for result in results:
+        old = before.get(_case_key(result))
+        if old is None:
+            continue
+        change = result['realtime_factor'] / old['realtime_factor'] - 1
+        if change < -tolerance:
+            regressions += 1
+            print(f"REGRESSION {result['path']:<13} {result['effect']:<6} "
+                  f"{result['sample_rate']:>5} Hz {result['duration']:>4} s  "
+                  f"x{old['realtime_factor']} -> x{result['realtime_factor']} "
+                  f"({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--effects', nargs='+', choices=sorted(BUILTIN_EFFECTS),
+                        default=list(BUILTIN_EFFECTS))
+    parser.add_argument('--rates', nargs='+', type=int, default=list(SAMPLE_RATES),
+                        help='sample rates (Hz)')
+    parser.add_argument('--durations', nargs='+', type=int, default=list(DURATIONS),
+                        help='seconds of audio')
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=list(PATHS))
+    parser.add_argument('--repeat', type=int, default=1, help='least timed renders per case')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='write results to this file')
+    parser.add_argument('--compare', help='report regressions against this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='realtime factor drop reported as a regression')
+    args = parser.parse_args()
+
+    # Read the previous results first: --compare may be the file overwritten
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for sample_rate in args.rates:
+            files = {}
+            if 'process_audio' in args.paths:
+                for duration in (WARMUP_DURATION, *args.durations):
+                    files[duration] = os.path.join(directory, f'{sample_rate}_{duration}.wav')
+                    write_signal(files[duration], sample_rate, duration)
+            for duration in args.durations:
+                for path in args.paths:
+                    for effect_name in args.effects:
+                        queue = context.Queue()
+                        process = context.Process(
+                            target=_run_case,
+                            args=(path, effect_name, sample_rate, duration, files,
+                                  args.repeat, queue)
+                        )
+                        process.start()
+                        result = queue.get()
+                        process.join()
+                        results.append(result)
+                        print(f"{path:<13} {effect_name:<6} {sample_rate:>5} Hz "
+                              f"{duration:>5g} s  {result['seconds']:>8.4f} s  "
+                              f"x{result['realtime_factor']:<7} "
+                              f"RSS +{result['peak_rss_mb']} MB  "
+                              f"{result['page_faults_per_audio_second']} faults/s  "
+                              f"block transient {result['block_transient_mb']} MB",
+                              flush=True)
+            for file_path in files.values():
+                os.remove(file_path)
+
+    results.sort(key=_case_key)
+    if args.baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': _machine(), 'results': results}, f, indent=2)
+            f.write('\n')
+
+    if previous is not None and compare(results, previous, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
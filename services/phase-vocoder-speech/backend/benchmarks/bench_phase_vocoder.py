@@ -0,0 +1,180 @@
+"""
+Phase vocoder benchmark.
+
+Compares ``librosa.effects.time_stretch`` / ``pitch_shift`` with the native
+streaming phase vocoder used by the speed and pitch effects. The native
+engine is fed ``Config.CHUNK_DURATION`` blocks, as the chunk engine does.
+Every case runs in a fresh process so that its peak RSS is measured in
+isolation.
+
+The accuracy check then stretches the same signal with both engines
+(librosa in float64) at several rates and fails if the outputs differ by
+more than ``--tolerance``.
+
+Usage:
+    python -m benchmarks.bench_phase_vocoder [--duration 60] [--speed 1.5] [--steps 4]
+        [--tolerance 1e-4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+
+from config import Config
+
+# Stretch rates of the accuracy check
+ACCURACY_RATES = (0.5, 0.8, 1.25, 1.5, 2.0)
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _test_signal(start, stop, sample_rate, rng):
+    """
+    Harmonic tone plus noise, generated on the fly.
+    """
+    t = np.arange(start, stop) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.1 * np.sin(2 * np.pi * 660 * t)
+    return (tone + 0.02 * rng.standard_normal(stop - start)).astype(np.float32)
+
+
+def _run_case(engine, effect, value, duration, queue):
+    """
+    Render ``duration`` seconds of a test signal and report timing and memory.
+    """
+    import librosa
+    from effects.pitch_effect import PitchEffect
+    from effects.speed_effect import SpeedEffect
+
+    sample_rate = Config.TARGET_SAMPLE_RATE
+    block = int(Config.CHUNK_DURATION * sample_rate)
+    length = int(duration * sample_rate)
+    rng = np.random.default_rng(0)
+
+    def source(start, stop):
+        return _test_signal(start, stop, sample_rate, rng)
+
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    if engine == 'librosa':
+        signal = source(0, length)
+        if effect == 'speed':
+            out = librosa.effects.time_stretch(signal, rate=value)
+        else:
+            out = librosa.effects.pitch_shift(signal, sr=sample_rate, n_steps=value)
+        produced = len(out)
+    else:
+        if effect == 'speed':
+            fx, params = SpeedEffect(), {'speed_factor': value}
+        else:
+            fx, params = PitchEffect(), {'n_steps': value}
+        state = fx.init_state(sample_rate, **params)
+        produced = 0
+        for i in range(0, length, block):
+            produced += len(fx.process_block(
+                source(i, min(i + block, length)), sample_rate, state, **params
+            ))
+        produced += len(fx.flush(sample_rate, state, **params))
+    elapsed = time.perf_counter() - start
+
+    queue.put({
+        'engine': engine,
+        'effect': effect,
+        'value': value,
+        'duration': duration,
+        'samples_out': produced,
+        'seconds': round(elapsed, 4),
+        'realtime_factor': round(duration / elapsed, 1),
+        'peak_rss_delta_mb': round(_peak_rss_mb() - baseline, 1),
+    })
+
+
+def check_accuracy(duration, rates=ACCURACY_RATES):
+    """
+    Compare the native phase vocoder with ``librosa.effects.time_stretch``
+    on float64 input.
+
+    Args:
+        duration (float): Seconds of audio.
+        rates (iterable[float]): Stretch rates to compare.
+
+    Returns:
+        list[dict]: Max absolute and relative RMS difference per rate.
+    """
+    import librosa
+    from pipeline.phase_vocoder import PhaseVocoder
+
+    sample_rate = Config.TARGET_SAMPLE_RATE
+    block = int(Config.CHUNK_DURATION * sample_rate)
+    length = int(duration * sample_rate)
+    signal = _test_signal(0, length, sample_rate, np.random.default_rng(0))
+
+    results = []
+    for rate in rates:
+        reference = librosa.effects.time_stretch(
+            signal.astype(np.float64), rate=rate,
+            n_fft=Config.STFT_N_FFT, hop_length=Config.STFT_HOP_LENGTH
+        )
+        vocoder = PhaseVocoder(rate)
+        out = [vocoder.process(signal[i:i + block]) for i in range(0, length, block)]
+        out = np.concatenate(out + [vocoder.flush()])
+        if len(out) != len(reference):
+            raise ValueError(f'Rate {rate}: {len(out)} samples, librosa gives {len(reference)}')
+        diff = out - reference
+        results.append({
+            'rate': rate,
+            'max_abs_diff': float(np.max(np.abs(diff))),
+            'relative_rms_diff': float(np.sqrt(np.mean(diff ** 2) / np.mean(reference ** 2))),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of audio')
+    parser.add_argument('--speed', type=float, default=1.5, help='speed_factor')
+    parser.add_argument('--steps', type=float, default=4.0, help='n_steps')
+    parser.add_argument('--tolerance', type=float, default=1e-4,
+                        help='largest accepted difference from librosa')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for effect, value in [('speed', args.speed), ('pitch', args.steps)]:
+        for engine in ['librosa', 'native']:
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_case, args=(engine, effect, value, args.duration, queue)
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append(result)
+            print(f"{effect:<6} {engine:<8} {result['seconds']:>8.3f} s  "
+                  f"x{result['realtime_factor']:<8} RSS +{result['peak_rss_delta_mb']} MB")
+
+    accuracy = check_accuracy(args.duration)
+    failed = False
+    for result in accuracy:
+        worst = max(result['max_abs_diff'], result['relative_rms_diff'])
+        failed = failed or worst > args.tolerance
+        print(f"accuracy rate {result['rate']:<5} max |diff| {result['max_abs_diff']:.2e}  "
+              f"relative RMS {result['relative_rms_diff']:.2e}"
+              f"{'  FAIL' if worst > args.tolerance else ''}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cases': results, 'accuracy': accuracy}, f, indent=2)
+    if failed:
+        sys.exit(f'Phase vocoder differs from librosa by more than {args.tolerance}')
+
+
+if __name__ == '__main__':
+    main()
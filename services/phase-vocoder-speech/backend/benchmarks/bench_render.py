@@ -0,0 +1,145 @@
+"""
+Render loop benchmark.
+
+Renders a test file through ``AudioProcessor.render_chain`` for each effect,
+the way a job does, and reports per second of audio: wall time and minor
+page faults (each fresh large array faults in new pages), plus the largest
+amount of memory allocated within one chunk on top of what was held before
+it (steady state: the first chunk, which sizes the reused buffers, is left
+out). Every case runs in a fresh process; ``--threads`` renders segments in
+parallel (compare with ``--threads 1`` for the speedup).
+
+Usage:
+    python -m benchmarks.bench_render [--duration 60] [--effects robot echo pitch speed]
+        [--repeat 3] [--threads 1] [--json results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from config import Config
+
+CASES = {
+    'robot': {},
+    'echo': {'delay': 0.2, 'decay': 0.5},
+    'pitch': {'n_steps': 4.0},
+    'speed': {'speed_factor': 1.5},
+}
+
+
+def _write_signal(path, duration):
+    """
+    Write a harmonic tone plus noise at ``Config.TARGET_SAMPLE_RATE``.
+    """
+    sample_rate = Config.TARGET_SAMPLE_RATE
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    rng = np.random.default_rng(0)
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.1 * np.sin(2 * np.pi * 660 * t)
+    sf.write(path, (signal + 0.02 * rng.standard_normal(len(t))).astype(np.float32),
+             sample_rate)
+
+
+def _run_case(effect, input_path, duration, repeat, threads, queue):
+    """
+    Render ``input_path`` ``repeat`` times (after a warm-up render) and
+    report the best wall time, the page faults of that render and the
+    transient memory peak of one traced render.
+    """
+    from audio_processor import AudioProcessor
+
+    processor = AudioProcessor()
+    chain = [(effect, CASES[effect])]
+
+    def render(observe=None):
+        blocks, _, _ = processor.render_chain(input_path, chain, threads=threads)
+        samples = 0
+        for block in blocks:
+            samples += len(block)
+            if observe is not None:
+                observe()
+        return samples
+
+    render()
+    best = None
+    for _ in range(repeat):
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        start = time.perf_counter()
+        render()
+        elapsed = time.perf_counter() - start
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+        if best is None or elapsed < best[0]:
+            best = (elapsed, faults)
+
+    # Memory allocated within each chunk on top of what was held before it
+    peaks = []
+    held = 0
+
+    def observe():
+        nonlocal held
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - held)
+        held = current
+        tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    render(observe)
+    tracemalloc.stop()
+    peaks = peaks[1:]
+
+    elapsed, faults = best
+    queue.put({
+        'effect': effect,
+        'duration': duration,
+        'threads': threads,
+        'seconds': round(elapsed, 4),
+        'ms_per_audio_second': round(1000 * elapsed / duration, 2),
+        'page_faults_per_audio_second': round(faults / duration, 1),
+        'chunk_transient_mb': round(max(peaks) / (1024 * 1024), 2) if peaks else 0.0,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of audio')
+    parser.add_argument('--effects', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3, help='timed renders per effect')
+    parser.add_argument('--threads', type=int, default=1, help='render threads')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, 'input.wav')
+        _write_signal(input_path, args.duration)
+        for effect in args.effects:
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_case,
+                args=(effect, input_path, args.duration, args.repeat, args.threads, queue)
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append(result)
+            print(f"{effect:<6} {result['seconds']:>8.3f} s  "
+                  f"{result['ms_per_audio_second']:>7.2f} ms/s  "
+                  f"{result['page_faults_per_audio_second']:>8.1f} faults/s  "
+                  f"chunk transient {result['chunk_transient_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Resampler benchmark.
+
+Compares the whole-signal FFT resampling previously used by ``load_audio``
+(``scipy.signal.resample``) with the streaming polyphase resampler at each
+quality preset. Every case runs in a fresh process so that its peak RSS is
+measured in isolation.
+
+Usage:
+    python -m benchmarks.bench_resampler [--duration 60] [--rates 44100 48000]
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+import scipy.signal
+
+from config import Config
+from pipeline.resampler import PolyphaseResampler, QUALITY_PRESETS
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(method, source_rate, duration, queue):
+    """
+    Resample ``duration`` seconds of noise and report timing and memory.
+    """
+    target_rate = Config.TARGET_SAMPLE_RATE
+    block = int(Config.CHUNK_DURATION * source_rate)
+    rng = np.random.default_rng(0)
+    baseline = _peak_rss_mb()
+
+    start = time.perf_counter()
+    if method == 'fft':
+        signal = rng.standard_normal(int(duration * source_rate)).astype(np.float32)
+        out = scipy.signal.resample(signal, int(len(signal) * target_rate / source_rate))
+        produced = len(out)
+    else:
+        resampler = PolyphaseResampler(source_rate, target_rate, quality=method)
+        produced = 0
+        for i in range(0, int(duration * source_rate), block):
+            # Blocks are generated on the fly, as the streaming decoder would
+            n = min(block, int(duration * source_rate) - i)
+            produced += len(resampler.process(rng.standard_normal(n).astype(np.float32)))
+        produced += len(resampler.flush())
+    elapsed = time.perf_counter() - start
+
+    queue.put({
+        'method': method,
+        'source_rate': source_rate,
+        'duration': duration,
+        'samples_out': produced,
+        'seconds': round(elapsed, 4),
+        'realtime_factor': round(duration / elapsed, 1),
+        'peak_rss_delta_mb': round(_peak_rss_mb() - baseline, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of audio')
+    parser.add_argument('--rates', type=int, nargs='+', default=[44100, 48000])
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for source_rate in args.rates:
+        for method in ['fft'] + list(QUALITY_PRESETS):
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_case, args=(method, source_rate, args.duration, queue)
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append(result)
+            print(f"{source_rate:>6} Hz  {method:<9} {result['seconds']:>8.3f} s  "
+                  f"x{result['realtime_factor']:<8} RSS +{result['peak_rss_delta_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
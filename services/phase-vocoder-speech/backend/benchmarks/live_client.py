@@ -0,0 +1,154 @@
+"""
+Live streaming test client.
+
+Replays a WAV file through the ``/ws/live`` WebSocket in real time, frame
+by frame, as a browser capturing a microphone would, and reports the
+end-to-end latency percentiles (time from sending a frame to receiving its
+processed frame). The processed stream can be written to a file.
+
+Usage:
+    python -m benchmarks.live_client input.wav [--url ws://localhost:8000/ws/live]
+        [--effect robot] [--params '{"n_steps": 4}'] [--frame-ms 20]
+        [--format f32] [--no-pace] [--output out.wav] [--json results.json]
+
+Without an input file a 10 s test tone is used.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+import soundfile as sf
+import websockets
+
+FORMATS = {'f32': np.dtype('<f4'), 's16': np.dtype('<i2')}
+
+
+def _load(path):
+    """
+    Mono float32 signal and sample rate of ``path`` (or of a test tone).
+    """
+    if path is None:
+        sample_rate = 48000
+        t = np.arange(10 * sample_rate) / sample_rate
+        return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), sample_rate
+    audio, sample_rate = sf.read(path, dtype='float32', always_2d=True)
+    return audio.mean(axis=1), sample_rate
+
+
+def _encode(samples, dtype):
+    if dtype.kind == 'i':
+        samples = np.clip(samples * 32768.0, -32768, 32767)
+    return samples.astype(dtype).tobytes()
+
+
+def _decode(payload, dtype):
+    samples = np.frombuffer(payload, dtype=dtype).astype(np.float32)
+    return samples / 32768.0 if dtype.kind == 'i' else samples
+
+
+async def replay(url, audio, sample_rate, effect, params, frame_ms, sample_format, pace):
+    """
+    Stream ``audio`` through the socket.
+
+    Returns:
+        tuple: (latencies in ms (np.ndarray), processed audio, server summary)
+    """
+    dtype = FORMATS[sample_format]
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    sent = deque()
+    latencies = []
+    output = []
+    summary = {}
+
+    async with websockets.connect(url, max_size=None) as socket:
+        await socket.send(json.dumps({
+            'effect': effect, 'params': params,
+            'sample_rate': sample_rate, 'format': sample_format,
+        }))
+        reply = json.loads(await socket.recv())
+        if reply.get('type') != 'ready':
+            raise RuntimeError(f"Server refused the session: {reply.get('detail')}")
+
+        async def sender():
+            start = time.perf_counter()
+            for n, i in enumerate(range(0, len(audio), frame)):
+                if pace:
+                    # Frames are sent when a live source would have captured them
+                    delay = start + n * frame / sample_rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                sent.append(time.perf_counter())
+                await socket.send(_encode(audio[i:i + frame], dtype))
+            await socket.send(json.dumps({'type': 'end'}))
+
+        async def receiver():
+            nonlocal summary
+            async for message in socket:
+                if isinstance(message, bytes):
+                    if sent:
+                        latencies.append((time.perf_counter() - sent.popleft()) * 1000.0)
+                    output.append(_decode(message, dtype))
+                else:
+                    reply = json.loads(message)
+                    if reply.get('type') == 'summary':
+                        summary = reply
+                    elif reply.get('type') == 'error':
+                        raise RuntimeError(reply.get('detail'))
+
+        await asyncio.gather(sender(), receiver())
+
+    processed = np.concatenate(output) if output else np.zeros(0, dtype=np.float32)
+    return np.array(latencies), processed, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', nargs='?', help='WAV file to replay')
+    parser.add_argument('--url', default='ws://localhost:8000/ws/live')
+    parser.add_argument('--effect', default='robot')
+    parser.add_argument('--params', default='{}', help='effect parameters (JSON)')
+    parser.add_argument('--frame-ms', type=float, default=20.0, help='frame duration')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='f32')
+    parser.add_argument('--no-pace', action='store_true',
+                        help='send frames as fast as possible instead of in real time')
+    parser.add_argument('--output', help='write the processed stream to this file')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    audio, sample_rate = _load(args.input)
+    latencies, processed, summary = asyncio.run(replay(
+        args.url, audio, sample_rate, args.effect, json.loads(args.params),
+        args.frame_ms, args.format, not args.no_pace,
+    ))
+
+    if not len(latencies):
+        raise SystemExit('No frame was processed')
+
+    results = {
+        'effect': args.effect,
+        'frame_ms': args.frame_ms,
+        'frames': len(latencies),
+        'latency_ms': {
+            f'p{p}': round(float(np.percentile(latencies, p)), 2) for p in (50, 95, 99)
+        },
+        'max_latency_ms': round(float(latencies.max()), 2),
+        'server_processing_ms': summary.get('processing_ms', {}),
+    }
+    print(f"{results['frames']} frames of {args.frame_ms:g} ms through '{args.effect}'")
+    print("latency  " + "  ".join(f"{k} {v:.2f} ms" for k, v in results['latency_ms'].items())
+          + f"  max {results['max_latency_ms']:.2f} ms")
+    print(f"server processing {results['server_processing_ms']}")
+
+    if args.output:
+        sf.write(args.output, processed, sample_rate)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+HTTP load test.
+
+Simulates concurrent users of the web frontend: each virtual user runs the
+frontend's flow in a loop, on its own keep-alive connection:
+
+1. ``GET /effects``
+2. ``POST /upload`` (multipart, a speech-like WAV from the file mix)
+3. ``GET /audio/uploaded/<file>`` (the player loads the upload)
+4. ``POST /process-json`` (an effect from ``--effects``, default parameters)
+5. ``GET /audio/processed/<file>`` (the player loads the result)
+
+and reports, per endpoint, the p50 / p95 / p99 latency, the throughput and
+the error rate (non-2xx responses, by status, and failed connections).
+
+Every upload is made unique (two samples differ), so renders are not
+served from the result cache unless ``--repeat-files`` is given.
+
+The server is either an instance already running at ``--url``, or one
+started by this script with ``--serve uvicorn`` / ``--serve gunicorn``
+(gunicorn runs uvicorn workers, as in ``render.yaml``) in a temporary
+directory. Raising ``--concurrency`` until the process-json p95 grows or
+503s appear shows how many users a ``--render-workers`` (VOCODER_WORKERS)
+setting sustains; the process-json p99 must stay well under the gunicorn
+``--timeout`` of ``render.yaml``.
+
+Usage:
+    python -m benchmarks.load_test [--url http://127.0.0.1:8000]
+        [--serve gunicorn] [--server-workers 1] [--render-workers 1] [--timeout 120]
+        [--concurrency 4] [--sessions 20 | --duration 60]
+        [--mix 10@44100:3 60@44100:1] [--effects robot pitch speed echo]
+        [--repeat-files] [--json results.json]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmarks.bench_effects import write_signal
+from effects.registry import BUILTIN_EFFECTS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ('effects', 'upload', 'audio_uploaded', 'process_json', 'audio_processed')
+PERCENTILES = (50, 95, 99)
+DEFAULT_MIX = ('10@44100:3', '60@44100:1')
+# Seconds to wait for a started server to answer
+STARTUP_TIMEOUT = 60
+
+
+def parse_mix(entries):
+    """
+    Parse file mix entries.
+
+    Args:
+        entries (list[str]): ``DURATION[@RATE][:WEIGHT]`` entries, e.g.
+            ``30@48000:2`` (rate defaults to 44100 Hz, weight to 1).
+
+    Returns:
+        list[tuple]: ``(duration, sample_rate, weight)``.
+
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    mix = []
+    for entry in entries:
+        try:
+            spec, _, weight = entry.partition(':')
+            duration, _, sample_rate = spec.partition('@')
+            mix.append((float(duration), int(sample_rate or 44100), float(weight or 1)))
+        except ValueError:
+            raise ValueError(f'Invalid file mix entry {entry!r} (DURATION[@RATE][:WEIGHT])')
+    return mix
+
+
+def _multipart(filename, content):
+    """
+    Returns:
+        tuple: (body (bytes), content type) of a form with one file field.
+    """
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: audio/wav\r\n\r\n').encode()
+    return head + content + f'\r\n--{boundary}--\r\n'.encode(), \
+        f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """
+    Latencies and outcomes of the requests, per endpoint (thread-safe).
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        """
+        Args:
+            endpoint (str): Endpoint name.
+            seconds (float): Latency (until the whole body is read).
+            status (int or str): HTTP status, or the exception name of a
+                failed request.
+        """
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed):
+        """
+        Args:
+            elapsed (float): Wall time of the test in seconds.
+
+        Returns:
+            dict: ``{endpoint: {requests, throughput, error_rate, errors,
+            p50_ms, p95_ms, p99_ms}}``.
+        """
+        report = {}
+        for endpoint in ENDPOINTS:
+            latencies = self.latencies.get(endpoint)
+            if not latencies:
+                continue
+            statuses = self.statuses[endpoint]
+            errors = {str(status): count for status, count in sorted(statuses.items(), key=str)
+                      if not (isinstance(status, int) and status < 400)}
+            entry = {
+                'requests': len(latencies),
+                'throughput': round(len(latencies) / elapsed, 3),
+                'error_rate': round(sum(errors.values()) / len(latencies), 4),
+                'errors': errors,
+            }
+            for q, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+                entry[f'p{q}_ms'] = round(1000 * value, 1)
+            report[endpoint] = entry
+        return report
+
+
+class VirtualUser:
+    """
+    One frontend user, with its own keep-alive connection.
+    """
+
+    def __init__(self, url, timeout, recorder):
+        """
+        Args:
+            url (str): Base URL of the API.
+            timeout (float): Socket timeout of a request in seconds.
+            recorder (Recorder): Where the requests are recorded.
+        """
+        parts = urlsplit(url)
+        connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                            else http.client.HTTPConnection)
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+
+    def request(self, endpoint, method, path, body=None, headers=None):
+        """
+        Send a request and record it.
+
+        Returns:
+            tuple: (status, body) or None if the request failed.
+        """
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers or {})
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # The connection is reopened on the next request
+            self.connection.close()
+            self.recorder.record(endpoint, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status)
+        return response.status, data
+
+    def session(self, filename, content, effect):
+        """
+        Run the frontend flow once.
+
+        Returns:
+            bool: True if every step succeeded.
+        """
+        if not self._ok(self.request('effects', 'GET', '/effects')):
+            return False
+
+        body, content_type = _multipart(filename, content)
+        response = self.request('upload', 'POST', '/upload', body, {'Content-Type': content_type})
+        if not self._ok(response):
+            return False
+        upload = json.loads(response[1])
+        if not self._ok(self.request('audio_uploaded', 'GET',
+                                     f"/audio/uploaded/{upload['filename']}")):
+            return False
+
+        payload = json.dumps({'file_id': upload['file_id'], 'effect': effect, 'params': {}})
+        response = self.request('process_json', 'POST', '/process-json', payload,
+                                {'Content-Type': 'application/json'})
+        if not self._ok(response):
+            return False
+        result = json.loads(response[1])
+        return self._ok(self.request('audio_processed', 'GET', result['url']))
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _ok(response):
+        return response is not None and response[0] < 400
+
+
+class FileMix:
+    """
+    Upload contents drawn from a weighted mix of test files.
+    """
+
+    def __init__(self, mix, directory, unique=True, seed=0):
+        """
+        Args:
+            mix (list[tuple]): ``(duration, sample_rate, weight)`` entries.
+            directory (str): Where the test files are written.
+            unique (bool): Make every drawn content unique.
+            seed (int): Seed of the draws.
+        """
+        self.files = []
+        self.weights = []
+        for duration, sample_rate, weight in mix:
+            path = os.path.join(directory, f'speech_{duration:g}s_{sample_rate}.wav')
+            write_signal(path, sample_rate, duration)
+            with open(path, 'rb') as f:
+                self.files.append((os.path.basename(path), f.read()))
+            self.weights.append(weight)
+        self.unique = unique
+        self._random = random.Random(seed)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        Returns:
+            tuple: (filename, content (bytes)).
+        """
+        with self._lock:
+            filename, content = self._random.choices(self.files, self.weights)[0]
+            self._count += 1
+            count = self._count
+        if self.unique:
+            # Overwrite the last two 16-bit samples with a counter
+            content = content[:-4] + count.to_bytes(4, 'little')
+        return filename, content
+
+
+def start_server(server, port, directory, server_workers, render_workers, timeout, log):
+    """
+    Start the API in ``directory`` (where its temp_audio is created).
+
+    Returns:
+        subprocess.Popen: The server process, answering requests.
+
+    Raises:
+        RuntimeError: If the server does not start.
+    """
+    address = f'127.0.0.1:{port}'
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', 'main:app',
+                   '--workers', str(server_workers),
+                   '--worker-class', 'uvicorn.workers.UvicornWorker',
+                   '--bind', address, '--timeout', str(timeout)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'main:app',
+                   '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(server_workers)]
+    environment = dict(os.environ, VOCODER_WORKERS=str(render_workers),
+                       PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR,
+                                                                os.environ.get('PYTHONPATH')])))
+    process = subprocess.Popen(command, cwd=directory, env=environment,
+                               stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{server} exited with status {process.returncode}')
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        try:
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+        finally:
+            connection.close()
+    process.terminate()
+    raise RuntimeError(f'{server} did not answer within {STARTUP_TIMEOUT} s')
+
+
+def run(url, mix, effects, concurrency, sessions, duration, timeout):
+    """
+    Run the virtual users until ``sessions`` flows were started or for
+    ``duration`` seconds.
+
+    Returns:
+        dict: Per-endpoint report (see ``Recorder.report``) plus the
+        ``sessions`` entry (completed and failed flows, flows per second).
+    """
+    recorder = Recorder()
+    outcomes = Counter()
+    lock = threading.Lock()
+    started = 0
+    deadline = time.monotonic() + duration if duration else None
+
+    def next_session():
+        nonlocal started
+        with lock:
+            if deadline is not None:
+                more = time.monotonic() < deadline
+            else:
+                more = started < sessions
+            started += more
+            return more
+
+    def user(index):
+        client = VirtualUser(url, timeout, recorder)
+        picker = random.Random(index)
+        try:
+            while next_session():
+                filename, content = mix.draw()
+                ok = client.session(filename, content, picker.choice(effects))
+                with lock:
+                    outcomes['completed' if ok else 'failed'] += 1
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = recorder.report(elapsed)
+    report['sessions'] = {
+        'completed': outcomes['completed'],
+        'failed': outcomes['failed'],
+        'per_second': round(outcomes['completed'] / elapsed, 3),
+        'seconds': round(elapsed, 2),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='API base URL')
+    parser.add_argument('--serve', choices=['uvicorn', 'gunicorn'],
+                        help='start a local server on the --url port')
+    parser.add_argument('--server-workers', type=int, default=1,
+                        help='server worker processes (--serve)')
+    parser.add_argument('--render-workers', type=int, default=1,
+                        help='render processes per server worker, VOCODER_WORKERS (--serve)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='request timeout, and gunicorn --timeout (seconds)')
+    parser.add_argument('--server-log', help='write the output of a started server here')
+    parser.add_argument('--concurrency', type=int, default=4, help='virtual users')
+    parser.add_argument('--sessions', type=int, default=20, help='flows to run in total')
+    parser.add_argument('--duration', type=float,
+                        help='run for this many seconds instead of --sessions')
+    parser.add_argument('--mix', nargs='+', default=list(DEFAULT_MIX),
+                        help='test files, DURATION[@RATE][:WEIGHT]')
+    parser.add_argument('--effects', nargs='+', choices=sorted(BUILTIN_EFFECTS),
+                        default=list(BUILTIN_EFFECTS))
+    parser.add_argument('--repeat-files', action='store_true',
+                        help='upload identical files (renders may come from the cache)')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    try:
+        mix_entries = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with tempfile.TemporaryDirectory() as directory:
+        mix = FileMix(mix_entries, directory, unique=not args.repeat_files)
+        server = None
+        log = None
+        if args.serve:
+            log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+            port = urlsplit(args.url).port or 8000
+            server = start_server(args.serve, port, directory, args.server_workers,
+                                  args.render_workers, int(args.timeout), log)
+        try:
+            report = run(args.url, mix, args.effects, args.concurrency, args.sessions,
+                         args.duration, args.timeout)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            if log not in (None, subprocess.DEVNULL):
+                log.close()
+
+    print(f"{'endpoint':<16} {'requests':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7}")
+    for endpoint in ENDPOINTS:
+        entry = report.get(endpoint)
+        if entry is None:
+            continue
+        errors = ', '.join(f'{status}: {count}' for status, count in entry['errors'].items())
+        print(f"{endpoint:<16} {entry['requests']:>8} {entry['throughput']:>8.2f} "
+              f"{entry['p50_ms']:>9.1f} {entry['p95_ms']:>9.1f} {entry['p99_ms']:>9.1f} "
+              f"{entry['error_rate']:>7.1%}" + (f"  ({errors})" if errors else ''))
+    sessions = report['sessions']
+    print(f"sessions: {sessions['completed']} completed, {sessions['failed']} failed, "
+          f"{sessions['per_second']} per second over {sessions['seconds']} s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'mix': args.mix,
+                       'effects': args.effects, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,7 +18,102 @@ class Config:
 
     TEMP_AUDIO_PATH = './temp_audio'
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # uploads are streamed to disk in 1MB chunks
+    MULTIPART_OVERHEAD = 64 * 1024  # form fields and boundaries around an uploaded file
     SUPPORTED_FORMATS = ['.wav', '.mp3', '.flac']
+    MAX_AUDIO_DURATION = 600  # 10 min, checked from the header before decoding
+    MAX_RENDER_DURATION = 60  # only the first minute of an upload is decoded and rendered
+
+    # Decoded audio is downsampled to this rate to keep STFTs small
+    TARGET_SAMPLE_RATE = 22050
+    # Resampler preset: 'fast', 'standard' or 'high'
+    RESAMPLE_QUALITY = os.environ.get('VOCODER_RESAMPLE_QUALITY', 'standard')
+
+    # Streaming render: block length and seam crossfade, in seconds
+    CHUNK_DURATION = 5
+    CROSSFADE_DURATION = 0.05
+
+    # Parallel render: threads rendering segments of one job (1 renders
+    # sequentially), and input context (seconds) on each side of a segment
+    # for effects whose segments are stitched with a crossfade
+    RENDER_THREADS = int(os.environ.get('VOCODER_RENDER_THREADS', 1))
+    SEGMENT_CONTEXT_DURATION = 0.25
+
+    # STFT frame and hop sizes of the phase vocoder (samples)
+    STFT_N_FFT = 2048
+    STFT_HOP_LENGTH = 512
+
+    # Storage dtype of cached STFT analyses ('float16' or 'float32')
+    ANALYSIS_DTYPE = os.environ.get('VOCODER_ANALYSIS_DTYPE', 'float16')
+
+    # Maximum number of effects in a processing chain
+    MAX_CHAIN_LENGTH = 8
+
+    # Maximum number of parameter sets in a batch request
+    MAX_BATCH_VARIANTS = 12
+
+    # Waveform envelopes: samples per row at the finest level, number of
+    # levels, and rows merged from one level to the next
+    PEAKS_SAMPLES_PER_BUCKET = 256
+    PEAKS_LEVELS = 5
+    PEAKS_LEVEL_FACTOR = 4
+
+    # Spectrogram tiles: frequency rows (linear scale) or mel bands, number
+    # of zoom levels and columns merged per level, dynamic range (dB) and
+    # columns per PNG tile
+    SPECTROGRAM_HEIGHT = 256
+    SPECTROGRAM_MEL_BANDS = 128
+    SPECTROGRAM_LEVELS = 6
+    SPECTROGRAM_LEVEL_FACTOR = 2
+    SPECTROGRAM_TOP_DB = 80.0
+    SPECTROGRAM_TILE_WIDTH = 256
+
+    # Live WebSocket sessions: accepted sample rates, largest frame
+    # (samples) and number of recent frames kept for timing statistics
+    LIVE_SAMPLE_RATE_RANGE = (8000, 96000)
+    LIVE_MAX_FRAME_SAMPLES = 16384
+    LIVE_TIMING_WINDOW = 1000
+
+    # Background jobs: worker processes, unfinished job limit, and how long
+    # finished jobs are kept (seconds)
+    MAX_WORKERS = int(os.environ.get('VOCODER_WORKERS', 1))
+    MAX_QUEUED_JOBS = 16
+    JOB_TTL = 3600
+
+    # Admission control: memory of the instance, resident size of the API
+    # process and of each worker before any job, fixed working set of a
+    # job, and block-sized float32 buffers per effect of a chain. Jobs only
+    # start while their estimated peaks fit in what the processes leave.
+    MEMORY_LIMIT = int(os.environ.get('VOCODER_MEMORY_MB', 512)) * 1024 * 1024
+    PROCESS_BASE_MEMORY = 112 * 1024 * 1024
+    JOB_BASE_MEMORY = 6 * 1024 * 1024
+    ENGINE_BLOCK_BUFFERS = 8
+
+    # Retry-After (seconds) sent with 503s before any job duration is known
+    RETRY_AFTER = 10
+
+    # Byte budget of the processed-audio result cache
+    RESULT_CACHE_BYTES = 256 * 1024 * 1024
+
+    # Progressive output streams: bytes read per step from the file being
+    # rendered, and wait between reads when it has not grown (seconds)
+    STREAM_READ_SIZE = 64 * 1024
+    STREAM_POLL_INTERVAL = 0.05
+
+    # Cache-Control of /audio responses (file names never change content)
+    AUDIO_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+    # Storage janitor: per-kind TTL (seconds since last use), total quota
+    # for temp_audio and how often it runs (seconds)
+    STORAGE_TTL = {
+        'uploaded': 24 * 3600,
+        'decoded': 24 * 3600,
+        'processed': 6 * 3600,
+        'incoming': 3600,
+        'spectrograms': 24 * 3600,
+    }
+    STORAGE_QUOTA_BYTES = 1024 * 1024 * 1024
+    JANITOR_INTERVAL = 300
 
     @classmethod
     def ensure_directories(cls):
@@ -26,11 +121,15 @@ class Config:
         Ensure all required directories exist.
 
         Creates the temporary audio directories if they don't exist.
-        This includes uploaded and processed subdirectories.
+        This includes uploaded, processed, decoded, incoming (partial
+        uploads) and spectrograms (image tiles) subdirectories.
         """
         os.makedirs(cls.TEMP_AUDIO_PATH, exist_ok=True)
         os.makedirs(os.path.join(cls.TEMP_AUDIO_PATH, 'uploaded'), exist_ok=True)
         os.makedirs(os.path.join(cls.TEMP_AUDIO_PATH, 'processed'), exist_ok=True)
+        os.makedirs(os.path.join(cls.TEMP_AUDIO_PATH, 'decoded'), exist_ok=True)
+        os.makedirs(os.path.join(cls.TEMP_AUDIO_PATH, 'incoming'), exist_ok=True)
+        os.makedirs(os.path.join(cls.TEMP_AUDIO_PATH, 'spectrograms'), exist_ok=True)
 
     @classmethod
     def is_supported_format(cls, filename):
@@ -7,11 +7,23 @@ This module contains all audio processing effects including:
 - Speed adjustment  
 - Echo/reverb effects
 
-Provides modular effect classes that can be easily extended.
+Provides modular effect classes that can be easily extended. Effects are
+looked up by name in an ``EffectRegistry``, which imports each effect
+module on first use; the effect classes below are imported the same way.
 """
 
+import importlib
+
 from .base_effect import BaseEffect
-from .robot_effect import RobotEffect
-from .pitch_effect import PitchEffect
-from .speed_effect import SpeedEffect
-from .echo_effect import EchoEffect
+from .parameters import Parameter
+from .registry import BUILTIN_EFFECTS, EffectRegistry
+
+_EFFECT_CLASSES = {path.rsplit('.', 1)[1]: path for path in BUILTIN_EFFECTS.values()}
+
+
+def __getattr__(name):
+    path = _EFFECT_CLASSES.get(name)
+    if path is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
@@ -4,11 +4,46 @@ Base class for audio effects.
 Defines an abstract interface for all effects.
 """
 
+import numpy as np
+
+
 class BaseEffect:
     """
     Abstract base class for audio effects.
+
+    Effects can be used in two ways:
+    - ``apply`` renders a whole signal in one call.
+    - ``init_state`` / ``process_block`` / ``flush`` render a signal block by
+      block, carrying state (filter memory, oscillator phase, delay lines)
+      between blocks. This is what the chunk engine uses.
+
+    Blocks are float32. ``process_block`` may be given an ``out`` buffer
+    that it can write its result into, so that the chunk engine reuses one
+    output buffer for every block instead of allocating a new array.
+
+    Effects that declare a ``segment_context`` can also be rendered in
+    parallel: ``render_segment`` renders a piece of the signal with a fresh
+    state, given that much input before and after the piece.
+
+    Effects that cannot carry their state exactly (e.g. wrappers around a
+    whole-signal library call) keep the default ``process_block`` and declare a
+    ``context_duration`` instead: the chunk engine then feeds them overlapping
+    windows and crossfades the seams.
     """
 
+    # Seconds of input context needed on each side of a block. Zero means the
+    # effect is stateful and ``process_block`` is exact.
+    context_duration = 0.0
+
+    # Whether the full render is peak-normalized when it exceeds full scale.
+    normalize_output = False
+
+    # Display name and declared parameters (``Parameter`` instances). They
+    # describe the effect to clients and validate requests before any audio
+    # is decoded; effects read their defaults from them.
+    label = None
+    parameters = ()
+
     def __init__(self):
         """
         Initialize the effect.
@@ -29,6 +64,196 @@ class BaseEffect:
         """
         raise NotImplementedError("This method should be overridden by subclasses.")
 
+    def length_ratio(self, **kwargs):
+        """
+        Ratio between output and input length (1.0 for most effects).
+
+        Args:
+            **kwargs: Parameters for effect.
+
+        Returns:
+            float: Output samples produced per input sample.
+        """
+        return 1.0
+
+    def analysis_settings(self, **kwargs):
+        """
+        STFT settings the effect analyzes its input with, so that a shared
+        precomputed analysis can be used instead (None if not spectral).
+
+        Args:
+            **kwargs: Parameters for effect.
+
+        Returns:
+            tuple or None: (n_fft, hop_length, window)
+        """
+        return None
+
+    def estimate_memory(self, block_size, sample_rate, **kwargs):
+        """
+        Peak memory the effect needs to process one block, on top of the
+        chunk engine's block buffers (used for admission control).
+
+        Args:
+            block_size (int): Input samples per block.
+            sample_rate (int): The sample rate of the audio.
+            **kwargs: Parameters for effect.
+
+        Returns:
+            int: Bytes.
+        """
+        return 0
+
+    def segment_context(self, **kwargs):
+        """
+        Seconds of input a segment needs on each side to be rendered on its
+        own (see ``render_segment``); the chunk engine crossfades segments
+        inside the right context.
+
+        Args:
+            **kwargs: Parameters for effect.
+
+        Returns:
+            float or None: Context in seconds, None if the effect can only
+            be rendered sequentially.
+        """
+        return self.context_duration or None
+
+    def render_segment(self, segment, sample_rate, offset, **kwargs):
+        """
+        Render a segment of a longer signal with a fresh state. Segments are
+        rendered concurrently, so this must not change the effect itself.
+
+        Args:
+            segment (np.ndarray): Input samples (float32).
+            sample_rate (int): The sample rate of the audio.
+            offset (int): Position of the segment's first sample in the signal.
+            **kwargs: Additional parameters for effect.
+
+        Returns:
+            np.ndarray: Rendered segment, including any tail past its end.
+        """
+        if self.context_duration:
+            return self.apply(segment, sample_rate, **kwargs)
+        state = self.init_state(sample_rate, **kwargs)
+        return np.concatenate([
+            self.process_block(segment, sample_rate, state, **kwargs),
+            self.flush(sample_rate, state, **kwargs),
+        ])
+
+    def use_analysis(self, state, analysis):
+        """
+        Make a streaming render read its input STFT from ``analysis``.
+        Only called for effects that declare ``analysis_settings``.
+
+        Args:
+            state: State returned by ``init_state``, updated in place.
+            analysis (STFTAnalysis): Analysis of the input of the render.
+        """
+
+    def init_state(self, sample_rate, **kwargs):
+        """
+        Create the state carried between blocks of a streaming render.
+
+        Args:
+            sample_rate (int): The sample rate of the audio.
+            **kwargs: Additional parameters for effect.
+
+        Returns:
+            dict or None: Effect state, None for stateless effects.
+        """
+        return None
+
+    def process_block(self, block, sample_rate, state, out=None, **kwargs):
+        """
+        Process one block of a streaming render.
+
+        The default implementation is stateless and simply calls ``apply``.
+
+        Args:
+            block (np.ndarray): Input block (float32).
+            sample_rate (int): The sample rate of the audio.
+            state: State returned by ``init_state``, updated in place.
+            out (np.ndarray): Optional float32 buffer the result may be
+                written to. Effects that use it return a view of it, and only
+                do so when it is large enough; it must not alias ``block``.
+            **kwargs: Additional parameters for effect.
+
+        Returns:
+            np.ndarray: Processed block (float32), possibly a view of ``out``.
+        """
+        return self.apply(block, sample_rate, **kwargs)
+
+    def flush(self, sample_rate, state, **kwargs):
+        """
+        Return the samples still held in the state once the input has ended
+        (e.g. an echo tail).
+
+        Args:
+            sample_rate (int): The sample rate of the audio.
+            state: State returned by ``init_state``.
+            **kwargs: Additional parameters for effect.
+
+        Returns:
+            np.ndarray: Remaining output samples (possibly empty).
+        """
+        return np.zeros(0, dtype=np.float32)
+
+    def default(self, name):
+        """
+        Args:
+            name (str): Name of a declared parameter.
+
+        Returns:
+            float: Its default value.
+
+        Raises:
+            KeyError: If the effect has no such parameter.
+        """
+        for parameter in self.parameters:
+            if parameter.name == name:
+                return parameter.default
+        raise KeyError(name)
+
+    def validate_parameters(self, parameters):
+        """
+        Check request parameters against the declared ones.
+
+        Args:
+            parameters (dict): Untrusted parameters.
+
+        Returns:
+            dict: Every declared parameter, converted to its type, with the
+            default for the ones left out.
+
+        Raises:
+            ValueError: If a parameter is unknown or has an invalid value.
+        """
+        if not isinstance(parameters, dict):
+            raise ValueError('Parameters must be an object')
+        declared = {parameter.name: parameter for parameter in self.parameters}
+        unknown = sorted(set(parameters) - set(declared))
+        if unknown:
+            raise ValueError(f"Unknown parameter {', '.join(unknown)}")
+        return {
+            name: parameter.validate(parameters[name]) if name in parameters else parameter.default
+            for name, parameter in declared.items()
+        }
+
+    def describe(self, name):
+        """
+        Args:
+            name (str): Name the effect is registered under.
+
+        Returns:
+            dict: JSON description: id, display name and parameters.
+        """
+        return {
+            'id': name,
+            'name': self.label or name,
+            'params': [parameter.describe() for parameter in self.parameters],
+        }
+
     def get_parameter_widgets(self):
         """
         Return parameters for the effect as Streamlit widgets.
@@ -7,6 +7,7 @@ Provides an audio echo effect as a subclass of BaseEffect.
 import numpy as np
 
 from effects.base_effect import BaseEffect
+from effects.parameters import Parameter
 
 
 class EchoEffect(BaseEffect):
@@ -16,6 +17,14 @@ class EchoEffect(BaseEffect):
     Inherits from BaseEffect.
     """
 
+    normalize_output = True
+
+    label = 'Echo'
+    parameters = (
+        Parameter('delay', 0.2, minimum=0.05, maximum=1.0, label='Delay (s)'),
+        Parameter('decay', 0.5, minimum=0.1, maximum=0.9, label='Decay'),
+    )
+
     def apply(self, audio_data, sample_rate, **kwargs):
         """
         Apply the echo effect to audio data.
@@ -34,28 +43,106 @@ class EchoEffect(BaseEffect):
         Raises:
             RuntimeError: If processing fails.
         """
-        delay = kwargs.get('delay', 0.2)  # default delay 200 ms
-        decay = kwargs.get('decay', 0.5)  # default decay
+        state = self.init_state(sample_rate, **kwargs)
+        echo_signal = np.concatenate([
+            self.process_block(audio_data, sample_rate, state, **kwargs),
+            self.flush(sample_rate, state, **kwargs),
+        ])
+
+        # Normalize to prevent clipping
+        max_val = max(echo_signal.max(), -echo_signal.min()) if len(echo_signal) else 0.0
+        if max_val > 1.0:
+            echo_signal /= max_val
+        return echo_signal
+
+    def init_state(self, sample_rate, **kwargs):
+        """
+        Create the streaming state: a delay line holding the last ``delay``
+        seconds of input.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            **kwargs: Parameters for the echo effect.
+
+        Returns:
+            dict: Effect state.
+        """
+        delay = kwargs.get('delay', self.default('delay'))
+        delay_samples = int(delay * sample_rate)
+        return {'delay_line': np.zeros(delay_samples, dtype=np.float32)}
+
+    def segment_context(self, **kwargs):
+        """
+        A segment rendered with ``delay`` seconds of input before it starts
+        with the same delay line as a continuous render.
+
+        Args:
+            **kwargs: Parameters for the echo effect.
+
+        Returns:
+            float: Context in seconds.
+        """
+        return float(kwargs.get('delay', self.default('delay')))
+
+    def process_block(self, block, sample_rate, state, out=None, **kwargs):
+        """
+        Apply the echo to one block. The delayed signal comes from the delay
+        line, so echoes cross block boundaries and the output keeps the input
+        length; the final tail is returned by ``flush``.
+
+        Args:
+            block (np.ndarray): Input block.
+            sample_rate (int): Sample rate of the audio.
+            state (dict): State returned by ``init_state``.
+            out (np.ndarray): Optional buffer for the processed block.
+            **kwargs: Parameters for the echo effect.
+
+        Returns:
+            np.ndarray: Processed block (not normalized).
+
+        Raises:
+            RuntimeError: If processing fails.
+        """
+        decay = kwargs.get('decay', self.default('decay'))
 
         try:
-            delay_samples = int(delay * sample_rate)
-            
-            # Vectorized implementation
-            echo_signal = np.zeros(len(audio_data) + delay_samples)
-            echo_signal[:len(audio_data)] = audio_data
-            
-            # Create delayed version and add it
-            delayed_signal = audio_data * decay
-            echo_signal[delay_samples:delay_samples+len(audio_data)] += delayed_signal
-            
-            # Trim to original length if desired, but effect usually extends. 
-            # For consistent chunking, we might want to keep original length or allow expansion.
-            # Keeping expansion logic but ensuring efficient calc.
-            
-            # Normalize to prevent clipping
-            max_val = np.max(np.abs(echo_signal))
-            if max_val > 1.0:
-                echo_signal = echo_signal / max_val
-            return echo_signal.astype(np.float32)
+            n = len(block)
+            if out is None or len(out) < n:
+                out = np.empty(n, dtype=np.float32)
+            echo_signal = out[:n]
+            delay_line = state['delay_line']
+            delay_samples = len(delay_line)
+            if delay_samples == 0:
+                return np.multiply(block, 1.0 + decay, out=echo_signal)
+
+            # Vectorized implementation: y[n] = x[n] + decay * x[n - delay],
+            # the first delay_samples inputs coming from the delay line
+            head = min(n, delay_samples)
+            np.multiply(delay_line[:head], decay, out=echo_signal[:head])
+            np.multiply(block[:n - head], decay, out=echo_signal[head:])
+            echo_signal += block
+
+            # Shift the delay line in place
+            if n >= delay_samples:
+                delay_line[:] = block[n - delay_samples:]
+            else:
+                delay_line[:delay_samples - n] = delay_line[n:]
+                delay_line[delay_samples - n:] = block
+            return echo_signal
         except Exception as e:
             raise RuntimeError(f"Echo effect error: {str(e)}") from e
+
+    def flush(self, sample_rate, state, **kwargs):
+        """
+        Return the echo tail left in the delay line.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            state (dict): State returned by ``init_state``.
+            **kwargs: Parameters for the echo effect.
+
+        Returns:
+            np.ndarray: The last ``delay`` seconds of echo.
+        """
+        decay = kwargs.get('decay', self.default('decay'))
+        return decay * state['delay_line']
@@ -0,0 +1,83 @@
+"""
+Effect parameters.
+
+Each effect declares its parameters with a type, a default and an allowed
+range. The declarations describe the effect to clients (``/effects``) and
+validate requests before any audio is decoded.
+"""
+
+import math
+
+# Parameter types: JSON schema name -> Python type
+TYPES = {'number': float, 'integer': int}
+
+
+class Parameter:
+    """
+    A numeric effect parameter.
+    """
+
+    def __init__(self, name, default, minimum=None, maximum=None, step=None, label=None,
+                 kind='number'):
+        """
+        Args:
+            name (str): Keyword the effect reads the value from.
+            default (float): Value used when a request leaves it out.
+            minimum (float): Smallest allowed value (inclusive), or None.
+            maximum (float): Largest allowed value (inclusive), or None.
+            step (float): Step of a UI control, or None.
+            label (str): Display name (default: ``name``).
+            kind (str): 'number' or 'integer'.
+
+        Raises:
+            ValueError: If the type is unknown.
+        """
+        if kind not in TYPES:
+            raise ValueError(f'Unknown parameter type {kind}')
+        self.name = name
+        self.kind = kind
+        self.default = TYPES[kind](default)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.label = label or name
+
+    def validate(self, value):
+        """
+        Check a value from a request.
+
+        Args:
+            value: Untrusted value.
+
+        Returns:
+            float or int: The value, converted to the parameter's type.
+
+        Raises:
+            ValueError: If the value is not a number of the right type or is
+            out of range.
+        """
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'{self.name} must be a number')
+        if not math.isfinite(value):
+            raise ValueError(f'{self.name} must be finite')
+        if self.kind == 'integer' and value != int(value):
+            raise ValueError(f'{self.name} must be an integer')
+        value = TYPES[self.kind](value)
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f'{self.name} must be at least {self.minimum}')
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f'{self.name} must be at most {self.maximum}')
+        return value
+
+    def describe(self):
+        """
+        Returns:
+            dict: JSON description (name, type, default, label, and the
+            range and step when set).
+        """
+        spec = {'name': self.name, 'type': self.kind, 'default': self.default,
+                'label': self.label}
+        for key, value in (('min', self.minimum), ('max', self.maximum), ('step', self.step)):
+            if value is not None:
+                spec[key] = value
+        return spec
@@ -4,10 +4,22 @@ Pitch effect implementation for audio processing.
 Provides pitch shifting audio effect as a subclass of BaseEffect.
 """
 
-import librosa
+from fractions import Fraction
+
 import numpy as np
 
+from config import Config
 from effects.base_effect import BaseEffect
+from effects.parameters import Parameter
+from pipeline.buffers import BufferArena
+from pipeline.phase_vocoder import PhaseVocoder, working_memory
+from pipeline.resampler import PolyphaseResampler
+
+# Largest denominator of the rational resampling ratio. At 2048 the pitch
+# error is at most 0.05 cent for settings on a 0.01 semitone grid (0.4 cent
+# for arbitrary values just off 0, where the ratio rounds to 1); the filter
+# bank stays under 1 MB and is designed once per ratio (pipeline.resampler)
+MAX_RATIO_DENOMINATOR = 2048
 
 
 class PitchEffect(BaseEffect):
@@ -17,6 +29,11 @@ class PitchEffect(BaseEffect):
     Inherits from BaseEffect.
     """
 
+    label = 'Pitch Shift'
+    parameters = (
+        Parameter('n_steps', 4.0, minimum=-12, maximum=12, step=1, label='Semitones'),
+    )
+
     def __init__(self):
         """
         Initialize the pitch shift effect.
@@ -40,14 +57,148 @@ class PitchEffect(BaseEffect):
         Raises:
             RuntimeError: If processing fails.
         """
-        n_steps = kwargs.get('n_steps', 10.0)  # default pitch shift by 2 half steps
+        state = self.init_state(sample_rate, **kwargs)
+        shifted = self.process_block(audio_data, sample_rate, state, **kwargs)
+        return np.concatenate([shifted, self.flush(sample_rate, state, **kwargs)])
+
+    def init_state(self, sample_rate, **kwargs):
+        """
+        Create the state of a streaming render.
+
+        The signal is time-stretched by ``2 ** (-n_steps / 12)`` and then
+        resampled back to its original length, which shifts the pitch.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            **kwargs: Parameters for the pitch effect.
+
+        Returns:
+            dict: Phase vocoder, resampler, sample counters and the buffer
+            of the stretched signal.
+
+        Raises:
+            RuntimeError: If the parameters are invalid.
+        """
+        n_steps = kwargs.get('n_steps', self.default('n_steps'))
 
         try:
-            shifted_audio = librosa.effects.pitch_shift(
-                y=audio_data,
-                sr=sample_rate,
-                n_steps=n_steps,
-            )
-            return shifted_audio.astype(np.float32)
+            rate = 2.0 ** (-float(n_steps) / 12)
+            ratio = Fraction(rate).limit_denominator(MAX_RATIO_DENOMINATOR)
+            return {
+                'vocoder': PhaseVocoder(rate),
+                'resampler': PolyphaseResampler(ratio.denominator, ratio.numerator),
+                'received': 0,
+                'emitted': 0,
+                'buffers': BufferArena(),
+            }
         except Exception as e:
             raise RuntimeError(f"Pitch shift error: {str(e)}") from e
+
+    def analysis_settings(self, **kwargs):
+        """
+        The phase vocoder analyzes its input with the default STFT settings.
+
+        Args:
+            **kwargs: Parameters for the pitch effect.
+
+        Returns:
+            tuple: (n_fft, hop_length, window)
+        """
+        return Config.STFT_N_FFT, Config.STFT_HOP_LENGTH, 'hann'
+
+    def estimate_memory(self, block_size, sample_rate, **kwargs):
+        """
+        The phase vocoder dominates: its analysis frames, synthesis batch
+        and the stretched block before resampling.
+
+        Args:
+            block_size (int): Input samples per block.
+            sample_rate (int): Sample rate of the audio.
+            **kwargs: Parameters for the pitch effect.
+
+        Returns:
+            int: Bytes.
+        """
+        rate = 2.0 ** (-float(kwargs.get('n_steps', self.default('n_steps'))) / 12)
+        return working_memory(block_size, rate)
+
+    def segment_context(self, **kwargs):
+        """
+        Segments are stretched independently, so their phases only agree
+        approximately; ``Config.SEGMENT_CONTEXT_DURATION`` lets the vocoder
+        settle before the core of a segment and leaves room for the
+        crossfade after it.
+
+        Args:
+            **kwargs: Parameters for the pitch effect.
+
+        Returns:
+            float: Context in seconds.
+        """
+        return Config.SEGMENT_CONTEXT_DURATION
+
+    def use_analysis(self, state, analysis):
+        """
+        Read the input STFT from a precomputed analysis.
+
+        Args:
+            state (dict): State returned by ``init_state``.
+            analysis (STFTAnalysis): Analysis of the input of the render.
+        """
+        state['vocoder'].use_analysis(analysis)
+
+    def process_block(self, block, sample_rate, state, out=None, **kwargs):
+        """
+        Pitch-shift one block, carrying vocoder and resampler state.
+
+        Args:
+            block (np.ndarray): Input block.
+            sample_rate (int): Sample rate of the audio.
+            state (dict): State returned by ``init_state``.
+            out (np.ndarray): Optional buffer for the shifted samples.
+            **kwargs: Parameters for the pitch effect.
+
+        Returns:
+            np.ndarray: Shifted samples available so far.
+        """
+        state['received'] += len(block)
+        vocoder = state['vocoder']
+        stretched = vocoder.process(
+            block, out=state['buffers'].get('stretched', vocoder.max_output(len(block)))
+        )
+        shifted = state['resampler'].process(stretched, out=out)
+        return self._limit(shifted, state, state['received'])
+
+    def flush(self, sample_rate, state, **kwargs):
+        """
+        Return the end of the shifted signal, padded or cropped so that the
+        output has as many samples as the input.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            state (dict): State returned by ``init_state``.
+            **kwargs: Parameters for the pitch effect.
+
+        Returns:
+            np.ndarray: Remaining samples.
+        """
+        resampler = state['resampler']
+        tail = np.concatenate([
+            resampler.process(state['vocoder'].flush()),
+            resampler.flush(),
+        ])
+        tail = self._limit(tail, state, state['received'])
+        missing = state['received'] - state['emitted']
+        if missing > 0:
+            tail = np.concatenate([tail, np.zeros(missing, dtype=np.float32)])
+            state['emitted'] += missing
+        return tail
+
+    @staticmethod
+    def _limit(samples, state, total):
+        """
+        Crop ``samples`` so that no more than ``total`` samples are emitted.
+        """
+        samples = samples[:max(0, total - state['emitted'])]
+        state['emitted'] += len(samples)
+        return samples
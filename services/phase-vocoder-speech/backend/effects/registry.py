@@ -0,0 +1,96 @@
+"""
+Effect registry.
+
+Maps effect names to their classes by import path: an effect module, and
+the libraries it uses, is only imported when the effect is first used.
+"""
+
+import importlib
+import threading
+from collections.abc import Mapping
+
+# Built-in effects, in the order they are listed to clients
+BUILTIN_EFFECTS = {
+    'robot': 'effects.robot_effect.RobotEffect',
+    'pitch': 'effects.pitch_effect.PitchEffect',
+    'speed': 'effects.speed_effect.SpeedEffect',
+    'echo': 'effects.echo_effect.EchoEffect',
+}
+
+
+class EffectRegistry(Mapping):
+    """
+    Read-only mapping of effect names to effect instances, created on first
+    access.
+    """
+
+    def __init__(self, effects=None):
+        """
+        Args:
+            effects (dict): ``{name: 'module.Class'}`` import paths
+                (default ``BUILTIN_EFFECTS``).
+        """
+        self._paths = dict(BUILTIN_EFFECTS if effects is None else effects)
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, effect):
+        """
+        Add or replace an effect.
+
+        Args:
+            name (str): Name of the effect.
+            effect (BaseEffect or str): Effect instance, or the
+                ``'module.Class'`` import path of its class.
+        """
+        with self._lock:
+            if isinstance(effect, str):
+                self._paths[name] = effect
+                self._instances.pop(name, None)
+            else:
+                self._paths[name] = f'{type(effect).__module__}.{type(effect).__name__}'
+                self._instances[name] = effect
+
+    def __getitem__(self, name):
+        with self._lock:
+            effect = self._instances.get(name)
+            if effect is None:
+                module_name, class_name = self._paths[name].rsplit('.', 1)
+                effect = getattr(importlib.import_module(module_name), class_name)()
+                self._instances[name] = effect
+            return effect
+
+    def __contains__(self, name):
+        return name in self._paths
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def describe(self):
+        """
+        Returns:
+            list[dict]: Description of every effect (see
+            ``BaseEffect.describe``), in registration order.
+        """
+        return [self[name].describe(name) for name in self]
+
+    def validate(self, name, parameters):
+        """
+        Check a request for an effect against its declared parameters.
+
+        Args:
+            name (str): Name of the effect.
+            parameters (dict): Untrusted parameters.
+
+        Returns:
+            dict: Validated parameters (see ``BaseEffect.validate_parameters``).
+
+        Raises:
+            ValueError: If the effect does not exist or a parameter is invalid.
+        """
+        if name not in self:
+            raise ValueError(f'Effect {name} not available')
+        return self[name].validate_parameters(parameters)
@@ -5,10 +5,13 @@ Provides an audio robotization effect as a subclass of BaseEffect.
 """
 
 import numpy as np
-import scipy.signal
 
+from pipeline.buffers import BufferArena
 from .base_effect import BaseEffect
+from .parameters import Parameter
 
+# Seconds after which the lowpass filter has forgotten its initial state
+FILTER_SETTLE_DURATION = 0.05
 
 
 class RobotEffect(BaseEffect):
@@ -18,6 +21,11 @@ class RobotEffect(BaseEffect):
     Inherits from BaseEffect.
     """
 
+    label = 'Robot'
+    parameters = (
+        Parameter('carrier_freq', 30.0, minimum=10, maximum=200, label='Carrier Frequency'),
+    )
+
     def __init__(self):
         """
         Initialize the robot effect.
@@ -36,21 +44,117 @@ class RobotEffect(BaseEffect):
         Returns:
             np.ndarray: Processed audio data with robot effect.
 
+        Raises:
+            RuntimeError: If processing fails.
+        """
+        state = self.init_state(sample_rate, **kwargs)
+        return self.process_block(audio_data, sample_rate, state, **kwargs)
+
+    def init_state(self, sample_rate, **kwargs):
+        """
+        Create the streaming state: sample position of the modulator (its
+        running phase), lowpass filter memory, the sample index ramp and the
+        modulator work buffer.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            **kwargs: Additional parameters (unused).
+
+        Returns:
+            dict: Effect state.
+        """
+        import scipy.signal
+
+        # Lowpass filter to smooth the signal, as second-order sections so
+        # that it stays accurate in float32
+        sos = scipy.signal.butter(4, 1000 / (sample_rate / 2), btype='low', output='sos')
+        return {
+            'position': 0,
+            'sos': sos.astype(np.float32),
+            'zi': np.zeros((len(sos), 2), dtype=np.float32),
+            'ramp': np.zeros(0),
+            'buffers': BufferArena(),
+        }
+
+    def segment_context(self, **kwargs):
+        """
+        A segment needs enough input before it for the lowpass filter to
+        settle; the modulator follows the signal position.
+
+        Args:
+            **kwargs: Additional parameters (unused).
+
+        Returns:
+            float: Context in seconds.
+        """
+        return FILTER_SETTLE_DURATION
+
+    def render_segment(self, segment, sample_rate, offset, **kwargs):
+        """
+        Apply the robot effect to a segment of a longer signal, with the
+        modulator at the segment's position.
+
+        Args:
+            segment (np.ndarray): Input samples.
+            sample_rate (int): Sample rate of the audio.
+            offset (int): Position of the segment's first sample in the signal.
+            **kwargs: Additional parameters (unused).
+
+        Returns:
+            np.ndarray: Processed segment.
+        """
+        state = self.init_state(sample_rate, **kwargs)
+        state['position'] = offset
+        return self.process_block(segment, sample_rate, state, **kwargs)
+
+    def process_block(self, block, sample_rate, state, out=None, **kwargs):
+        """
+        Apply the robot effect to one block, continuing the modulator phase
+        and filter state of the previous block.
+
+        Args:
+            block (np.ndarray): Input block.
+            sample_rate (int): Sample rate of the audio.
+            state (dict): State returned by ``init_state``.
+            out (np.ndarray): Optional buffer for the output, used when it
+                is large enough.
+            **kwargs: Additional parameters (unused).
+
+        Returns:
+            np.ndarray: Processed block (a view of ``out`` when it was used).
+
         Raises:
             RuntimeError: If processing fails.
         """
         try:
             # Robot effect implementation using ring modulation
-            carrier_freq = kwargs.get('carrier_freq', 30.0)  # default 30 Hz modulation
-            t = np.arange(len(audio_data)) / sample_rate
-            modulator = np.sign(np.sin(2 * np.pi * carrier_freq * t))
+            carrier_freq = kwargs.get('carrier_freq', self.default('carrier_freq'))
+            n = len(block)
+            # The modulator is a function of the absolute sample position, so
+            # the output does not depend on block or segment boundaries. The
+            # phase is computed in float64: the position grows unbounded.
+            if len(state['ramp']) < n:
+                state['ramp'] = np.arange(n, dtype=np.float64)
+            modulator = state['buffers'].get('modulator', n, np.float64)
+            np.add(state['ramp'][:n], state['position'], out=modulator)
+            modulator /= sample_rate
+            modulator *= 2 * np.pi * carrier_freq
+            np.sin(modulator, out=modulator)
+            np.sign(modulator, out=modulator)
+
+            if out is None or len(out) < n:
+                out = np.empty(n, dtype=np.float32)
+            modulated = np.multiply(block, modulator, out=out[:n])
 
-            modulated = audio_data * modulator
+            import scipy.signal
 
-            # Lowpass filter to smooth the signal
-            b, a = scipy.signal.butter(4, 1000 / (sample_rate / 2), btype='low')
-            filtered = scipy.signal.lfilter(b, a, modulated)
+            filtered, state['zi'] = scipy.signal.sosfilt(
+                state['sos'], modulated, zi=state['zi']
+            )
+            out = out[:n]
+            out[:] = filtered
+            state['position'] += n
 
-            return filtered.astype(np.float32)
+            return out
         except Exception as e:
             raise RuntimeError(f"Robot effect error: {str(e)}") from e
@@ -4,10 +4,12 @@ Speed effect implementation for audio processing.
 Provides functionality to change the speed of audio data.
 """
 
-import librosa
 import numpy as np
 
+from config import Config
 from effects.base_effect import BaseEffect
+from effects.parameters import Parameter
+from pipeline.phase_vocoder import PhaseVocoder, working_memory
 
 
 class SpeedEffect(BaseEffect):
@@ -17,12 +19,29 @@ class SpeedEffect(BaseEffect):
     Inherits from BaseEffect.
     """
 
+    label = 'Speed Change'
+    parameters = (
+        Parameter('speed_factor', 1.5, minimum=0.5, maximum=2.0, step=0.1, label='Speed Factor'),
+    )
+
     def __init__(self):
         """
         Initialize the speed change effect.
         """
         # No special initialization needed
 
+    def length_ratio(self, **kwargs):
+        """
+        Time stretching changes the length by ``1 / speed_factor``.
+
+        Args:
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            float: Output samples produced per input sample.
+        """
+        return 1.0 / kwargs.get('speed_factor', self.default('speed_factor'))
+
     def apply(self, audio_data, sample_rate, **kwargs):
         """
         Apply speed change to audio data.
@@ -40,10 +59,107 @@ class SpeedEffect(BaseEffect):
         Raises:
             RuntimeError: If processing fails.
         """
-        speed_factor = kwargs.get('speed_factor', 5.0)  # default no speed change
+        state = self.init_state(sample_rate, **kwargs)
+        processed = self.process_block(audio_data, sample_rate, state, **kwargs)
+        return np.concatenate([processed, self.flush(sample_rate, state, **kwargs)])
+
+    def init_state(self, sample_rate, **kwargs):
+        """
+        Create the phase vocoder of a streaming render.
+
+        Args:
+            sample_rate (int): Sample rate of the audio (unused).
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            dict: Effect state.
+
+        Raises:
+            RuntimeError: If the speed factor is invalid.
+        """
+        speed_factor = kwargs.get('speed_factor', self.default('speed_factor'))
 
         try:
-            processed = librosa.effects.time_stretch(audio_data, rate=speed_factor)
-            return processed.astype(np.float32)
+            return {'vocoder': PhaseVocoder(speed_factor)}
         except Exception as e:
             raise RuntimeError(f"Speed change error: {str(e)}") from e
+
+    def analysis_settings(self, **kwargs):
+        """
+        The phase vocoder analyzes its input with the default STFT settings.
+
+        Args:
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            tuple: (n_fft, hop_length, window)
+        """
+        return Config.STFT_N_FFT, Config.STFT_HOP_LENGTH, 'hann'
+
+    def estimate_memory(self, block_size, sample_rate, **kwargs):
+        """
+        Slowing down produces more output per block, so it needs more
+        memory than speeding up.
+
+        Args:
+            block_size (int): Input samples per block.
+            sample_rate (int): Sample rate of the audio (unused).
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            int: Bytes.
+        """
+        speed_factor = kwargs.get('speed_factor', self.default('speed_factor'))
+        return working_memory(block_size, speed_factor)
+
+    def segment_context(self, **kwargs):
+        """
+        Same segment context as the pitch shift, which runs the same vocoder.
+
+        Args:
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            float: Context in seconds.
+        """
+        return Config.SEGMENT_CONTEXT_DURATION
+
+    def use_analysis(self, state, analysis):
+        """
+        Read the input STFT from a precomputed analysis.
+
+        Args:
+            state (dict): State returned by ``init_state``.
+            analysis (STFTAnalysis): Analysis of the input of the render.
+        """
+        state['vocoder'].use_analysis(analysis)
+
+    def process_block(self, block, sample_rate, state, out=None, **kwargs):
+        """
+        Time-stretch one block, carrying the vocoder phase across blocks.
+
+        Args:
+            block (np.ndarray): Input block.
+            sample_rate (int): Sample rate of the audio (unused).
+            state (dict): State returned by ``init_state``.
+            out (np.ndarray): Optional buffer for the stretched samples.
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            np.ndarray: Stretched samples available so far.
+        """
+        return state['vocoder'].process(block, out=out)
+
+    def flush(self, sample_rate, state, **kwargs):
+        """
+        Return the end of the stretched signal.
+
+        Args:
+            sample_rate (int): Sample rate of the audio (unused).
+            state (dict): State returned by ``init_state``.
+            **kwargs: Parameters for the speed effect.
+
+        Returns:
+            np.ndarray: Remaining samples.
+        """
+        return state['vocoder'].flush()
@@ -0,0 +1,719 @@
+"""
+Background job queue for audio processing.
+
+Renders run on a bounded process pool so that CPU-bound effects never
+block the API event loop. Workers report progress (chunks done / total)
+through a shared dictionary, which is also used to request cancellation.
+
+Each job carries an estimate of its peak memory; jobs wait in a FIFO queue
+until a worker is free and their estimate fits in the memory budget left by
+the running jobs.
+
+Requests for a result that is already being rendered (same key) share the
+unfinished job instead of rendering it a second time.
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+from metrics import StageTimer
+from pipeline.peaks import PeakBuilder, envelope_path
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a worker when its job has been cancelled.
+    """
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue is full.
+    """
+
+    def __init__(self, message, retry_after=None):
+        """
+        Args:
+            message (str): Error message.
+            retry_after (int): Seconds after which a slot should be free.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """
+    Book-keeping for one submitted render.
+    """
+
+    def __init__(self, job_id, file_id, chain, output_filename):
+        """
+        Initialize a job record.
+
+        Args:
+            job_id (str): Unique job identifier.
+            file_id (str): Uploaded file identifier.
+            chain (list[tuple]): ``(effect_name, parameters)`` pairs to apply.
+            output_filename (str): Name of the processed file.
+        """
+        self.job_id = job_id
+        self.file_id = file_id
+        self.chain = chain
+        self.effect = '+'.join(effect_name for effect_name, _ in chain)
+        self.output_filename = output_filename
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.cancel_requested = False
+        self.cached = False
+        self.input_path = None
+        self.output_path = None
+        self.output_format = 'wav'
+        self.bit_depth = None
+        self.memory = 0
+        self.threads = 1
+        self.timings = None
+        self.key = None
+        self.waiters = 1
+        self.started_at = None
+        self.worker_future = None
+        self.executor = None
+        self.task = None
+
+    @property
+    def done(self):
+        """
+        bool: True once the job has finished, failed or been cancelled.
+        """
+        return self.future is not None and self.future.done()
+
+
+class JobManager:
+    """
+    Submits renders to a process pool and tracks their status.
+
+    ``job.future`` belongs to the manager and resolves with the worker's
+    result; the render is only handed to the pool (``job.worker_future``)
+    once it is admitted.
+    """
+
+    def __init__(self, max_workers=None, max_queued=None, memory_budget=None):
+        """
+        Initialize the job manager. The pool is started on first use.
+
+        Args:
+            max_workers (int): Number of worker processes
+                (default ``Config.MAX_WORKERS``).
+            max_queued (int): Maximum number of unfinished jobs
+                (default ``Config.MAX_QUEUED_JOBS``).
+            memory_budget (int): Bytes available to running renders (default
+                ``Config.MEMORY_LIMIT`` minus the API and worker processes).
+        """
+        self.max_workers = max_workers or Config.MAX_WORKERS
+        self.max_queued = max_queued or Config.MAX_QUEUED_JOBS
+        if memory_budget is None:
+            memory_budget = (Config.MEMORY_LIMIT
+                             - (1 + self.max_workers) * Config.PROCESS_BASE_MEMORY)
+        self.memory_budget = memory_budget
+        self.jobs = {}
+        self._lock = threading.RLock()
+        self._waiting = deque()
+        self._running = set()
+        self._memory_in_use = 0
+        self._average_duration = None
+        self._context = multiprocessing.get_context('spawn')
+        self._manager = None
+        self._shared = None
+        self._executor = None
+
+    def _ensure_pool(self):
+        """
+        Start the shared-state manager and the worker pool if needed.
+        """
+        if self._executor is None:
+            self._manager = self._context.Manager()
+            self._shared = self._manager.dict()
+            self._executor = self._new_executor()
+
+    def _new_executor(self):
+        """
+        Returns:
+            ProcessPoolExecutor: A worker pool using the spawn context.
+        """
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+
+    def _replace_pool(self, broken):
+        """
+        Replace the worker pool after a worker died (e.g. killed for using
+        too much memory), which breaks the pool for every later submission.
+        Jobs running on the broken pool fail; waiting jobs are dispatched to
+        the new one. Must be called with the lock held.
+
+        Args:
+            broken (ProcessPoolExecutor): The pool that failed; nothing is
+                done if it was already replaced.
+        """
+        if broken is not self._executor:
+            return
+        print('Worker pool broken, starting a new one')
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+
+    def submit(self, file_id, chain, input_path, output_path, output_format='wav',
+               bit_depth=None, memory=0, threads=1, key=None):
+        """
+        Queue a render, or join the unfinished job rendering the same key.
+
+        Args:
+            file_id (str): Uploaded file identifier.
+            chain (list[tuple]): ``(effect_name, parameters)`` pairs to apply.
+            input_path (str): Path to the uploaded file.
+            output_path (str): Path of the processed file to write.
+            output_format (str): 'wav', 'flac' or 'opus'.
+            bit_depth (int): Bit depth of lossless formats (default 16).
+            memory (int): Estimated peak memory of the render, in bytes.
+            threads (int): Threads rendering the job's segments.
+            key (str): Identifier of the result (e.g. its cache key); an
+                unfinished job with the same key is returned instead of
+                queuing a new one.
+
+        Returns:
+            Job: The queued (or joined) job.
+
+        Raises:
+            QueueFullError: If too many jobs are already waiting or running.
+        """
+        with self._lock:
+            self._prune()
+            job = self.pending(key)
+            if job is not None:
+                job.waiters += 1
+                return job
+
+            job = Job(str(uuid.uuid4()), file_id, chain, os.path.basename(output_path))
+            job.input_path = input_path
+            job.output_path = output_path
+            job.output_format = output_format
+            job.bit_depth = bit_depth
+            job.memory = int(memory)
+            job.threads = int(threads)
+            job.key = key
+            job.task = (run_job, (job.job_id, input_path, output_path, chain), {
+                'output_format': output_format, 'bit_depth': bit_depth,
+                'threads': job.threads,
+            })
+            return self._enqueue(job)
+
+    def _enqueue(self, job):
+        """
+        Queue a job for admission. Must be called with the lock held.
+
+        Raises:
+            QueueFullError: If too many jobs are already waiting or running.
+        """
+        if len(self._waiting) + len(self._running) >= self.max_queued:
+            raise QueueFullError('Too many jobs in progress, try again later',
+                                 self.retry_after())
+
+        self._ensure_pool()
+        job.future = Future()
+        job.future.add_done_callback(lambda _, job=job: self._on_job_done(job))
+        self._shared[job.job_id] = {'done': 0, 'total': 0, 'running': False}
+        self.jobs[job.job_id] = job
+        self._waiting.append(job)
+        self._dispatch()
+        return job
+
+    def pending(self, key):
+        """
+        Look up the unfinished job rendering a result.
+
+        Args:
+            key (str): Identifier of the result, or None.
+
+        Returns:
+            Job or None: A queued or running job that was not asked to stop.
+        """
+        if key is None:
+            return None
+        with self._lock:
+            return next((
+                job for job in self.jobs.values()
+                if job.key == key and not job.done and not job.cancel_requested
+            ), None)
+
+    def release(self, job):
+        """
+        Stop waiting for a job (e.g. its client went away). The job is
+        cancelled once no request waits for it any more.
+
+        Args:
+            job (Job): A job returned by ``submit``.
+        """
+        with self._lock:
+            job.waiters -= 1
+            abandoned = job.waiters <= 0
+        if abandoned:
+            job.future.cancel()
+
+    def _dispatch(self):
+        """
+        Hand waiting jobs to the pool, in order, while a worker is free and
+        the next job fits in the memory budget. A job larger than the whole
+        budget runs alone. Must be called with the lock held.
+        """
+        while self._waiting and len(self._running) < self.max_workers:
+            job = self._waiting[0]
+            if self._running and self._memory_in_use + job.memory > self.memory_budget:
+                break
+            self._waiting.popleft()
+            self._running.add(job)
+            self._memory_in_use += job.memory
+            job.started_at = time.time()
+            function, args, kwargs = job.task
+            executor = self._executor
+            try:
+                job.worker_future = executor.submit(
+                    function, *args, shared=self._shared, **kwargs
+                )
+            except BrokenProcessPool:
+                # Retry the job on a new pool
+                self._running.discard(job)
+                self._memory_in_use -= job.memory
+                self._waiting.appendleft(job)
+                self._replace_pool(executor)
+                continue
+            except Exception as e:
+                self._running.discard(job)
+                self._memory_in_use -= job.memory
+                self._resolve(job.future, exception=e)
+                continue
+            job.executor = executor
+            job.worker_future.add_done_callback(
+                lambda worker_future, job=job: self._on_worker_done(job, worker_future)
+            )
+
+    def _on_worker_done(self, job, worker_future):
+        """
+        Release the memory of a finished render, admit the next jobs and
+        pass the result on to ``job.future``. A render failed by a broken
+        pool replaces the pool first.
+        """
+        broken = (not worker_future.cancelled()
+                  and isinstance(worker_future.exception(), BrokenProcessPool))
+        with self._lock:
+            if broken and self._executor is not None:
+                self._replace_pool(job.executor)
+            if job in self._running:
+                self._running.discard(job)
+                self._memory_in_use -= job.memory
+                duration = time.time() - job.started_at
+                self._average_duration = (
+                    duration if self._average_duration is None
+                    else 0.8 * self._average_duration + 0.2 * duration
+                )
+            if self._executor is not None:
+                self._dispatch()
+
+        try:
+            job.timings = self._shared.get(job.job_id, {}).get('timings')
+        except Exception:
+            # The shared state is gone once the manager has shut down
+            pass
+
+        if worker_future.cancelled():
+            self._resolve(job.future, cancel=True)
+        elif worker_future.exception() is not None:
+            self._resolve(job.future, exception=worker_future.exception())
+        else:
+            self._resolve(job.future, result=worker_future.result())
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None, cancel=False):
+        """
+        Complete ``future`` unless it has already been cancelled.
+        """
+        try:
+            if cancel:
+                future.cancel()
+            elif exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _on_job_done(self, job):
+        """
+        Record the end of a job; a job cancelled through its future (e.g. by
+        a client that went away) is dropped from the queue or stopped.
+        """
+        job.finished_at = time.time()
+        if job.future.cancelled():
+            self._stop(job)
+
+    def _stop(self, job):
+        """
+        Drop a job from the queue, or ask its worker to stop.
+
+        Returns:
+            bool: True if the job had not started yet.
+        """
+        with self._lock:
+            if job in self._waiting:
+                self._waiting.remove(job)
+                return True
+        if job.worker_future is not None and not job.worker_future.cancel():
+            self._shared[cancel_key(job.job_id)] = True
+        return False
+
+    def retry_after(self):
+        """
+        Returns:
+            int: Seconds after which a client refused because the queue was
+            full should try again: the average render time, or
+            ``Config.RETRY_AFTER`` before any render has finished.
+        """
+        if self._average_duration is None:
+            return Config.RETRY_AFTER
+        return max(1, math.ceil(self._average_duration))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Running and waiting jobs and the memory they reserve.
+        """
+        with self._lock:
+            return {
+                'running': len(self._running),
+                'waiting': len(self._waiting),
+                'memory_in_use': self._memory_in_use,
+                'memory_budget': self.memory_budget,
+            }
+
+    def free_slots(self):
+        """
+        Returns:
+            int: Number of jobs that can be submitted before the queue is full.
+        """
+        with self._lock:
+            self._prune()
+            return max(0, self.max_queued - len(self._waiting) - len(self._running))
+
+    def prepare(self, file_id, input_path, analysis_settings=(), memory=0):
+        """
+        Decode an upload and compute its STFT analyses in a worker, so that
+        renders submitted afterwards only map them. The preparation is
+        queued and admitted like a render.
+
+        Args:
+            file_id (str): Uploaded file identifier.
+            input_path (str): Path to the uploaded file.
+            analysis_settings (iterable[tuple]): ``(n_fft, hop_length, window)``
+                analyses to compute.
+            memory (int): Estimated peak memory of the preparation, in bytes.
+
+        Returns:
+            concurrent.futures.Future: Resolves when the upload is prepared.
+
+        Raises:
+            QueueFullError: If too many jobs are already waiting or running.
+        """
+        with self._lock:
+            self._prune()
+            job = Job(str(uuid.uuid4()), file_id, [], None)
+            job.input_path = input_path
+            job.memory = int(memory)
+            job.task = (prepare_input, (job.job_id, input_path, list(analysis_settings)), {})
+            return self._enqueue(job).future
+
+    def completed(self, file_id, chain, output_path):
+        """
+        Record a job whose result already exists (e.g. a cache hit).
+
+        Args:
+            file_id (str): Uploaded file identifier.
+            chain (list[tuple]): ``(effect_name, parameters)`` pairs.
+            output_path (str): Path of the existing processed file.
+
+        Returns:
+            Job: A finished job.
+        """
+        with self._lock:
+            self._prune()
+            job = Job(str(uuid.uuid4()), file_id, chain, os.path.basename(output_path))
+            job.future = Future()
+            job.output_path = output_path
+            job.future.set_result(output_path)
+            job.finished_at = time.time()
+            job.cached = True
+            self.jobs[job.job_id] = job
+            return job
+
+    def get(self, job_id):
+        """
+        Look up a job.
+
+        Args:
+            job_id (str): Job identifier.
+
+        Returns:
+            Job or None: The job, if known.
+        """
+        return self.jobs.get(job_id)
+
+    def in_use(self):
+        """
+        Paths read or written by queued or running jobs. A cancelled job
+        keeps its paths until its worker has stopped.
+
+        Returns:
+            set[str]: Input and output paths.
+        """
+        with self._lock:
+            jobs = list(self._waiting) + list(self._running)
+        return {
+            path for job in jobs
+            for path in (job.input_path, job.output_path) if path
+        }
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are dropped immediately, running jobs stop
+        at the next chunk boundary.
+
+        Args:
+            job_id (str): Job identifier.
+
+        Returns:
+            bool: False if the job had already finished.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel_requested = True
+        if self._stop(job):
+            job.future.cancel()
+        return True
+
+    def status(self, job):
+        """
+        Describe a job for the API.
+
+        Args:
+            job (Job): The job.
+
+        Returns:
+            dict: Job id, state, progress and error (if any).
+        """
+        progress = self._shared.get(job.job_id, {}) if self._shared is not None else {}
+        error = None
+
+        if job.future.cancelled():
+            state = 'cancelled'
+        elif job.future.done():
+            exc = job.future.exception()
+            if exc is None:
+                state = 'done'
+            elif isinstance(exc, JobCancelled):
+                state = 'cancelled'
+            else:
+                state = 'failed'
+                error = str(exc)
+        elif job.cancel_requested:
+            state = 'cancelling'
+        elif progress.get('running'):
+            state = 'running'
+        else:
+            state = 'queued'
+
+        with self._lock:
+            waiting = list(self._waiting)
+        return {
+            'job_id': job.job_id,
+            'file_id': job.file_id,
+            'effect': job.effect,
+            'chain': [{'effect': name, 'params': params} for name, params in job.chain],
+            'status': state,
+            'cached': job.cached,
+            'progress': {
+                'chunks_done': progress.get('done', 0),
+                'chunks_total': progress.get('total', 0),
+            },
+            'queue_position': waiting.index(job) + 1 if job in waiting else None,
+            'memory_estimate_mb': round(job.memory / (1024 * 1024), 1),
+            'timings': job.timings,
+            'error': error,
+        }
+
+    def _prune(self):
+        """
+        Forget finished jobs older than ``Config.JOB_TTL`` seconds.
+        """
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.done and job.finished_at and now - job.finished_at > Config.JOB_TTL
+            and job not in self._running
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+            if self._shared is not None:
+                self._shared.pop(job_id, None)
+                self._shared.pop(cancel_key(job_id), None)
+
+    def shutdown(self):
+        """
+        Stop the worker pool, cancelling queued jobs.
+        """
+        with self._lock:
+            waiting = list(self._waiting)
+            self._waiting.clear()
+        for job in waiting:
+            job.future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+            self._executor = None
+
+
+_processor = None
+
+
+def _get_processor():
+    """
+    Return the per-process AudioProcessor, creating it on first use.
+    """
+    global _processor
+    if _processor is None:
+        from audio_processor import AudioProcessor
+        from storage import AnalysisCache, DecodedAudioCache
+        directory = os.path.join(Config.TEMP_AUDIO_PATH, 'decoded')
+        _processor = AudioProcessor(
+            decoded_cache=DecodedAudioCache(directory),
+            analysis_cache=AnalysisCache(directory)
+        )
+    return _processor
+
+
+def prepare_input(job_id, input_path, analysis_settings, shared):
+    """
+    Worker entry point: fill the decoded-audio and analysis caches of an
+    upload.
+
+    Args:
+        job_id (str): Job identifier.
+        input_path (str): Path to the uploaded file.
+        analysis_settings (list[tuple]): ``(n_fft, hop_length, window)``
+            analyses to compute.
+        shared (DictProxy): Shared progress / cancellation state.
+
+    Raises:
+        JobCancelled: If the job was cancelled between two analyses.
+    """
+    processor = _get_processor()
+    if not analysis_settings:
+        blocks, _, _ = processor.stream_audio(input_path)
+        for _ in blocks:
+            pass
+    for settings in analysis_settings:
+        if shared.get(cancel_key(job_id)):
+            raise JobCancelled(f'Job {job_id} cancelled')
+        processor.analyze(input_path, *settings)
+
+
+def cancel_key(job_id):
+    """
+    Args:
+        job_id (str): Job identifier.
+
+    Returns:
+        tuple: Key of the job's cancellation flag in the shared state. The
+        flag is kept apart from the progress entry, which only the worker
+        writes, so that a progress update never drops a cancellation.
+    """
+    return (job_id, 'cancel')
+
+
+def partial_output_path(output_path, job_id):
+    """
+    Args:
+        output_path (str): Path of a processed file.
+        job_id (str): Identifier of the job writing it.
+
+    Returns:
+        str: Path the file is written to while its job runs (one per job,
+        so that renders of the same result never write the same file).
+    """
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.{job_id}.part{ext}"
+
+
+def run_job(job_id, input_path, output_path, chain, shared, output_format='wav',
+            bit_depth=None, threads=1):
+    """
+    Worker entry point: render one job and write the result.
+
+    Args:
+        job_id (str): Job identifier.
+        input_path (str): Path to the uploaded file.
+        output_path (str): Path of the processed file to write.
+        chain (list[tuple]): ``(effect_name, parameters)`` pairs to apply.
+        shared (DictProxy): Shared progress / cancellation state.
+        output_format (str): 'wav', 'flac' or 'opus'.
+        bit_depth (int): Bit depth of lossless formats (default 16).
+        threads (int): Threads rendering segments in parallel.
+
+    Returns:
+        str: The output path. The stage timings of the render are left in
+        ``shared[job_id]['timings']``.
+
+    Raises:
+        JobCancelled: If the job was cancelled while running.
+    """
+    processor = _get_processor()
+    timer = StageTimer()
+
+    def report(done, total):
+        if shared.get(cancel_key(job_id)):
+            raise JobCancelled(f'Job {job_id} cancelled')
+        state = dict(shared.get(job_id, {}))
+        state.update(done=done, total=total, running=True)
+        shared[job_id] = state
+
+    report(0, 0)
+    blocks, sample_rate, output_gain = processor.render_chain(
+        input_path, chain, progress_callback=report, threads=threads, timer=timer
+    )
+    # Encoded while rendering, next to the target, and renamed at the end:
+    # the partial file can be streamed while it grows, and readers of the
+    # target never see a partial file. The waveform envelope is built from
+    # the same blocks.
+    partial_path = partial_output_path(output_path, job_id)
+    peaks = PeakBuilder(sample_rate)
+    try:
+        processor.write_blocks(
+            blocks, sample_rate, partial_path, output_format, bit_depth,
+            output_gain=output_gain, observers=[peaks], timer=timer
+        )
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    peaks.finish().save(envelope_path(
+        os.path.dirname(output_path), os.path.splitext(os.path.basename(output_path))[0]
+    ))
+    os.replace(partial_path, output_path)
+
+    state = dict(shared.get(job_id, {}))
+    state['timings'] = timer.breakdown()
+    shared[job_id] = state
+    return output_path
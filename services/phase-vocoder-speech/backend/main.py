@@ -1,16 +1,40 @@
+import asyncio
+import json
 import os
-import shutil
+import time
 import uuid
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+import soundfile as sf
 
 from audio_processor import AudioProcessor
 from config import Config
+from jobs import JobManager, JobCancelled, QueueFullError, partial_output_path
+from metrics import RenderMetrics, StageTimer
+from pipeline.encoder import OUTPUT_FORMATS, encoding_name, output_encoding
+from pipeline.live import LiveSession
+from pipeline.peaks import FIELDS, PeakBuilder, PeakEnvelope, envelope_path
+from pipeline.spectrogram import SCALES, SpectrogramBuilder
+from storage import (
+    ResultCache,
+    DecodedAudioCache,
+    AnalysisCache,
+    SpectrogramCache,
+    UploadRegistry,
+    UploadSessionStore,
+    UploadTooLargeError,
+    UploadOffsetError,
+    MultipartFileReader,
+    save_stream,
+    StorageJanitor,
+    canonical_parameters,
+    file_digest
+)
 
 app = FastAPI(title="Phase Vocoder Speech API")
 
@@ -31,16 +55,112 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize AudioProcessor
-audio_processor = AudioProcessor()
-
 # Ensure directories exist
 Config.ensure_directories()
 
+# Index of uploads (path, header, hash), reconciled with the directory on start
+upload_registry = UploadRegistry(os.path.join(Config.TEMP_AUDIO_PATH, 'uploads.db'))
+upload_registry.sync(os.path.join(Config.TEMP_AUDIO_PATH, 'uploaded'))
+
+# Partial uploads of resumable sessions
+upload_sessions = UploadSessionStore(os.path.join(Config.TEMP_AUDIO_PATH, 'incoming'))
+
+# Decoded uploads are kept as memory-mapped sidecars; drop those left behind
+decoded_cache = DecodedAudioCache(os.path.join(Config.TEMP_AUDIO_PATH, 'decoded'))
+decoded_cache.prune_orphans(os.path.join(Config.TEMP_AUDIO_PATH, 'uploaded'))
+
+# STFT analyses are stored with the decoded sidecars and shared by effects
+analysis_cache = AnalysisCache(os.path.join(Config.TEMP_AUDIO_PATH, 'decoded'))
+
+# Initialize AudioProcessor
+audio_processor = AudioProcessor(decoded_cache=decoded_cache, analysis_cache=analysis_cache)
+
+# Background workers for CPU-bound renders
+job_manager = JobManager()
+
+# Stage timings of requests and jobs, served on /metrics
+render_metrics = RenderMetrics()
+
+# Processed files are content-addressed: identical renders are served from disk
+result_cache = ResultCache(
+    os.path.join(Config.TEMP_AUDIO_PATH, 'processed'),
+    extensions=[spec['extension'] for spec in OUTPUT_FORMATS.values()],
+)
+
+# Spectrogram image tiles, keyed by audio content hash
+spectrogram_cache = SpectrogramCache(os.path.join(Config.TEMP_AUDIO_PATH, 'spectrograms'))
+
+def _stem(path):
+    return os.path.basename(path).split('.', 1)[0]
+
+def _forget_upload(file_id, paths):
+    upload_registry.remove(file_id)
+    for path in paths:
+        decoded_cache.remove(path)
+
+# Deletes expired / least-recently-used files, never those of running jobs
+storage_janitor = StorageJanitor(
+    {
+        kind: os.path.join(Config.TEMP_AUDIO_PATH, kind)
+        for kind in ('uploaded', 'decoded', 'processed', 'incoming', 'spectrograms')
+    },
+    is_protected=lambda kind, stem: stem in {_stem(p) for p in job_manager.in_use()},
+    on_remove={
+        'uploaded': _forget_upload,
+        'processed': lambda key, paths: result_cache.discard(key),
+    },
+)
+
+class EffectStep(BaseModel):
+    effect: str
+    params: dict = {}
+
 class ProcessRequest(BaseModel):
+    file_id: str
+    effect: Optional[str] = None
+    params: dict = {}
+    # Ordered effects rendered in one pass; takes precedence over effect/params
+    chain: Optional[List[EffectStep]] = None
+    # Output encoding: 'wav', 'flac' or 'opus', and the bit depth of
+    # lossless formats (16 by default; 24, or 32 for float WAV)
+    format: str = "wav"
+    bit_depth: Optional[int] = None
+
+    def steps(self):
+        if self.chain:
+            return [(step.effect, step.params) for step in self.chain]
+        if self.effect:
+            return [(self.effect, self.params)]
+        return []
+
+class BatchRequest(BaseModel):
     file_id: str
     effect: str
-    params: dict
+    # One parameter set per variant to render
+    variants: List[dict]
+    format: str = "wav"
+    bit_depth: Optional[int] = None
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None
+
+@app.on_event("startup")
+async def start_janitor():
+    async def run_periodically():
+        while True:
+            try:
+                await asyncio.to_thread(storage_janitor.run_once)
+            except Exception as e:
+                print(f"Storage janitor failed: {e}")
+            await asyncio.sleep(Config.JANITOR_INTERVAL)
+
+    app.state.janitor_task = asyncio.create_task(run_periodically())
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    app.state.janitor_task.cancel()
+    job_manager.shutdown()
 
 @app.get("/")
 async def root():
@@ -49,135 +169,937 @@ async def root():
         return FileResponse(os.path.join(frontend_dist, "index.html"))
     return {"message": "Audio Vocoder API is running (Frontend not built)"}
 
+def build_upload_peaks(input_path):
+    """
+    Build and store the waveform envelope of an upload (decoded signal).
+    """
+    envelope = audio_processor.peak_envelope(input_path)
+    envelope.save(envelope_path(os.path.join(Config.TEMP_AUDIO_PATH, 'decoded'), _stem(input_path)))
+    return envelope
+
+def _file_blocks(audio_path):
+    """
+    Mono float32 blocks of a processed file, read at its own sample rate.
+    """
+    info = sf.info(audio_path)
+    blocks = (
+        block.mean(axis=1) for block in sf.blocks(
+            audio_path, blocksize=int(Config.CHUNK_DURATION * info.samplerate),
+            dtype='float32', always_2d=True
+        )
+    )
+    return blocks, info.samplerate
+
+def build_file_peaks(audio_path):
+    """
+    Build and store the waveform envelope of a processed file.
+    """
+    blocks, sample_rate = _file_blocks(audio_path)
+    envelope = PeakBuilder(sample_rate).build(blocks)
+    envelope.save(envelope_path(os.path.dirname(audio_path), _stem(audio_path)))
+    return envelope
+
+def upload_spectrogram_key(upload, scale):
+    """
+    Spectrogram cache key of an upload (analyzed at the decoding rate).
+    """
+    sample_rate = min(upload["sample_rate"], Config.TARGET_SAMPLE_RATE)
+    return spectrogram_cache.key(upload["sha256"], sample_rate, scale, _spectrogram_height(scale))
+
+def _spectrogram_height(scale):
+    return Config.SPECTROGRAM_MEL_BANDS if scale == "mel" else Config.SPECTROGRAM_HEIGHT
+
+def build_upload_spectrogram(upload, scale):
+    """
+    Build and store the spectrogram tiles of an upload, from its shared
+    STFT analysis.
+    """
+    spectrogram = audio_processor.spectrogram(upload["path"], scale)
+    return spectrogram_cache.store(upload_spectrogram_key(upload, scale), spectrogram)
+
+def build_file_spectrogram(audio_path, scale):
+    """
+    Build and store the spectrogram tiles of a processed file in one
+    streaming pass. The file's result-cache key identifies its content.
+    """
+    blocks, sample_rate = _file_blocks(audio_path)
+    key = spectrogram_cache.key(
+        _stem(audio_path), sample_rate, scale, _spectrogram_height(scale)
+    )
+    manifest = spectrogram_cache.manifest(key)
+    if manifest is None:
+        manifest = spectrogram_cache.store(key, SpectrogramBuilder(sample_rate, scale=scale).build(blocks))
+    return manifest
+
+def _precompute_upload_views(upload):
+    try:
+        build_upload_peaks(upload["path"])
+        if spectrogram_cache.manifest(upload_spectrogram_key(upload, "linear")) is None:
+            build_upload_spectrogram(upload, "linear")
+    except Exception as e:
+        print(f"Could not build waveform / spectrogram of {upload['path']}: {e}")
+
+async def register_upload(file_id, upload_path, original_name, sha256):
+    """
+    Record a saved upload in the registry and build the API response.
+    Unreadable audio is deleted and rejected.
+    """
+    # Probe the header off the event loop; the hash was computed while saving
+    try:
+        record = await asyncio.to_thread(
+            upload_registry.register, file_id, upload_path, original_name, sha256
+        )
+    except IOError as e:
+        os.remove(upload_path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Decode in the background: fills the decoded sidecar, the envelope and
+    # the spectrogram tiles
+    asyncio.get_running_loop().run_in_executor(
+        None, _precompute_upload_views, record
+    )
+
+    return {
+        "file_id": file_id,
+        "filename": os.path.basename(upload_path),
+        "original_name": original_name,
+        "size": record["size"],
+        "sha256": record["sha256"],
+        "duration": record["duration"],
+        "rendered_duration": min(record["duration"], Config.MAX_RENDER_DURATION),
+        "sample_rate": record["sample_rate"],
+        "channels": record["channels"],
+        "warning": truncation_warning(record),
+    }
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(request: Request):
     """
-    Upload an audio file and return a file ID.
+    Upload an audio file (multipart form, ``file`` field) and return a
+    file ID.
+
+    The form is parsed as it is received, so oversized bodies are rejected
+    as soon as they cross the limit, with or without a Content-Length.
     """
-    if not Config.is_supported_format(file.filename):
+    # Reject from the header when the client announces an oversized body
+    # (small allowance for the multipart envelope)
+    content_length = request.headers.get("content-length")
+    try:
+        announced = int(content_length) if content_length else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if announced is not None and announced > Config.MAX_FILE_SIZE + Config.MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    try:
+        upload = MultipartFileReader(request.stream(), request.headers.get("content-type"))
+        original_name = await upload.read_filename()
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+
+    if not Config.is_supported_format(original_name):
         raise HTTPException(status_code=400, detail="Unsupported file format")
 
     file_id = str(uuid.uuid4())
-    ext = os.path.splitext(file.filename)[1]
+    ext = os.path.splitext(original_name)[1]
     filename = f"{file_id}{ext}"
     
-    # Save to uploaded directory
+    # Save to uploaded directory, in chunks, hashing on the fly
     upload_path = os.path.join(Config.TEMP_AUDIO_PATH, 'uploaded', filename)
+    partial_path = os.path.join(Config.TEMP_AUDIO_PATH, 'incoming', filename)
     
     try:
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with render_metrics.stage("upload"):
+            _, digest = await save_stream(upload.read(), partial_path)
+        os.replace(partial_path, upload_path)
+    except UploadTooLargeError as e:
+        os.remove(partial_path)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        os.remove(partial_path)
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
     except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
         raise HTTPException(status_code=500, detail=f"Could not save file: {str(e)}")
 
-    return {"file_id": file_id, "filename": filename, "original_name": file.filename}
+    return await register_upload(file_id, upload_path, original_name, digest.hexdigest())
 
+def get_session_or_404(upload_id):
+    session = upload_sessions.status(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
 
-@app.post("/process-json")
-async def process_audio_json(request: ProcessRequest):
+@app.post("/uploads", status_code=201)
+async def create_upload_session(request: UploadSessionRequest):
     """
-    Process audio using a previously uploaded file ID.
+    Start a resumable upload. Send the data with PUT /uploads/{upload_id}
+    in one or more chunks, then finish with POST /uploads/{upload_id}/complete.
     """
-    # Find the input file
-    uploaded_dir = os.path.join(Config.TEMP_AUDIO_PATH, 'uploaded')
-    input_filename = None
-    
-    # Look for file with this ID (ignoring extension knowledge if possible, or store extension map)
-    # A cleaner way is to look up the file in the dir
-    for f in os.listdir(uploaded_dir):
-        if f.startswith(request.file_id):
-            input_filename = f
-            break
-            
-    if not input_filename:
+    if not Config.is_supported_format(request.filename):
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+    try:
+        return upload_sessions.create(request.filename, request.size)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """
+    Get the number of bytes received so far (the offset to resume from).
+    """
+    return get_session_or_404(upload_id)
+
+@app.put("/uploads/{upload_id}")
+async def append_upload_chunk(upload_id: str, request: Request, offset: int = 0):
+    """
+    Append the raw request body at ``offset``.
+    """
+    get_session_or_404(upload_id)
+    try:
+        with render_metrics.stage("upload"):
+            return await upload_sessions.append(upload_id, offset, request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str):
+    """
+    Finish a resumable upload and register it like POST /upload.
+    """
+    session = get_session_or_404(upload_id)
+    file_id = str(uuid.uuid4())
+    ext = os.path.splitext(session["filename"])[1]
+    upload_path = os.path.join(Config.TEMP_AUDIO_PATH, 'uploaded', f"{file_id}{ext}")
+    try:
+        session, sha256 = await upload_sessions.complete(upload_id, upload_path)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return await register_upload(file_id, upload_path, session["filename"], sha256)
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """
+    Abort a resumable upload and delete the data received.
+    """
+    get_session_or_404(upload_id)
+    upload_sessions.discard(upload_id)
+    return {"upload_id": upload_id, "deleted": True}
+
+
+def truncation_warning(upload):
+    """
+    Warn about an upload longer than what is rendered: only its first
+    ``Config.MAX_RENDER_DURATION`` seconds are processed.
+
+    Returns:
+        str or None: The warning, None if the whole file is rendered.
+    """
+    if upload is None or upload["duration"] <= Config.MAX_RENDER_DURATION:
+        return None
+    return (f"Only the first {Config.MAX_RENDER_DURATION}s of this "
+            f"{upload['duration']:.0f}s file are processed")
+
+def find_upload(file_id):
+    """
+    Return the registry record of a previously uploaded file, or raise a 404.
+    """
+    record = upload_registry.get(file_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="File not found")
+    return record
 
-    input_path = os.path.join(uploaded_dir, input_filename)
-    
-    # Prepare output path
-    output_filename = f"processed_{request.file_id}_{request.effect}.wav"
-    output_path = os.path.join(Config.TEMP_AUDIO_PATH, 'processed', output_filename)
+@app.delete("/upload/{file_id}")
+async def delete_upload(file_id: str):
+    """
+    Delete an uploaded file and its decoded sidecars.
+    """
+    input_path = find_upload(file_id)["path"]
+    freed = os.path.getsize(input_path)
+    os.remove(input_path)
+    upload_registry.remove(file_id)
+    freed += decoded_cache.remove(input_path)
+    return {"file_id": file_id, "deleted": True, "bytes_freed": freed}
+
+def submit_job(request: ProcessRequest):
+    """
+    Queue a render for a ProcessRequest, mapping queue errors to HTTP errors.
+    """
+    chain = request.steps()
+    if not chain:
+        raise HTTPException(status_code=400, detail="No effect given")
+    if len(chain) > Config.MAX_CHAIN_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many effects ({len(chain)} > {Config.MAX_CHAIN_LENGTH})"
+        )
+    # Parameters are checked against the effects' schemas before anything is
+    # decoded; defaults are filled in so that they are part of the cache key
+    try:
+        chain = [
+            (effect_name, audio_processor.effects.validate(effect_name, params))
+            for effect_name, params in chain
+        ]
+        output_format, bit_depth = output_encoding(request.format, request.bit_depth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Finding the upload and the cached result is the 'lookup' stage
+    timer = StageTimer()
+    with timer.stage("lookup"):
+        upload = find_upload(request.file_id)
+    input_path = upload["path"]
+    # Mark as recently used for the janitor (atime only: mtime dates sidecars)
+    os.utime(input_path, (time.time(), os.path.getmtime(input_path)))
+
+    # Reject over-long inputs from the header, before anything is decoded
+    if upload["duration"] > Config.MAX_AUDIO_DURATION:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Audio too long ({upload['duration']:.0f}s > {Config.MAX_AUDIO_DURATION}s)"
+        )
+
+    # Output path is keyed by input content, effects, parameters and encoding
+    # (a single effect to 16-bit WAV keeps the key it had before chains and
+    # encodings existed)
+    if len(chain) == 1:
+        effect_key, params_key = chain[0]
+    else:
+        effect_key = "+".join(effect_name for effect_name, _ in chain)
+        params_key = [params for _, params in chain]
+    encoding = encoding_name(output_format, bit_depth)
+    with timer.stage("lookup"):
+        cache_key = result_cache.key(
+            input_path, effect_key, params_key, input_digest=upload["sha256"],
+            encoding=None if encoding == "wav-16" else encoding
+        )
+        cached_path = result_cache.get(cache_key)
+    render_metrics.observe(timer.breakdown())
+    if cached_path:
+        return job_manager.completed(request.file_id, chain, cached_path)
+
+    extension = OUTPUT_FORMATS[output_format]["extension"]
+    output_path = result_cache.path_for(cache_key, extension)
 
+    # Peak memory of the render, for the job manager's admission control
+    threads, memory = render_threads(chain, upload)
     try:
-        # Process
-        processed_audio, sample_rate = audio_processor.process_audio(
-            input_path, request.effect, request.params
+        job = job_manager.submit(
+            request.file_id, chain, input_path, output_path, output_format, bit_depth,
+            memory=memory, threads=threads, key=cache_key
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+    if job.waiters > 1:
+        # Joined the job already rendering this result
+        return job
+
+    def register(future):
+        if not future.cancelled() and future.exception() is None:
+            result_cache.add(cache_key, extension)
+        if job.timings:
+            render_metrics.observe(job.timings, job=True)
+
+    job.future.add_done_callback(register)
+    return job
+
+def render_threads(chain, upload):
+    """
+    Pick the number of render threads of a job: ``Config.RENDER_THREADS``,
+    fewer if the segments in flight would not fit in one worker's share of
+    the memory budget.
+
+    Returns:
+        tuple: (threads, estimated peak memory in bytes)
+    """
+    share = job_manager.memory_budget // max(1, job_manager.max_workers)
+    threads = max(1, Config.RENDER_THREADS)
+    while True:
+        memory = audio_processor.estimate_memory(
+            chain, upload["duration"], upload["sample_rate"], Config.MAX_RENDER_DURATION,
+            threads=threads
         )
-        # Save
-        audio_processor.save_audio(processed_audio, sample_rate, output_path)
+        if threads == 1 or memory <= share:
+            return threads, memory
+        threads -= 1
+
+async def wait_for_job(job):
+    """
+    Wait for a job submitted by this request. If the request is cancelled
+    (the client went away), the job is released: it stops unless another
+    request is waiting for it.
+
+    Raises:
+        JobCancelled: If the job itself was cancelled (e.g. DELETE /jobs).
+    """
+    try:
+        return await asyncio.shield(asyncio.wrap_future(job.future))
+    except asyncio.CancelledError:
+        if job.future.cancelled():
+            raise JobCancelled(f"Job {job.job_id} cancelled") from None
+        if not job.done:
+            job_manager.release(job)
+        raise
+
+def job_result(job):
+    return {
+        "processed_file_id": f"{job.file_id}_{job.effect}",
+        "url": f"/audio/processed/{job.output_filename}",
+        "timings": job.timings,
+        "warning": truncation_warning(upload_registry.get(job.file_id)),
+    }
+
+@app.post("/process-json")
+async def process_audio_json(request: ProcessRequest):
+    """
+    Process audio using a previously uploaded file ID.
+    The render runs in a worker process; this waits for it without blocking
+    other requests.
+    """
+    job = submit_job(request)
+
+    try:
+        await wait_for_job(job)
+    except JobCancelled:
+        raise HTTPException(status_code=409, detail="Processing cancelled")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        # raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
-        # For debugging detailed errors:
+        # For debugging detailed errors (includes the worker traceback):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+    return job_result(job)
+
+def check_batch_capacity(count):
+    """
+    Reject a batch with 503 unless the queue has room for ``count`` jobs.
+    """
+    if job_manager.free_slots() < count:
+        raise HTTPException(
+            status_code=503, detail="Too many jobs in progress, try again later",
+            headers={"Retry-After": str(job_manager.retry_after())}
+        )
+
+@app.post("/process-batch")
+async def process_batch(request: BatchRequest):
+    """
+    Render one effect with several parameter sets from a single decode.
+
+    The upload is decoded and analyzed once in a worker, then every variant
+    is queued as its own job: variants run in parallel on the worker pool
+    and only redo the synthesis. Returns a manifest with one entry per
+    variant, in request order.
+    """
+    effect = audio_processor.effects.get(request.effect)
+    if effect is None:
+        raise HTTPException(status_code=400, detail=f"Effect {request.effect} not available")
+    if not request.variants:
+        raise HTTPException(status_code=400, detail="No variant given")
+    try:
+        output_encoding(request.format, request.bit_depth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(request.variants) > Config.MAX_BATCH_VARIANTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many variants ({len(request.variants)} > {Config.MAX_BATCH_VARIANTS})"
+        )
+
+    # Variants are validated before the upload is decoded; identical
+    # parameter sets (once defaults are filled in) are rendered once
+    try:
+        variants = [effect.validate_parameters(params) for params in request.variants]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    unique = {}
+    for params in variants:
+        unique.setdefault(canonical_parameters(params), params)
+
+    upload = find_upload(request.file_id)
+    if upload["duration"] > Config.MAX_AUDIO_DURATION:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Audio too long ({upload['duration']:.0f}s > {Config.MAX_AUDIO_DURATION}s)"
+        )
+    check_batch_capacity(len(unique))
+
+    # The decode is queued and admitted like a render
+    settings = {effect.analysis_settings(**params) for params in unique.values()}
+    settings.discard(None)
+    memory = audio_processor.estimate_prepare_memory(
+        upload["duration"], upload["sample_rate"], settings
+    )
+    try:
+        prepared = job_manager.prepare(request.file_id, upload["path"], settings, memory)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+    try:
+        await asyncio.wrap_future(prepared)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode upload: {e}")
+
+    # Other requests may have filled the queue during the decode. Nothing is
+    # awaited from this check to the last submission, so either every
+    # variant is queued or none is.
+    check_batch_capacity(len(unique))
+    jobs = {}
+    try:
+        for key, params in unique.items():
+            jobs[key] = submit_job(ProcessRequest(
+                file_id=request.file_id, effect=request.effect, params=params,
+                format=request.format, bit_depth=request.bit_depth
+            ))
+    except HTTPException:
+        for job in jobs.values():
+            if not job.done:
+                job_manager.release(job)
+        raise
+    await asyncio.gather(
+        *(wait_for_job(job) for job in jobs.values()), return_exceptions=True
+    )
+
+    manifest = []
+    for params, validated in zip(request.variants, variants):
+        job = jobs[canonical_parameters(validated)]
+        status = job_manager.status(job)
+        entry = {"params": params, "job_id": job.job_id, "status": status["status"],
+                 "cached": job.cached}
+        if status["status"] == "done":
+            entry.update(job_result(job))
+        else:
+            entry["error"] = status["error"]
+        manifest.append(entry)
+
+    return {"file_id": request.file_id, "effect": request.effect, "variants": manifest}
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: ProcessRequest):
+    """
+    Queue a render and return its job ID immediately.
+    """
+    job = submit_job(request)
+    return dict(job_manager.status(job),
+                warning=truncation_warning(upload_registry.get(job.file_id)))
+
+def get_job_or_404(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Get the status and progress (chunks done / total) of a job.
+    """
+    return job_manager.status(get_job_or_404(job_id))
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job.
+    """
+    job = get_job_or_404(job_id)
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return job_manager.status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Get the processed file of a finished job.
+    """
+    job = get_job_or_404(job_id)
+    status = job_manager.status(job)
+    if status["status"] == "failed":
+        raise HTTPException(status_code=500, detail=status["error"])
+    if status["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+    return job_result(job)
+
+def _media_type(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return next(
+        (spec["media_type"] for spec in OUTPUT_FORMATS.values() if spec["extension"] == extension),
+        None
+    )
+
+def _streaming_wav_header(data):
+    """
+    Mark the sizes of a WAV header as unknown (0xFFFFFFFF), as players
+    expect for a stream. libsndfile only writes the real sizes when the
+    file is closed.
+
+    Returns:
+        bytearray or None: The patched bytes, None until the header up to
+        the data chunk has been received.
+    """
+    data = bytearray(data)
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return data
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = bytes(data[pos:pos + 4])
+        if chunk_id == b"data":
+            data[4:8] = b"\xff\xff\xff\xff"
+            data[pos + 4:pos + 8] = b"\xff\xff\xff\xff"
+            return data
+        pos += 8 + int.from_bytes(data[pos + 4:pos + 8], "little")
+    return None
+
+async def stream_job_output(job):
+    """
+    Yield the encoded output of a job while it is being written, then the
+    rest of the finished file.
+    """
+    paths = [partial_output_path(job.output_path, job.job_id), job.output_path]
+    f = None
+    pending = b""
+    is_wav = job.output_path.endswith(".wav")
+    try:
+        while True:
+            finished = job.done
+            if f is None:
+                for path in paths:
+                    try:
+                        f = open(path, "rb")
+                        break
+                    except OSError:
+                        pass
+            chunk = f.read(Config.STREAM_READ_SIZE) if f is not None else b""
+            if chunk:
+                if is_wav and pending is not None:
+                    header = _streaming_wav_header(pending + chunk)
+                    if header is None:
+                        pending += chunk
+                        continue
+                    chunk, pending = bytes(header), None
+                yield chunk
+                continue
+            if finished:
+                if pending:
+                    yield pending
+                break
+            await asyncio.sleep(Config.STREAM_POLL_INTERVAL)
+    finally:
+        if f is not None:
+            f.close()
+
+def job_stream_response(job):
+    """
+    Stream a job's output as it is rendered (the file itself once done).
+    """
+    if job.cached or (job.done and os.path.exists(job.output_path)):
+        return FileResponse(job.output_path, media_type=_media_type(job.output_filename))
+    return StreamingResponse(
+        stream_job_output(job),
+        media_type=_media_type(job.output_filename),
+        headers={"X-Job-Id": job.job_id, "Cache-Control": "no-store"},
+    )
+
+@app.post("/process-stream")
+async def process_audio_stream(request: ProcessRequest):
+    """
+    Process audio and stream the encoded output while it is rendered, so
+    playback can start after the first block. FLAC and Opus streams are
+    playable as received; WAV streams carry unknown sizes in their header.
+    The job ID is in the X-Job-Id header: check GET /jobs/{job_id} for
+    errors, since a failed render ends the stream early. Effects that
+    normalize the whole render (echo) only start streaming once rendered.
+    """
+    return job_stream_response(submit_job(request))
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Stream the output of a queued, running or finished job.
+    """
+    job = get_job_or_404(job_id)
+    status = job_manager.status(job)
+    if status["status"] in ("failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+    return job_stream_response(job)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Get result cache counters (hits, misses, evictions, size).
+    """
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Stage timing histograms and job queue gauges, in the Prometheus text
+    format.
+    """
+    stats = job_manager.stats()
+    gauges = [
+        ("vocoder_jobs_running", "Jobs rendering in a worker.", stats["running"]),
+        ("vocoder_jobs_waiting", "Jobs waiting for a worker or memory.", stats["waiting"]),
+        ("vocoder_memory_in_use_bytes", "Estimated memory of the running jobs.",
+         stats["memory_in_use"]),
+        ("vocoder_memory_budget_bytes", "Memory available to running jobs.",
+         stats["memory_budget"]),
+    ]
+    return Response(render_metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    """
+    Get disk usage per kind, quota and the files / bytes reclaimed so far.
+    """
+    return await asyncio.to_thread(storage_janitor.stats)
+
+@app.post("/storage/cleanup")
+async def run_storage_cleanup():
+    """
+    Run the storage janitor now and report what it reclaimed.
+    """
+    reclaimed = await asyncio.to_thread(storage_janitor.run_once)
+    return {"reclaimed": reclaimed}
+
+@app.websocket("/ws/live")
+async def live_stream(websocket: WebSocket):
+    """
+    Apply an effect to a live PCM stream.
+
+    Protocol:
+    - The client sends a JSON config first:
+      {"effect": ..., "params": {...}, "sample_rate": 48000, "format": "f32" | "s16"}
+      and receives {"type": "ready"} (or {"type": "error"} and a close).
+    - Each binary message is one mono PCM frame; the server answers each
+      one with exactly one binary message holding the processed samples.
+    - {"type": "end"} flushes the effect: the server sends the remaining
+      samples, then {"type": "summary"} with processing time percentiles,
+      and closes the socket.
+    """
+    await websocket.accept()
+    try:
+        config = await websocket.receive_json()
+        effect = audio_processor.effects.get(config.get("effect"))
+        if effect is None:
+            raise ValueError(f"Effect {config.get('effect')} not available")
+        session = LiveSession(
+            effect,
+            config.get("sample_rate", Config.TARGET_SAMPLE_RATE),
+            effect.validate_parameters(config.get("params") or {}),
+            config.get("format", "f32"),
+        )
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    await websocket.send_json({
+        "type": "ready", "effect": config["effect"], "sample_rate": session.sample_rate
+    })
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                try:
+                    # Off the event loop: spectral effects take a few ms per frame
+                    output = await asyncio.to_thread(session.process, message["bytes"])
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                    await websocket.close(code=1003)
+                    break
+                await websocket.send_bytes(output)
+            elif message.get("text") is not None:
+                try:
+                    command = json.loads(message["text"])
+                except ValueError:
+                    command = None
+                if not isinstance(command, dict) or command.get("type") != "end":
+                    await websocket.send_json({"type": "error", "detail": "Unknown command"})
+                    continue
+                await websocket.send_bytes(session.flush())
+                await websocket.send_json({"type": "summary", **session.summary()})
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/peaks/{kind}/{name}")
+async def get_peaks(kind: str, name: str, level: Optional[int] = None,
+                    width: Optional[int] = None, bits: int = 8, format: str = "json"):
+    """
+    Get the min / max / RMS waveform envelope of an uploaded or processed file.
+
+    kind: 'uploaded' (name is the file ID) or 'processed' (name is the
+    processed file name). Pick a zoom level directly, or give the drawing
+    width in pixels to get the coarsest level with at least that many rows.
+    Values are int8 (127 == full scale) or int16; format=binary returns the
+    rows as raw little-endian min/max/rms triplets.
+    """
+    stem = _stem(name)
+    if kind == "uploaded":
+        input_path = find_upload(stem)["path"]
+        path = envelope_path(os.path.join(Config.TEMP_AUDIO_PATH, 'decoded'), stem)
+        build = lambda: build_upload_peaks(input_path)
+    elif kind == "processed":
+        audio_path = result_cache.path_for(stem)
+        if not os.path.exists(audio_path):
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        path = envelope_path(os.path.dirname(audio_path), stem)
+        build = lambda: build_file_peaks(audio_path)
+    else:
+        raise HTTPException(status_code=400, detail="Invalid audio kind")
+
+    envelope = PeakEnvelope.load(path)
+    if envelope is None:
+        try:
+            envelope = await asyncio.to_thread(build)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Could not build envelope: {e}")
+
+    if level is None:
+        level = envelope.level_for_width(width) if width else 0
+    try:
+        rows = envelope.level(level, bits)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    header = {
+        "sample_rate": envelope.sample_rate,
+        "num_samples": envelope.num_samples,
+        "level": level,
+        "levels": len(envelope.levels),
+        "samples_per_bucket": envelope.bucket_size(level),
+        "bits": bits,
+    }
+    if format == "binary":
+        return Response(
+            content=rows.astype(rows.dtype.newbyteorder('<')).tobytes(),
+            media_type="application/octet-stream",
+            headers={f"X-Peaks-{k.replace('_', '-').title()}": str(v) for k, v in header.items()},
+        )
+    return {**header, **{field: rows[:, i].tolist() for i, field in enumerate(FIELDS)}}
+
+@app.get("/spectrogram/{kind}/{name}")
+async def get_spectrogram(kind: str, name: str, scale: str = "linear"):
+    """
+    Get the tile manifest of the spectrogram of an uploaded or processed file.
+
+    kind: 'uploaded' (name is the file ID) or 'processed' (name is the
+    processed file name). scale: 'linear' or 'mel'. Tiles are computed once
+    per audio content and settings; fetch them from tile_url, replacing
+    {level} (0 is the finest, each level halves the time resolution) and
+    {index}.
+    """
+    if scale not in SCALES:
+        raise HTTPException(status_code=400, detail=f"Unknown frequency scale {scale}")
+
+    stem = _stem(name)
+    if kind == "uploaded":
+        upload = find_upload(stem)
+        manifest = spectrogram_cache.manifest(upload_spectrogram_key(upload, scale))
+        build = lambda: build_upload_spectrogram(upload, scale)
+    elif kind == "processed":
+        audio_path = result_cache.path_for(stem)
+        if not os.path.exists(audio_path):
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        manifest = None
+        build = lambda: build_file_spectrogram(audio_path, scale)
+    else:
+        raise HTTPException(status_code=400, detail="Invalid audio kind")
+
+    if manifest is None:
+        try:
+            manifest = await asyncio.to_thread(build)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Could not build spectrogram: {e}")
+
     return {
-        "processed_file_id": f"{request.file_id}_{request.effect}",
-        "url": f"/audio/processed/{output_filename}"
+        **manifest,
+        "tile_url": f"/spectrogram/tiles/{manifest['key']}/{{level}}/{{index}}.png",
     }
 
+@app.get("/spectrogram/tiles/{key}/{level}/{tile}")
+async def get_spectrogram_tile(key: str, level: int, tile: str):
+    """
+    Get one PNG tile. Tiles never change for a given key, so they can be
+    cached by clients indefinitely.
+    """
+    index, ext = os.path.splitext(tile)
+    path = spectrogram_cache.tile_path(key, level, index) if (
+        spectrogram_cache.is_key(key) and ext == ".png" and index.isdigit()
+    ) else None
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    return FileResponse(
+        path,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
 @app.get("/audio/{kind}/{filename}")
-async def get_audio(kind: str, filename: str):
+async def get_audio(request: Request, kind: str, filename: str):
     """
     Serve audio files.
     kind: 'uploaded' or 'processed'
+
+    Range requests are supported so that players can seek. Files never
+    change under a given name, so responses carry a strong ETag and may be
+    cached by the client: the SHA-256 of an upload, or the result-cache key
+    of a processed file (which already hashes the input, effects and
+    encoding).
     """
     if kind not in ['uploaded', 'processed']:
         raise HTTPException(status_code=400, detail="Invalid audio kind")
-        
+
+    # Only plain file names inside the kind's directory
+    if os.path.basename(filename) != filename or filename.startswith('.') or '.part' in filename:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
     base_dir = os.path.join(Config.TEMP_AUDIO_PATH, kind)
     file_path = os.path.join(base_dir, filename)
-    
-    if not os.path.exists(file_path):
+
+    if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Audio file not found")
-        
-    return FileResponse(file_path)
+
+    if kind == "uploaded":
+        upload = upload_registry.get(_stem(filename))
+        digest = upload["sha256"] if upload else None
+    else:
+        digest = _stem(filename)
+    if digest is None:
+        digest = await asyncio.to_thread(file_digest, file_path)
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": Config.AUDIO_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(file_path, media_type=_media_type(filename), headers=headers)
 
 @app.get("/effects")
 async def get_effects():
     """
-    Get available effects and their default parameters.
+    Get available effects and their parameters (type, default, range), as
+    declared by the effect classes.
     """
-    # We need to expose effect metadata. 
-    # Since existing classes only have get_parameter_widgets (Streamlit specific),
-    # We should probably inspect them or just hardcode metadata for the frontend 
-    # or quick-patch the effect classes to return a param schema.
-    # For now, I'll return a hardcoded schema that matches the Python logic 
-    # to keep it simple, or I can read it dynamically if I improve the classes.
-    
-    return {
-        "effects": [
-            {
-                "id": "robot",
-                "name": "Robot",
-                "params": [
-                    {"name": "carrier_freq", "type": "number", "default": 30.0, "min": 10, "max": 200, "label": "Carrier Frequency"}
-                ]
-            },
-            {
-                "id": "pitch",
-                "name": "Pitch Shift",
-                "params": [
-                    {"name": "n_steps", "type": "number", "default": 4.0, "min": -12, "max": 12, "step": 1, "label": "Semitones"}
-                ]
-            },
-            {
-                "id": "speed",
-                "name": "Speed Change",
-                "params": [
-                    {"name": "speed_factor", "type": "number", "default": 1.5, "min": 0.5, "max": 2.0, "step": 0.1, "label": "Speed Factor"}
-                ]
-            },
-            {
-                "id": "echo",
-                "name": "Echo",
-                "params": [
-                    {"name": "delay", "type": "number", "default": 0.2, "min": 0.05, "max": 1.0, "label": "Delay (s)"},
-                    {"name": "decay", "type": "number", "default": 0.5, "min": 0.1, "max": 0.9, "label": "Decay"}
-                ]
-            }
-        ]
-    }
+    return {"effects": audio_processor.effects.describe()}
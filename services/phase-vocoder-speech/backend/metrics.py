@@ -0,0 +1,272 @@
+"""
+Render instrumentation.
+
+``StageTimer`` records the wall time, CPU time and resident memory growth
+of the stages of a request or render (upload, lookup, analysis, decode,
+resample, each effect, concatenate, encode). A job's breakdown is built
+in the worker and sent back with its progress; ``RenderMetrics`` aggregates
+breakdowns into Prometheus histograms, served as text on ``/metrics``.
+"""
+
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets: seconds (wall and CPU time) and bytes (RSS growth;
+# stages that release memory land in the first bucket)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 120.0)
+BYTES_BUCKETS = (0, 1 << 20, 4 << 20, 16 << 20, 64 << 20, 256 << 20, 1 << 30)
+
+# Stages of effects are named 'effect.<effect name>'
+EFFECT_STAGE = 'effect.'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def resident_memory():
+    """
+    Returns:
+        int: Resident set size of this process in bytes (the peak where
+        ``/proc`` is not available).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def effect_stage(effect_name):
+    """
+    Args:
+        effect_name (str): Name of an effect.
+
+    Returns:
+        str: Name of the stage timing that effect.
+    """
+    return f'{EFFECT_STAGE}{effect_name}'
+
+
+class StageTimer:
+    """
+    Accumulates wall time, CPU time and RSS growth per stage.
+
+    Stages nest: time spent in a stage entered while another one is running
+    is counted for the inner stage only. Streams of blocks are timed with
+    ``iterate``, so that pulling a block through a chain of generators
+    charges each generator for its own work. CPU time is the process's
+    (render threads included). A timer belongs to the thread that runs the
+    render or request; it is not thread-safe.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._stack = []
+        self._start = _sample()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code.
+
+        Args:
+            name (str): Stage name.
+        """
+        nested = [0.0, 0.0, 0]
+        self._stack.append(nested)
+        start = _sample()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            spent = [end - begin for end, begin in zip(_sample(), start)]
+            if self._stack:
+                parent = self._stack[-1]
+                for i, value in enumerate(spent):
+                    parent[i] += value
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            for i, value in enumerate(spent):
+                totals[i + 1] += value - nested[i]
+
+    def iterate(self, name, blocks):
+        """
+        Time the production of each item of an iterable.
+
+        Args:
+            name (str): Stage name.
+            blocks (iterable): Items to pass through.
+
+        Yields:
+            The items of ``blocks``.
+        """
+        iterator = iter(blocks)
+        while True:
+            with self.stage(name):
+                try:
+                    block = next(iterator)
+                except StopIteration:
+                    return
+            yield block
+
+    def breakdown(self):
+        """
+        Returns:
+            dict: ``{'total': {...}, 'stages': {name: {...}}}``. Each entry
+            has ``wall_seconds``, ``cpu_seconds`` and ``rss_delta_bytes``;
+            stages also have the number of timed ``calls``.
+        """
+        total = [end - begin for end, begin in zip(_sample(), self._start)]
+        return {
+            'total': _entry(*total),
+            'stages': {
+                name: dict(_entry(wall, cpu, rss), calls=calls)
+                for name, (calls, wall, cpu, rss) in self.stages.items()
+            },
+        }
+
+
+def _sample():
+    return time.perf_counter(), time.process_time(), resident_memory()
+
+
+def _entry(wall, cpu, rss):
+    return {'wall_seconds': round(wall, 6), 'cpu_seconds': round(cpu, 6),
+            'rss_delta_bytes': int(rss)}
+
+
+class Histogram:
+    """
+    Prometheus histogram with labeled series.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        """
+        Args:
+            name (str): Metric name.
+            documentation (str): HELP text.
+            buckets (tuple): Upper bounds, ascending (``+Inf`` is implied).
+        """
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Record one value.
+
+        Args:
+            value (float): Observed value.
+            **labels: Label values of the series.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """
+        Returns:
+            list[str]: Lines of the text exposition format.
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, list(counts), total, count)
+                            for key, (counts, total, count) in self._series.items())
+        for key, counts, total, count in series:
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in key)
+            bucket_labels = f'{labels},' if labels else ''
+            series_labels = f'{{{labels}}}' if labels else ''
+            for bound, cumulative in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{bucket_labels}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{bucket_labels}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{series_labels} {total}')
+            lines.append(f'{self.name}_count{series_labels} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RenderMetrics:
+    """
+    Stage histograms of every request and job since the API started.
+
+    Series are labeled by ``stage``; effect stages are labeled
+    ``stage="effect"`` with the effect name in ``effect``.
+    """
+
+    def __init__(self):
+        self.wall = Histogram('vocoder_stage_wall_seconds',
+                              'Wall time spent in a stage, per request or job.',
+                              SECONDS_BUCKETS)
+        self.cpu = Histogram('vocoder_stage_cpu_seconds',
+                             'CPU time spent in a stage, per request or job.',
+                             SECONDS_BUCKETS)
+        self.rss = Histogram('vocoder_stage_rss_delta_bytes',
+                             'Resident memory growth during a stage, per request or job.',
+                             BYTES_BUCKETS)
+        self.jobs = Histogram('vocoder_job_wall_seconds',
+                              'Wall time of a render job in its worker.',
+                              SECONDS_BUCKETS)
+
+    def observe(self, breakdown, job=False):
+        """
+        Record the stages of a ``StageTimer.breakdown``.
+
+        Args:
+            breakdown (dict): Breakdown of one request or job.
+            job (bool): True for a render job (its total is recorded too).
+        """
+        for name, entry in breakdown['stages'].items():
+            if name.startswith(EFFECT_STAGE):
+                labels = {'stage': 'effect', 'effect': name[len(EFFECT_STAGE):]}
+            else:
+                labels = {'stage': name}
+            self.wall.observe(entry['wall_seconds'], **labels)
+            self.cpu.observe(entry['cpu_seconds'], **labels)
+            self.rss.observe(entry['rss_delta_bytes'], **labels)
+        if job:
+            self.jobs.observe(breakdown['total']['wall_seconds'])
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code as a request stage of its own.
+
+        Args:
+            name (str): Stage name.
+        """
+        timer = StageTimer()
+        try:
+            with timer.stage(name):
+                yield
+        finally:
+            self.observe(timer.breakdown())
+
+    def render(self, gauges=()):
+        """
+        Args:
+            gauges (iterable[tuple]): Extra ``(name, documentation, value)``
+                gauges (e.g. queue length).
+
+        Returns:
+            str: Metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, documentation, value in gauges:
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge',
+                      f'{name} {value}']
+        for histogram in (self.wall, self.cpu, self.rss, self.jobs):
+            lines += histogram.render()
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,25 @@
+"""
+Streaming pipeline for the Audio Vocoder application.
+
+Contains the building blocks used to render audio block by block
+with bounded memory:
+- Streaming decoder (block reads, per-block downmix and resampling)
+- Streaming encoder (WAV / FLAC / Ogg Opus, block by block)
+- Polyphase resampler (rational ratio, filter state carried across blocks)
+- STFT analysis (streaming, or replayed from a precomputed analysis)
+- Phase vocoder (float32 STFT time stretching with carried phase)
+- Chunk engine (stateful blocks, overlap-add with crossfades)
+- Buffer arena (work buffers reused from block to block)
+- Waveform envelopes (multi-resolution min / max / RMS)
+- Spectrogram images (log-magnitude, linear or mel, PNG tiles per zoom level)
+"""
+
+from .analysis import STFTAnalysis, STFTAnalyzer, AnalysisReader
+from .buffers import BufferArena
+from .chunk_engine import ChunkEngine
+from .decoder import StreamingDecoder
+from .encoder import StreamingEncoder, OUTPUT_FORMATS
+from .peaks import PeakBuilder, PeakEnvelope
+from .phase_vocoder import PhaseVocoder
+from .resampler import PolyphaseResampler, QUALITY_PRESETS
+from .spectrogram import Spectrogram, SpectrogramBuilder
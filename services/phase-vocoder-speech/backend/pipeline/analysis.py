@@ -0,0 +1,269 @@
+"""
+STFT analysis.
+
+Computes the short-time Fourier transform of a signal block by block, as
+magnitude and phase frames, and replays a precomputed analysis with the
+same interface so that it can be shared between effects and plots.
+"""
+
+import numpy as np
+
+from config import Config
+
+
+class STFTAnalysis:
+    """
+    Magnitude and phase of a whole signal's STFT, with its settings.
+
+    Frames are centered on multiples of the hop: the signal is zero-padded
+    by half a frame on each side, giving ``1 + num_samples // hop_length``
+    frames (the same layout as ``librosa.stft``).
+    """
+
+    def __init__(self, magnitude, phase, n_fft, hop_length, window, num_samples):
+        """
+        Args:
+            magnitude (np.ndarray): ``(frames, n_fft // 2 + 1)`` magnitudes.
+            phase (np.ndarray): ``(frames, n_fft // 2 + 1)`` phases (radians).
+            n_fft (int): Frame size.
+            hop_length (int): Hop size.
+            window (str): Window name.
+            num_samples (int): Length of the analyzed signal.
+        """
+        self.magnitude = magnitude
+        self.phase = phase
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.window = window
+        self.num_samples = num_samples
+
+    @property
+    def settings(self):
+        """
+        tuple: (n_fft, hop_length, window)
+        """
+        return self.n_fft, self.hop_length, self.window
+
+    @property
+    def num_frames(self):
+        """
+        int: Number of frames.
+        """
+        return len(self.magnitude)
+
+
+def num_frames(num_samples, hop_length):
+    """
+    Args:
+        num_samples (int): Signal length.
+        hop_length (int): Hop size.
+
+    Returns:
+        int: Number of centered STFT frames of the signal.
+    """
+    return 1 + num_samples // hop_length
+
+
+class STFTAnalyzer:
+    """
+    Streaming STFT.
+
+    Each call returns the frames whose input has fully arrived; the input
+    still needed by later frames is carried over.
+    """
+
+    def __init__(self, n_fft=None, hop_length=None, window='hann'):
+        """
+        Args:
+            n_fft (int): Frame size (default ``Config.STFT_N_FFT``).
+            hop_length (int): Hop size (default ``Config.STFT_HOP_LENGTH``).
+            window (str): Window name, as accepted by ``scipy.signal.get_window``.
+        """
+        self.n_fft = int(n_fft or Config.STFT_N_FFT)
+        self.hop = int(hop_length or Config.STFT_HOP_LENGTH)
+        self.window_name = window
+        self.bins = self.n_fft // 2 + 1
+        import scipy.signal
+
+        self.window = scipy.signal.get_window(window, self.n_fft).astype(np.float32)
+        self.reset()
+
+    @property
+    def settings(self):
+        """
+        tuple: (n_fft, hop_length, window)
+        """
+        return self.n_fft, self.hop, self.window_name
+
+    def reset(self):
+        """
+        Clear the state to start a new stream.
+        """
+        # Input in padded coordinates: signal sample i is at i + n_fft // 2
+        self._input = np.zeros(self.n_fft // 2, dtype=np.float32)
+        self._input_base = 0
+        self._consumed = 0
+        self._analyzed = 0
+
+    def _frames(self):
+        """
+        Analyze every frame whose input has fully arrived.
+        """
+        available = (self._input_base + len(self._input) - self.n_fft) // self.hop + 1
+        count = available - self._analyzed
+        if count <= 0:
+            empty = np.zeros((0, self.bins), dtype=np.float32)
+            return empty, empty
+
+        start = self._analyzed * self.hop - self._input_base
+        windows = np.lib.stride_tricks.sliding_window_view(self._input, self.n_fft)
+        frames = windows[start:start + (count - 1) * self.hop + 1:self.hop]
+        import scipy.fft
+
+        spectrum = scipy.fft.rfft(frames * self.window, axis=-1)
+        self._analyzed = available
+
+        # Input before the next frame is no longer needed
+        drop = self._analyzed * self.hop - self._input_base
+        if drop > 0:
+            self._input = self._input[drop:]
+            self._input_base += drop
+        return np.abs(spectrum), np.angle(spectrum)
+
+    def process(self, block):
+        """
+        Analyze one block.
+
+        Args:
+            block (np.ndarray): Mono input block.
+
+        Returns:
+            tuple: (magnitude, phase) float32 arrays of the new frames.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        self._input = np.concatenate([self._input, block])
+        self._consumed += len(block)
+        return self._frames()
+
+    def flush(self):
+        """
+        Finish the stream, treating the input after it as zero.
+
+        Returns:
+            tuple: (magnitude, phase) float32 arrays of the remaining frames.
+        """
+        end = (num_frames(self._consumed, self.hop) - 1) * self.hop + self.n_fft
+        missing = end - (self._input_base + len(self._input))
+        if missing > 0:
+            self._input = np.concatenate([self._input, np.zeros(missing, dtype=np.float32)])
+        frames = self._frames()
+        self.reset()
+        return frames
+
+    def analyze(self, blocks, magnitude=None, phase=None):
+        """
+        Analyze a whole stream.
+
+        Args:
+            blocks (iterable[np.ndarray]): Mono input blocks.
+            magnitude (np.ndarray): Optional preallocated output (e.g. a
+                memory map) with one row per frame; frames are written to it
+                as they are computed.
+            phase (np.ndarray): Same, for the phases.
+
+        Returns:
+            STFTAnalysis: The analysis.
+        """
+        mags, phases = [], []
+        written = 0
+
+        def store(frames):
+            nonlocal written
+            mag, ph = frames
+            if magnitude is not None:
+                magnitude[written:written + len(mag)] = mag
+                phase[written:written + len(ph)] = ph
+            else:
+                mags.append(mag)
+                phases.append(ph)
+            written += len(mag)
+
+        for block in blocks:
+            store(self.process(block))
+        consumed = self._consumed
+        store(self.flush())
+
+        if magnitude is None:
+            magnitude = np.concatenate(mags)
+            phase = np.concatenate(phases)
+        return STFTAnalysis(magnitude, phase, self.n_fft, self.hop, self.window_name, consumed)
+
+
+class AnalysisReader:
+    """
+    Replays a precomputed ``STFTAnalysis`` with the ``STFTAnalyzer``
+    interface: feeding blocks releases the frames they complete, without
+    computing any transform.
+    """
+
+    def __init__(self, analysis):
+        """
+        Args:
+            analysis (STFTAnalysis): Analysis of the signal that will be fed.
+        """
+        self.analysis = analysis
+        self.n_fft = analysis.n_fft
+        self.hop = analysis.hop_length
+        self.reset()
+
+    @property
+    def settings(self):
+        """
+        tuple: (n_fft, hop_length, window)
+        """
+        return self.analysis.settings
+
+    def reset(self):
+        """
+        Rewind to the first frame.
+        """
+        self._consumed = 0
+        self._analyzed = 0
+
+    def _frames(self, available):
+        available = min(available, self.analysis.num_frames)
+        start = self._analyzed
+        self._analyzed = max(self._analyzed, available)
+        return (
+            np.asarray(self.analysis.magnitude[start:self._analyzed], dtype=np.float32),
+            np.asarray(self.analysis.phase[start:self._analyzed], dtype=np.float32),
+        )
+
+    def process(self, block):
+        """
+        Args:
+            block (np.ndarray): Mono input block (only its length is used).
+
+        Returns:
+            tuple: (magnitude, phase) float32 arrays of the new frames.
+        """
+        self._consumed += len(block)
+        padded_end = self._consumed + self.n_fft // 2
+        return self._frames((padded_end - self.n_fft) // self.hop + 1)
+
+    def flush(self):
+        """
+        Returns:
+            tuple: (magnitude, phase) float32 arrays of the remaining frames.
+
+        Raises:
+            ValueError: If the stream length does not match the analysis.
+        """
+        if self._consumed != self.analysis.num_samples:
+            raise ValueError(
+                f'Analysis is for {self.analysis.num_samples} samples, '
+                f'got {self._consumed}'
+            )
+        frames = self._frames(self.analysis.num_frames)
+        self.reset()
+        return frames
@@ -0,0 +1,57 @@
+"""
+Reusable work buffers.
+
+Renders process the same block sizes over and over; allocating fresh arrays
+for every block makes the allocator map and fault in new pages each time.
+A ``BufferArena`` hands out named buffers that are allocated once and reused
+for every block of a render.
+"""
+
+import numpy as np
+
+
+class BufferArena:
+    """
+    Named, growable numpy buffers.
+
+    ``get`` returns a view of the buffer registered under a name, replacing
+    the buffer when a larger view is requested; buffers therefore settle at
+    the largest size a render needs.
+    A view stays valid until the next ``get`` of the same name; the caller
+    owning a name decides when its content may be overwritten.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.float32):
+        """
+        Args:
+            name (hashable): Buffer name.
+            shape (int or tuple): Shape of the view.
+            dtype (np.dtype): Element type.
+
+        Returns:
+            np.ndarray: Uninitialized C-contiguous view of ``shape``.
+        """
+        shape = (int(shape),) if np.isscalar(shape) else tuple(int(n) for n in shape)
+        size = int(np.prod(shape))
+        dtype = np.dtype(dtype)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or len(buffer) < size:
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+    @property
+    def nbytes(self):
+        """
+        int: Memory held by the buffers.
+        """
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def clear(self):
+        """
+        Release every buffer.
+        """
+        self._buffers.clear()
@@ -0,0 +1,326 @@
+"""
+Chunk engine for streaming audio renders.
+
+Feeds a signal to an effect block by block while keeping memory constant
+and making the output match a single-pass render as closely as the effect
+allows. Given an executor, the engine renders overlapping segments in
+parallel instead and stitches them back in order.
+"""
+
+from collections import deque
+
+import numpy as np
+
+from config import Config
+from .buffers import BufferArena
+
+# Room left in output buffers beyond the nominal output length of a block,
+# for effects whose output per block varies (phase vocoder latency)
+OUTPUT_MARGIN = 4 * Config.STFT_N_FFT
+
+# Largest shift (output samples) of a core to line it up with the tail of the
+# previous render before crossfading; covers half a period down to ~86 Hz
+ALIGN_LAG = Config.STFT_HOP_LENGTH // 2
+
+
+class ChunkEngine:
+    """
+    Streams audio blocks through an effect.
+
+    Stateful effects (``context_duration == 0``) receive consecutive blocks
+    and carry their own state, so the result is identical to a single pass.
+    STFT based effects receive each block with ``context_duration`` seconds
+    of surrounding input; the engine keeps only the central part of each
+    render and crossfades consecutive parts over the seam, shifting each
+    part by up to ``ALIGN_LAG`` samples so that the seam is in phase.
+
+    Stateful effects write each block into the same output buffer, so a
+    yielded block is only valid until the next one is requested.
+
+    In parallel mode (an executor is given and the effect declares a
+    ``segment_context``), each block is rendered on its own with a fresh
+    state and that much input on each side; up to ``workers`` segments are
+    in flight while the finished ones are stitched like overlapped blocks.
+    """
+
+    def __init__(self, effect, sample_rate, parameters,
+                 block_duration=None, crossfade_duration=None, analysis=None, arena=None,
+                 executor=None, workers=1):
+        """
+        Initialize the engine for one render.
+
+        Args:
+            effect (BaseEffect): Effect to apply.
+            sample_rate (int): Sample rate of the audio.
+            parameters (dict): Parameters of the effect.
+            block_duration (float): Block length in seconds
+                (default ``Config.CHUNK_DURATION``).
+            crossfade_duration (float): Seam crossfade in seconds
+                (default ``Config.CROSSFADE_DURATION``).
+            analysis (STFTAnalysis): Optional precomputed analysis of the
+                input, handed to effects that declare ``analysis_settings``.
+            arena (BufferArena): Arena holding the output buffer, shared by
+                the engines of a render (default: a private one).
+            executor (concurrent.futures.Executor): Pool rendering segments
+                in parallel (default: sequential render).
+            workers (int): Number of segments rendered at the same time.
+        """
+        if block_duration is None:
+            block_duration = Config.CHUNK_DURATION
+        if crossfade_duration is None:
+            crossfade_duration = Config.CROSSFADE_DURATION
+
+        self.effect = effect
+        self.sample_rate = sample_rate
+        self.parameters = parameters
+        self.analysis = analysis
+        self.arena = arena if arena is not None else BufferArena()
+        self.block_size = max(1, int(block_duration * sample_rate))
+        self.context = int(effect.context_duration * sample_rate)
+        self.ratio = effect.length_ratio(**parameters)
+
+        self.executor = None
+        self.workers = max(1, int(workers))
+        if executor is not None:
+            segment_context = effect.segment_context(**parameters)
+            if segment_context is not None:
+                self.executor = executor
+                self.context = int(segment_context * sample_rate)
+
+        # The crossfade runs inside the right context of the previous block
+        self.crossfade = min(
+            int(crossfade_duration * sample_rate * self.ratio),
+            int(self.context * self.ratio),
+        )
+        self.peak = 0.0
+
+    @property
+    def parallel(self):
+        """
+        bool: True if segments are rendered on the executor.
+        """
+        return self.executor is not None
+
+    def output_length(self, input_length):
+        """
+        Number of output samples a render of ``input_length`` samples produces,
+        not counting tails returned by ``flush``.
+
+        Args:
+            input_length (int): Number of input samples.
+
+        Returns:
+            int: Number of output samples.
+        """
+        return int(round(input_length * self.ratio))
+
+    def process(self, blocks):
+        """
+        Render an iterable of input blocks.
+
+        Args:
+            blocks (iterable[np.ndarray]): Mono input blocks of any size.
+
+        Yields:
+            np.ndarray: Output blocks (float32) in order, valid until the
+            next block is requested.
+        """
+        if self.parallel:
+            stream = self._process_parallel(blocks)
+        elif self.context:
+            stream = self._process_overlapped(blocks)
+        else:
+            stream = self._process_stateful(blocks)
+
+        for out in stream:
+            if len(out):
+                self.peak = max(self.peak, float(out.max()), -float(out.min()))
+                yield out
+
+    def _process_stateful(self, blocks):
+        """
+        Render blocks through ``process_block`` with carried state.
+        """
+        state = self.effect.init_state(self.sample_rate, **self.parameters)
+        if self.analysis is not None:
+            self.effect.use_analysis(state, self.analysis)
+        for block in blocks:
+            out = self.arena.get(
+                (id(self), 'out'), int(np.ceil(len(block) * self.ratio)) + OUTPUT_MARGIN
+            )
+            yield self.effect.process_block(
+                block, self.sample_rate, state, out=out, **self.parameters
+            )
+        yield self.effect.flush(self.sample_rate, state, **self.parameters)
+
+    def _process_overlapped(self, blocks):
+        """
+        Render blocks through ``apply`` with overlapping context windows.
+        """
+        block_size = self.block_size
+        context = self.context
+
+        # buffer = [history (<= context samples) | pending input]
+        buffer = np.zeros(0, dtype=np.float32)
+        history = 0
+        consumed = 0
+        previous_tail = None
+
+        def render(buffer, history, consumed, previous_tail):
+            pending = len(buffer) - history
+            core_in = min(block_size, pending)
+            right = min(context, pending - core_in)
+            segment = buffer[:history + core_in + right]
+
+            rendered = self.effect.apply(segment, self.sample_rate, **self.parameters)
+            core, previous_tail, _ = self._stitch(rendered, history, consumed, core_in,
+                                                  previous_tail)
+
+            keep = min(context, history + core_in)
+            buffer = buffer[history + core_in - keep:]
+            return core, buffer, keep, consumed + core_in, previous_tail
+
+        for block in blocks:
+            buffer = np.concatenate([buffer, np.asarray(block, dtype=np.float32)])
+            while len(buffer) - history >= block_size + context:
+                core, buffer, history, consumed, previous_tail = render(
+                    buffer, history, consumed, previous_tail
+                )
+                yield core
+
+        while len(buffer) - history > 0:
+            core, buffer, history, consumed, previous_tail = render(
+                buffer, history, consumed, previous_tail
+            )
+            yield core
+
+    def _process_parallel(self, blocks):
+        """
+        Render overlapping segments on the executor and stitch them in order.
+        """
+        block_size = self.block_size
+        context = self.context
+
+        # buffer holds the input from position buffer_start on; start is the
+        # position of the next segment's core
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_start = 0
+        start = 0
+        pending = deque()
+        previous_tail = None
+
+        def submit(end):
+            nonlocal buffer, buffer_start, start
+            core_in = min(block_size, end - start)
+            left = min(context, start)
+            right = min(context, end - start - core_in)
+            first = start - left - buffer_start
+            segment = buffer[first:first + left + core_in + right]
+            future = self.executor.submit(
+                self.effect.render_segment, segment, self.sample_rate, start - left,
+                **self.parameters
+            )
+            pending.append((future, segment, left, start, core_in))
+            start += core_in
+            # Keep the left context of the next segment
+            drop = start - context - buffer_start
+            if drop > 0:
+                buffer = buffer[drop:]
+                buffer_start += drop
+
+        def collect(last=False):
+            nonlocal previous_tail
+            future, segment, left, position, core_in = pending.popleft()
+            rendered = future.result()
+            core, previous_tail, end = self._stitch(rendered, left, position, core_in,
+                                                    previous_tail)
+            if not last:
+                return core
+            # Output past the nominal length of the last segment (e.g. an
+            # echo tail) ends the render
+            tail_start = max(end, int(round(len(segment) * self.ratio)))
+            return np.concatenate([core, rendered[tail_start:]])
+
+        for block in blocks:
+            buffer = np.concatenate([buffer, np.asarray(block, dtype=np.float32)])
+            while buffer_start + len(buffer) - start >= block_size + context:
+                submit(buffer_start + len(buffer))
+                while len(pending) > self.workers:
+                    yield collect()
+
+        end = buffer_start + len(buffer)
+        while start < end:
+            submit(end)
+            while len(pending) > self.workers:
+                yield collect()
+        while pending:
+            yield collect(last=len(pending) == 1)
+
+    def _stitch(self, rendered, left, start, core_in, previous_tail):
+        """
+        Cut the core of a segment render and crossfade it with the tail of
+        the previous one, after lining the two up (see ``_align``).
+
+        Args:
+            rendered (np.ndarray): Render of the segment.
+            left (int): Input samples of left context in the segment.
+            start (int): Input position of the core.
+            core_in (int): Input samples in the core.
+            previous_tail (np.ndarray): Tail of the previous render, or None.
+
+        Returns:
+            tuple: (core (np.ndarray), tail to crossfade with the next core,
+            end of the core in ``rendered`` (int))
+        """
+        out_start = int(round(start * self.ratio))
+        out_end = int(round((start + core_in) * self.ratio))
+        offset = int(round(left * self.ratio))
+        length = out_end - out_start
+
+        has_tail = previous_tail is not None and len(previous_tail)
+        if has_tail:
+            offset += _align(previous_tail, rendered, offset, length)
+        core = _fit(rendered[offset:offset + length], length)
+
+        if has_tail:
+            n = min(len(previous_tail), len(core))
+            fade_in = np.linspace(0.0, 1.0, n + 2, dtype=np.float32)[1:-1]
+            core[:n] = previous_tail[:n] * (1.0 - fade_in) + core[:n] * fade_in
+
+        end = offset + len(core)
+        return core, rendered[end:end + self.crossfade].astype(np.float32), end
+
+
+def _align(tail, rendered, offset, length):
+    """
+    Shift, within ``ALIGN_LAG`` samples, that best lines up
+    ``rendered[offset + shift:]`` with ``tail`` (normalized cross-correlation).
+    Renders that already agree keep a shift of 0, so exact effects are
+    unchanged; the shift never moves the core out of ``rendered``.
+    """
+    n = min(len(tail), length)
+    low = min(ALIGN_LAG, offset)
+    high = max(0, min(ALIGN_LAG, len(rendered) - offset - length))
+    if n == 0 or low + high == 0:
+        return 0
+    window = np.asarray(rendered[offset - low:offset + high + n], dtype=np.float64)
+    tail = np.asarray(tail[:n], dtype=np.float64)
+    products = np.correlate(window, tail, 'valid')
+    energy = np.cumsum(np.concatenate([[0.0], np.square(window)]))
+    norms = np.sqrt(np.maximum(energy[n:] - energy[:-n], 1e-20))
+    scores = products / norms
+    best = int(np.argmax(scores))
+    if scores[best] <= scores[low] * (1.0 + 1e-6) + 1e-12:
+        return 0
+    return best - low
+
+
+def _fit(data, length):
+    """
+    Copy ``data`` into a float32 array of exactly ``length`` samples,
+    zero-padding or truncating as needed.
+    """
+    out = np.zeros(length, dtype=np.float32)
+    n = min(length, len(data))
+    out[:n] = data[:n]
+    return out
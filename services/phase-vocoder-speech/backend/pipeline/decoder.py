@@ -0,0 +1,111 @@
+"""
+Streaming decoder.
+
+Reads an audio file block by block, downmixes each block to mono and
+resamples it to the target rate, so peak memory depends on the block size
+rather than on the length of the file.
+"""
+
+import numpy as np
+import soundfile as sf
+
+from config import Config
+from .resampler import PolyphaseResampler
+
+
+class StreamingDecoder:
+    """
+    Iterates over an audio file as mono float32 blocks at the target rate.
+
+    Only the frames within ``duration`` are read from disk.
+    """
+
+    def __init__(self, file_path, duration=None, target_sr=None, block_duration=None,
+                 quality=None, timer=None):
+        """
+        Open the file and read its header.
+
+        Args:
+            file_path (str): Path to the audio file.
+            duration (float): Max duration in seconds to decode
+                (default ``Config.MAX_RENDER_DURATION``).
+            target_sr (int): Output sample rate upper bound
+                (default ``Config.TARGET_SAMPLE_RATE``). Files at a lower
+                rate are not upsampled.
+            block_duration (float): Source block length in seconds
+                (default ``Config.CHUNK_DURATION``).
+            quality (str): Resampler quality preset
+                (default ``Config.RESAMPLE_QUALITY``).
+            timer (StageTimer): Optional timer of the 'resample' stage.
+
+        Raises:
+            IOError: If the file cannot be opened.
+        """
+        if duration is None:
+            duration = Config.MAX_RENDER_DURATION
+        if target_sr is None:
+            target_sr = Config.TARGET_SAMPLE_RATE
+        if block_duration is None:
+            block_duration = Config.CHUNK_DURATION
+
+        try:
+            info = sf.info(file_path)
+        except Exception as e:
+            raise IOError(f'Error loading audio: {str(e)}') from e
+
+        self.file_path = file_path
+        self.source_rate = info.samplerate
+        self.channels = info.channels
+        self.sample_rate = min(self.source_rate, target_sr)
+        self.frames = min(info.frames, int(duration * self.source_rate))
+        self.block_frames = max(1, int(block_duration * self.source_rate))
+        self.timer = timer
+
+        self.resampler = PolyphaseResampler(self.source_rate, self.sample_rate, quality)
+
+    @property
+    def num_samples(self):
+        """
+        int: Number of output samples the decoder produces.
+        """
+        return self.resampler.output_length(self.frames)
+
+    def __iter__(self):
+        """
+        Yields:
+            np.ndarray: Mono float32 blocks at ``sample_rate``.
+        """
+        blocks = self._read_blocks()
+        if self.resampler.passthrough:
+            return blocks
+        if self.timer is not None:
+            return self.timer.iterate('resample', self._resample_blocks(blocks))
+        return self._resample_blocks(blocks)
+
+    def _read_blocks(self):
+        """
+        Read and downmix source blocks, stopping at ``frames``.
+        """
+        with sf.SoundFile(self.file_path) as f:
+            remaining = self.frames
+            while remaining > 0:
+                block = f.read(min(self.block_frames, remaining), dtype='float32', always_2d=True)
+                if not len(block):
+                    break
+                remaining -= len(block)
+                if block.shape[1] > 1:
+                    yield block.mean(axis=1, dtype=np.float32)
+                else:
+                    yield block[:, 0]
+
+    def _resample_blocks(self, blocks):
+        """
+        Resample a block stream, carrying the filter history across blocks.
+        """
+        for block in blocks:
+            out = self.resampler.process(block)
+            if len(out):
+                yield out
+        out = self.resampler.flush()
+        if len(out):
+            yield out
@@ -0,0 +1,155 @@
+"""
+Streaming audio encoder.
+
+Writes rendered audio block by block as WAV, FLAC or Ogg Opus, so that a
+render never has to be encoded from a single in-memory buffer.
+"""
+
+import numpy as np
+import soundfile as sf
+
+from .resampler import PolyphaseResampler
+
+# Output formats: libsndfile container, file extension, media type and the
+# libsndfile subtype per bit depth (None for lossy codecs).
+# Opus only accepts a few sample rates; other rates are resampled up to the
+# nearest one.
+OUTPUT_FORMATS = {
+    'wav': {
+        'container': 'WAV', 'extension': '.wav', 'media_type': 'audio/wav',
+        'subtypes': {16: 'PCM_16', 24: 'PCM_24', 32: 'FLOAT'}, 'default_bit_depth': 16,
+    },
+    'flac': {
+        'container': 'FLAC', 'extension': '.flac', 'media_type': 'audio/flac',
+        'subtypes': {16: 'PCM_16', 24: 'PCM_24'}, 'default_bit_depth': 16,
+    },
+    'opus': {
+        'container': 'OGG', 'extension': '.opus', 'media_type': 'audio/ogg',
+        'subtypes': {None: 'OPUS'}, 'default_bit_depth': None,
+        'sample_rates': (8000, 12000, 16000, 24000, 48000),
+    },
+}
+
+
+def output_encoding(output_format='wav', bit_depth=None):
+    """
+    Validate an output format and fill in its default bit depth.
+
+    Args:
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        bit_depth (int): Bit depth for lossless formats (16, 24, or 32 for
+            float WAV); must be omitted for Opus.
+
+    Returns:
+        tuple: (output_format, bit_depth)
+
+    Raises:
+        ValueError: If the format or bit depth is not supported.
+    """
+    spec = OUTPUT_FORMATS.get(output_format)
+    if spec is None:
+        raise ValueError(
+            f"Unknown output format {output_format} (use {', '.join(OUTPUT_FORMATS)})"
+        )
+    if bit_depth is None:
+        bit_depth = spec['default_bit_depth']
+    if bit_depth not in spec['subtypes']:
+        depths = [str(d) for d in spec['subtypes'] if d is not None]
+        if not depths:
+            raise ValueError(f'{output_format} has no bit depth setting')
+        raise ValueError(f"{output_format} bit depth must be one of {', '.join(depths)}")
+    return output_format, bit_depth
+
+
+def encoding_name(output_format='wav', bit_depth=None):
+    """
+    Args:
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        bit_depth (int): Bit depth, or None for the format's default.
+
+    Returns:
+        str: Canonical name, e.g. 'wav-16', 'flac-24' or 'opus'.
+
+    Raises:
+        ValueError: If the format or bit depth is not supported.
+    """
+    output_format, bit_depth = output_encoding(output_format, bit_depth)
+    return output_format if bit_depth is None else f'{output_format}-{bit_depth}'
+
+
+class StreamingEncoder:
+    """
+    Encodes a mono stream into a file, one block at a time.
+
+    Usable as a context manager; ``close`` must be called to finish the
+    file (it flushes the resampler when the codec needs one).
+    """
+
+    def __init__(self, path, sample_rate, output_format='wav', bit_depth=None):
+        """
+        Open the output file.
+
+        Args:
+            path (str): Destination file.
+            sample_rate (int): Sample rate of the blocks that will be written.
+            output_format (str): One of ``OUTPUT_FORMATS``.
+            bit_depth (int): Bit depth, or None for the format's default.
+
+        Raises:
+            ValueError: If the format or bit depth is not supported.
+            IOError: If the file cannot be opened.
+        """
+        output_format, bit_depth = output_encoding(output_format, bit_depth)
+        spec = OUTPUT_FORMATS[output_format]
+
+        self.resampler = None
+        self.sample_rate = int(sample_rate)
+        rates = spec.get('sample_rates')
+        if rates and self.sample_rate not in rates:
+            target = next((rate for rate in rates if rate >= self.sample_rate), rates[-1])
+            self.resampler = PolyphaseResampler(self.sample_rate, target)
+            self.sample_rate = target
+
+        self.output_format = output_format
+        self.bit_depth = bit_depth
+        self.frames = 0
+        try:
+            self._file = sf.SoundFile(
+                path, 'w', self.sample_rate, 1,
+                subtype=spec['subtypes'][bit_depth], format=spec['container'],
+            )
+        except Exception as e:
+            raise IOError(f'Error opening {path} for writing: {str(e)}') from e
+
+    def write(self, block):
+        """
+        Encode one block.
+
+        Args:
+            block (np.ndarray): Mono float samples.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if self.resampler is not None:
+            block = self.resampler.process(block)
+        if len(block):
+            self._file.write(block)
+            self.frames += len(block)
+
+    def close(self):
+        """
+        Finish and close the file.
+        """
+        if self._file.closed:
+            return
+        if self.resampler is not None:
+            tail = self.resampler.flush()
+            if len(tail):
+                self._file.write(tail)
+                self.frames += len(tail)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,126 @@
+"""
+Live effect sessions.
+
+Processes a continuous stream of small PCM frames (e.g. from a microphone)
+through the stateful block interface of an effect, one frame at a time.
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+
+from config import Config
+
+# Wire formats: little-endian float32 or int16 PCM, mono
+FORMATS = {'f32': np.dtype('<f4'), 's16': np.dtype('<i2')}
+
+
+class LiveSession:
+    """
+    Stateful rendering of one live stream.
+
+    Every input frame produces exactly one output frame (possibly empty),
+    so clients can pair them to measure latency. Processing times of the
+    most recent frames are kept for the session summary.
+    """
+
+    def __init__(self, effect, sample_rate, parameters=None, sample_format='f32'):
+        """
+        Initialize the session.
+
+        Args:
+            effect (BaseEffect): Effect to apply. It must support streaming
+                with carried state (``context_duration == 0``).
+            sample_rate (int): Sample rate of the stream.
+            parameters (dict): Parameters of the effect.
+            sample_format (str): One of ``FORMATS``.
+
+        Raises:
+            ValueError: If the effect, sample rate or format is not supported.
+        """
+        if effect.context_duration:
+            raise ValueError('Effect does not support live streaming')
+        low, high = Config.LIVE_SAMPLE_RATE_RANGE
+        if not low <= int(sample_rate) <= high:
+            raise ValueError(f'Sample rate must be between {low} and {high} Hz')
+        if sample_format not in FORMATS:
+            raise ValueError(f'Unknown sample format {sample_format}')
+
+        self.effect = effect
+        self.sample_rate = int(sample_rate)
+        self.parameters = parameters or {}
+        self.dtype = FORMATS[sample_format]
+        self.state = effect.init_state(self.sample_rate, **self.parameters)
+        self.frames = 0
+        self.samples_in = 0
+        self.samples_out = 0
+        self.timings = deque(maxlen=Config.LIVE_TIMING_WINDOW)
+
+    def _decode(self, payload):
+        if len(payload) % self.dtype.itemsize:
+            raise ValueError('Frame size is not a whole number of samples')
+        samples = np.frombuffer(payload, dtype=self.dtype)
+        if len(samples) > Config.LIVE_MAX_FRAME_SAMPLES:
+            raise ValueError(f'Frames are limited to {Config.LIVE_MAX_FRAME_SAMPLES} samples')
+        if self.dtype.kind == 'i':
+            return samples.astype(np.float32) / 32768.0
+        return samples.astype(np.float32)
+
+    def _encode(self, samples):
+        if self.dtype.kind == 'i':
+            samples = np.clip(samples * 32768.0, -32768, 32767)
+        return np.asarray(samples).astype(self.dtype).tobytes()
+
+    def process(self, payload):
+        """
+        Process one input frame.
+
+        Args:
+            payload (bytes): PCM samples in the session format.
+
+        Returns:
+            bytes: Processed PCM samples in the same format.
+
+        Raises:
+            ValueError: If the frame is malformed or too large.
+        """
+        start = time.perf_counter()
+        block = self._decode(payload)
+        out = self.effect.process_block(block, self.sample_rate, self.state, **self.parameters)
+        encoded = self._encode(out)
+        self.timings.append(time.perf_counter() - start)
+
+        self.frames += 1
+        self.samples_in += len(block)
+        self.samples_out += len(out)
+        return encoded
+
+    def flush(self):
+        """
+        End the stream.
+
+        Returns:
+            bytes: Remaining output (e.g. an echo tail).
+        """
+        out = self.effect.flush(self.sample_rate, self.state, **self.parameters)
+        self.samples_out += len(out)
+        return self._encode(out)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Frame and sample counts and processing time percentiles (ms).
+        """
+        timings = np.array(self.timings) * 1000.0
+        percentiles = {}
+        if len(timings):
+            for p in (50, 95, 99):
+                percentiles[f'p{p}'] = round(float(np.percentile(timings, p)), 3)
+            percentiles['max'] = round(float(timings.max()), 3)
+        return {
+            'frames': self.frames,
+            'samples_in': self.samples_in,
+            'samples_out': self.samples_out,
+            'processing_ms': percentiles,
+        }
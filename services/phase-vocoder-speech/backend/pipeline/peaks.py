@@ -0,0 +1,238 @@
+"""
+Waveform peak envelopes.
+
+Reduces a signal to min / max / RMS values per bucket of samples, at
+several zoom levels, so that a waveform can be drawn without the PCM
+data. Envelopes are built in one streaming pass and stored as int16.
+"""
+
+import os
+import uuid
+
+import numpy as np
+
+from config import Config
+
+# Column order of the envelope arrays
+FIELDS = ('min', 'max', 'rms')
+
+
+def envelope_path(directory, stem):
+    """
+    Args:
+        directory (str): Directory of the envelope.
+        stem (str): Stem of the audio file it describes.
+
+    Returns:
+        str: Path of the envelope file.
+    """
+    return os.path.join(directory, f'{stem}.peaks.npz')
+
+
+class PeakEnvelope:
+    """
+    Multi-resolution min / max / RMS envelope.
+
+    Level 0 has one row per ``samples_per_bucket`` samples; each following
+    level merges ``factor`` rows of the previous one. Values are stored as
+    int16 full scale (32767 == 1.0), clipped to [-1, 1].
+    """
+
+    def __init__(self, levels, samples_per_bucket, factor, sample_rate, num_samples):
+        """
+        Args:
+            levels (list[np.ndarray]): ``(buckets, 3)`` int16 arrays, finest first.
+            samples_per_bucket (int): Samples per row at level 0.
+            factor (int): Rows merged from one level to the next.
+            sample_rate (int): Sample rate of the signal.
+            num_samples (int): Length of the signal.
+        """
+        self.levels = levels
+        self.samples_per_bucket = samples_per_bucket
+        self.factor = factor
+        self.sample_rate = sample_rate
+        self.num_samples = num_samples
+
+    def bucket_size(self, level):
+        """
+        Args:
+            level (int): Level index.
+
+        Returns:
+            int: Samples per row at ``level``.
+        """
+        return self.samples_per_bucket * self.factor ** level
+
+    def level_for_width(self, width):
+        """
+        Coarsest level that still has at least ``width`` rows.
+
+        Args:
+            width (int): Number of pixels to draw.
+
+        Returns:
+            int: Level index.
+        """
+        for level in range(len(self.levels) - 1, -1, -1):
+            if len(self.levels[level]) >= width:
+                return level
+        return 0
+
+    def level(self, level, bits=16):
+        """
+        Envelope rows of one level.
+
+        Args:
+            level (int): Level index.
+            bits (int): 16 for int16 values, 8 for int8 values (127 == 1.0).
+
+        Returns:
+            np.ndarray: ``(buckets, 3)`` min / max / RMS rows.
+
+        Raises:
+            ValueError: If the level or bit depth is not available.
+        """
+        if not 0 <= level < len(self.levels):
+            raise ValueError(f'Level must be between 0 and {len(self.levels) - 1}')
+        if bits == 16:
+            return self.levels[level]
+        if bits == 8:
+            return (self.levels[level] >> 8).astype(np.int8)
+        raise ValueError('bits must be 8 or 16')
+
+    def save(self, path):
+        """
+        Write the envelope to ``path`` (``.npz``), atomically.
+
+        Args:
+            path (str): Destination file.
+        """
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(partial_path, 'wb') as f:
+            np.savez(
+                f,
+                meta=np.array([self.samples_per_bucket, self.factor,
+                               self.sample_rate, self.num_samples], dtype=np.int64),
+                **{f'level{i}': rows for i, rows in enumerate(self.levels)}
+            )
+        os.replace(partial_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an envelope written by ``save``.
+
+        Args:
+            path (str): Envelope file.
+
+        Returns:
+            PeakEnvelope or None: The envelope, None if missing or unreadable.
+        """
+        try:
+            with np.load(path) as data:
+                samples_per_bucket, factor, sample_rate, num_samples = data['meta'].tolist()
+                count = sum(1 for name in data.files if name.startswith('level'))
+                levels = [data[f'level{i}'] for i in range(count)]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(levels, samples_per_bucket, factor, sample_rate, num_samples)
+
+
+class PeakBuilder:
+    """
+    Builds a ``PeakEnvelope`` from a stream of blocks.
+
+    Level 0 is reduced from the samples with vectorized reshapes; coarser
+    levels are reduced from level 0 (RMS from the mean square).
+    """
+
+    def __init__(self, sample_rate, samples_per_bucket=None, levels=None, factor=None):
+        """
+        Args:
+            sample_rate (int): Sample rate of the signal.
+            samples_per_bucket (int): Samples per row at level 0
+                (default ``Config.PEAKS_SAMPLES_PER_BUCKET``).
+            levels (int): Number of levels (default ``Config.PEAKS_LEVELS``).
+            factor (int): Rows merged per level (default ``Config.PEAKS_LEVEL_FACTOR``).
+        """
+        self.sample_rate = sample_rate
+        self.samples_per_bucket = samples_per_bucket or Config.PEAKS_SAMPLES_PER_BUCKET
+        self.num_levels = levels or Config.PEAKS_LEVELS
+        self.factor = factor or Config.PEAKS_LEVEL_FACTOR
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._rows = []
+        self._num_samples = 0
+
+    @staticmethod
+    def _reduce(samples, size):
+        """
+        min / max / mean square of consecutive groups of ``size`` samples.
+        """
+        groups = samples.reshape(-1, size)
+        return np.stack([
+            groups.min(axis=1), groups.max(axis=1), np.mean(np.square(groups), axis=1)
+        ], axis=1)
+
+    def process(self, block):
+        """
+        Add one block.
+
+        Args:
+            block (np.ndarray): Mono samples.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        self._num_samples += len(block)
+        if len(self._pending):
+            block = np.concatenate([self._pending, block])
+        whole = len(block) - len(block) % self.samples_per_bucket
+        if whole:
+            self._rows.append(self._reduce(block[:whole], self.samples_per_bucket))
+        self._pending = block[whole:].copy()
+
+    def finish(self):
+        """
+        Reduce the remaining samples and build the levels.
+
+        Returns:
+            PeakEnvelope: The envelope.
+        """
+        if len(self._pending):
+            self._rows.append(self._reduce(self._pending, len(self._pending)))
+        rows = (np.concatenate(self._rows) if self._rows
+                else np.zeros((0, 3), dtype=np.float32))
+
+        levels = [rows]
+        while len(levels) < self.num_levels and len(levels[-1]) > 1:
+            previous = levels[-1]
+            padded = -len(previous) % self.factor
+            if padded:
+                # Repeat the last row so that the final group is complete
+                previous = np.concatenate([previous, np.repeat(previous[-1:], padded, axis=0)])
+            groups = previous.reshape(-1, self.factor, 3)
+            levels.append(np.stack([
+                groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1),
+                groups[:, :, 2].mean(axis=1),
+            ], axis=1))
+
+        quantized = []
+        for level in levels:
+            values = level.copy()
+            values[:, 2] = np.sqrt(values[:, 2])
+            quantized.append(np.round(np.clip(values, -1.0, 1.0) * 32767).astype(np.int16))
+
+        return PeakEnvelope(quantized, self.samples_per_bucket, self.factor,
+                            self.sample_rate, self._num_samples)
+
+    def build(self, blocks):
+        """
+        Build the envelope of a whole stream.
+
+        Args:
+            blocks (iterable[np.ndarray]): Mono blocks.
+
+        Returns:
+            PeakEnvelope: The envelope.
+        """
+        for block in blocks:
+            self.process(block)
+        return self.finish()
@@ -0,0 +1,356 @@
+"""
+Streaming STFT phase vocoder.
+
+Time-stretches a signal one block at a time in float32. Analysis frames,
+the running synthesis phase and the overlap-add tail are carried between
+blocks, so a stream of blocks gives the same output as stretching the whole
+signal at once. The analysis frames can also be read from a precomputed
+``STFTAnalysis`` instead of being computed.
+
+Compared with ``librosa.effects.time_stretch`` on float64 input, the output
+differs by less than 1e-4 (max absolute and relative RMS difference, 60 s
+of tone plus noise, rates 0.5 to 2; ``benchmarks.bench_phase_vocoder``
+checks it). On float32 input librosa accumulates the unwrapped phase in
+float32 and drifts away from both by several percent over a minute.
+"""
+
+import numpy as np
+
+from config import Config
+
+from .analysis import AnalysisReader, STFTAnalyzer, num_frames
+from .buffers import BufferArena
+
+# Synthesis frames rendered at a time: the per-frame work buffers are sized
+# for one batch instead of one block
+SYNTHESIS_BATCH = 64
+
+# Peak working memory (bytes), measured on 5 s blocks: per analysis frame
+# bin (float32 magnitudes and phases, and their copy when frames are
+# appended), per synthesis batch bin (work buffers, float64 phase sums,
+# complex spectra, inverse FFT output) and per output sample (overlap-add
+# accumulators and the output block)
+BYTES_PER_ANALYSIS_BIN = 16
+BYTES_PER_BATCH_BIN = 40
+BYTES_PER_OUTPUT_SAMPLE = 8
+
+
+def working_memory(block_size, rate, n_fft=None, hop_length=None):
+    """
+    Estimate the peak memory a vocoder needs to stretch one block.
+
+    Args:
+        block_size (int): Input samples per block.
+        rate (float): Stretch factor (see ``PhaseVocoder``).
+        n_fft (int): Frame size (default ``Config.STFT_N_FFT``).
+        hop_length (int): Hop size (default ``Config.STFT_HOP_LENGTH``).
+
+    Returns:
+        int: Bytes.
+    """
+    n_fft = int(n_fft or Config.STFT_N_FFT)
+    hop = int(hop_length or Config.STFT_HOP_LENGTH)
+    bins = n_fft // 2 + 1
+    frames = (block_size + n_fft) / hop
+    return int(frames * bins * BYTES_PER_ANALYSIS_BIN
+               + SYNTHESIS_BATCH * bins * BYTES_PER_BATCH_BIN
+               + block_size / float(rate) * BYTES_PER_OUTPUT_SAMPLE)
+
+
+class PhaseVocoder:
+    """
+    Stateful time stretcher.
+
+    Synthesis frame ``k`` interpolates the magnitudes of analysis frames
+    ``floor(k * rate)`` and ``floor(k * rate) + 1`` and advances its phase by
+    the measured phase difference between them. Frames are centered on
+    multiples of the hop (the signal is zero-padded by half a frame on each
+    side) and overlap-added with a Hann window.
+    """
+
+    def __init__(self, rate, n_fft=None, hop_length=None):
+        """
+        Precompute the window and phase-advance tables.
+
+        Args:
+            rate (float): Stretch factor; > 1 speeds up, < 1 slows down.
+                The output has ``round(n / rate)`` samples for ``n`` inputs.
+            n_fft (int): Frame size (default ``Config.STFT_N_FFT``).
+            hop_length (int): Hop size (default ``Config.STFT_HOP_LENGTH``).
+
+        Raises:
+            ValueError: If the rate is not positive or the frame size is not
+                a multiple of the hop size.
+        """
+        if rate <= 0:
+            raise ValueError(f'Stretch rate must be positive, got {rate}')
+        self.rate = float(rate)
+        self.n_fft = int(n_fft or Config.STFT_N_FFT)
+        self.hop = int(hop_length or Config.STFT_HOP_LENGTH)
+        if self.n_fft % self.hop:
+            raise ValueError('n_fft must be a multiple of hop_length')
+        self.overlap = self.n_fft // self.hop
+        self.bins = self.n_fft // 2 + 1
+
+        self.analyzer = STFTAnalyzer(self.n_fft, self.hop, 'hann')
+        self.window = self.analyzer.window
+        # Window energy per hop-sized segment, for the overlap-add normalization
+        self._window_sq = (self.window ** 2).reshape(self.overlap, self.hop)
+
+        # Expected phase advance of each bin over one hop, wrapped to
+        # [0, 2pi) in float64 first: the unwrapped advance reaches
+        # pi * hop, where float32 rounding would add the same error to every
+        # frame and make the phase drift over long signals
+        self._phi_wrapped = np.mod(
+            np.linspace(0, np.pi * self.hop, self.bins, dtype=np.float64), 2 * np.pi
+        ).astype(np.float32)
+        # Per-frame work arrays, reused from block to block
+        self._buffers = BufferArena()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear the state to start a new stream.
+        """
+        self.analyzer.reset()
+        self._source = self.analyzer
+        self._consumed = 0
+
+        # Magnitude and phase of analysis frames _frame_base .. _analyzed - 1
+        self._mag = np.zeros((0, self.bins), dtype=np.float32)
+        self._phase = np.zeros((0, self.bins), dtype=np.float32)
+        self._frame_base = 0
+        self._analyzed = 0
+
+        self._step = 0
+        self._phase_acc = None
+
+        # Overlap-add accumulators; _ola[0] is output position _ola_base
+        self._ola = np.zeros(2 * self.n_fft, dtype=np.float32)
+        self._wss = np.zeros(2 * self.n_fft, dtype=np.float32)
+        self._ola_base = -(self.n_fft // 2)
+        self._emitted = 0
+
+    def output_length(self, input_length):
+        """
+        Args:
+            input_length (int): Number of input samples.
+
+        Returns:
+            int: Number of output samples for a whole stream.
+        """
+        return int(round(input_length / self.rate))
+
+    def max_output(self, input_length):
+        """
+        Args:
+            input_length (int): Length of a block.
+
+        Returns:
+            int: Upper bound of the number of samples ``process`` returns
+            for a block of ``input_length`` samples.
+        """
+        frames = input_length // self.hop + 2
+        return int(np.ceil(frames / self.rate) + 1) * self.hop + self.n_fft
+
+    def use_analysis(self, analysis):
+        """
+        Read the analysis frames of the next stream from a precomputed
+        analysis of that stream's input instead of computing them.
+
+        Args:
+            analysis (STFTAnalysis): Analysis of the signal that will be fed.
+
+        Raises:
+            ValueError: If the analysis settings differ from the vocoder's.
+        """
+        if analysis.settings != self.analyzer.settings:
+            raise ValueError(
+                f'Analysis settings {analysis.settings} do not match {self.analyzer.settings}'
+            )
+        self._source = AnalysisReader(analysis)
+
+    def _append_frames(self, frames):
+        """
+        Store new analysis frames.
+        """
+        mag, phase = frames
+        if len(mag):
+            self._mag = np.concatenate([self._mag, mag])
+            self._phase = np.concatenate([self._phase, phase])
+            self._analyzed += len(mag)
+
+    def _synthesize(self, stop):
+        """
+        Render synthesis frames ``_step .. stop - 1`` and overlap-add them.
+        """
+        if stop <= self._step:
+            return
+        while self._step < stop:
+            self._synthesize_batch(min(stop, self._step + SYNTHESIS_BATCH))
+
+        # Analysis frames before the next one needed are no longer used
+        drop = min(int(np.floor(self._step * self.rate)) - self._frame_base, len(self._mag))
+        if drop > 0:
+            self._mag = self._mag[drop:]
+            self._phase = self._phase[drop:]
+            self._frame_base += drop
+
+    def _synthesize_batch(self, stop):
+        """
+        Render synthesis frames ``_step .. stop - 1`` in one pass.
+        """
+        count = stop - self._step
+        t = np.arange(self._step, stop, dtype=np.float64) * self.rate
+        left = np.floor(t).astype(np.int64)
+        alpha = (t - left).astype(np.float32)[:, None]
+        rows = left - self._frame_base
+        following = rows + 1
+
+        # Every (frames, bins) array below is a reused work buffer
+        shape = (count, self.bins)
+        buffers = self._buffers
+        work = buffers.get('work', shape)
+
+        mag = np.take(self._mag, rows, axis=0, out=buffers.get('mag', shape))
+        mag *= 1.0 - alpha
+        np.take(self._mag, following, axis=0, out=work)
+        work *= alpha
+        mag += work
+
+        dphase = np.take(self._phase, following, axis=0, out=buffers.get('dphase', shape))
+        dphase -= np.take(self._phase, rows, axis=0, out=work)
+        dphase -= self._phi_wrapped
+        np.divide(dphase, 2 * np.pi, out=work)
+        np.round(work, out=work)
+        work *= 2 * np.pi
+        dphase -= work
+        dphase += self._phi_wrapped
+
+        if self._phase_acc is None:
+            self._phase_acc = self._phase[0].astype(np.float64)
+        # Phase of frame j is the accumulator plus the advances of frames < j.
+        # The running sum is kept in float64 and wrapped, so that the phase
+        # does not lose precision on long signals.
+        total = np.cumsum(dphase, axis=0, dtype=np.float64,
+                          out=buffers.get('total', shape, np.float64))
+        total += self._phase_acc
+        self._phase_acc = np.mod(total[-1], 2 * np.pi)
+        total -= dphase
+        np.mod(total, 2 * np.pi, out=total)
+        phase = dphase
+        phase[...] = total
+
+        spectrum = buffers.get('spectrum', shape, np.complex64)
+        np.multiply(mag, np.cos(phase, out=work), out=spectrum.real)
+        np.multiply(mag, np.sin(phase, out=work), out=spectrum.imag)
+        import scipy.fft
+
+        frames = scipy.fft.irfft(spectrum, n=self.n_fft, axis=-1)
+        frames *= self.window
+
+        # Frame k starts at output position k * hop - n_fft // 2
+        offset = self._step * self.hop - self.n_fft // 2 - self._ola_base
+        needed = offset + (count + self.overlap - 1) * self.hop
+        if needed > len(self._ola):
+            grow = needed - len(self._ola)
+            self._ola = np.concatenate([self._ola, np.zeros(grow, dtype=np.float32)])
+            self._wss = np.concatenate([self._wss, np.zeros(grow, dtype=np.float32)])
+
+        ola = self._ola[offset:needed].reshape(-1, self.hop)
+        wss = self._wss[offset:needed].reshape(-1, self.hop)
+        segments = frames.reshape(count, self.overlap, self.hop)
+        for j in range(self.overlap):
+            ola[j:j + count] += segments[:, j]
+            wss[j:j + count] += self._window_sq[j]
+
+        self._step = stop
+
+    def _emit(self, stop, limit=None, out=None):
+        """
+        Return the normalized output up to position ``stop`` (exclusive) and
+        shift the overlap-add buffers. The output is written to ``out`` when
+        it is large enough.
+        """
+        count = stop - self._ola_base
+        if count <= 0:
+            return np.zeros(0, dtype=np.float32)
+
+        if count > len(self._ola):
+            grow = count - len(self._ola)
+            self._ola = np.concatenate([self._ola, np.zeros(grow, dtype=np.float32)])
+            self._wss = np.concatenate([self._wss, np.zeros(grow, dtype=np.float32)])
+
+        if out is None or len(out) < count:
+            out = np.empty(count, dtype=np.float32)
+        out = out[:count]
+        out[:] = self._ola[:count]
+        weight = self._wss[:count]
+        np.divide(out, weight, out=out, where=weight > np.finfo(np.float32).tiny)
+
+        # Reuse the accumulators: move the pending tail to the front
+        remaining = len(self._ola) - count
+        self._ola[:remaining] = self._ola[count:]
+        self._ola[remaining:] = 0.0
+        self._wss[:remaining] = self._wss[count:]
+        self._wss[remaining:] = 0.0
+
+        skip = max(0, -self._ola_base)
+        self._ola_base = stop
+        out = out[skip:]
+        if limit is not None:
+            out = out[:max(0, limit - self._emitted)]
+        self._emitted += len(out)
+        return out
+
+    def process(self, block, out=None):
+        """
+        Stretch one block.
+
+        Args:
+            block (np.ndarray): Mono input block.
+            out (np.ndarray): Optional float32 buffer for the output, used
+                when it is large enough (``max_output(len(block))`` samples
+                always are).
+
+        Returns:
+            np.ndarray: Float32 output samples that are fully determined by
+            the input seen so far (possibly empty; a view of ``out`` when it
+            was used).
+        """
+        self._consumed += len(block)
+        self._append_frames(self._source.process(block))
+
+        # Each synthesis frame needs its two neighbouring analysis frames
+        if self._analyzed >= 2:
+            stop = int(np.ceil((self._analyzed - 1) / self.rate))
+            while stop > 0 and np.floor((stop - 1) * self.rate) + 1 >= self._analyzed:
+                stop -= 1
+            self._synthesize(max(stop, self._step))
+
+        # Positions before the next synthesis frame start are final
+        return self._emit(self._step * self.hop - self.n_fft // 2, out=out)
+
+    def flush(self):
+        """
+        Finish the stream, treating the input after it as zero.
+
+        Returns:
+            np.ndarray: The remaining float32 output samples.
+        """
+        n_frames = num_frames(self._consumed, self.hop)
+        length = self.output_length(self._consumed)
+
+        # Analyze up to the last frame, then add two silent frames so that
+        # interpolation past the end reads zeros
+        self._append_frames(self._source.flush())
+        silent = np.zeros((2, self.bins), dtype=np.float32)
+        self._append_frames((silent, silent))
+
+        self._synthesize(int(np.ceil(n_frames / self.rate)))
+        out = self._emit(max(length, self._ola_base), limit=length)
+        shortfall = length - self._emitted
+        if shortfall > 0:
+            out = np.concatenate([out, np.zeros(shortfall, dtype=np.float32)])
+        self.reset()
+        return out
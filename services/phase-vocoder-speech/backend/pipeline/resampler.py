@@ -0,0 +1,235 @@
+"""
+Streaming polyphase resampler.
+
+Converts between sample rates with a rational ratio ``up / down`` one block
+at a time. The FIR filter history is carried between blocks, so a stream of
+blocks gives the same output as resampling the whole signal.
+"""
+
+import functools
+import math
+
+import numpy as np
+
+from config import Config
+
+# Filter design per quality preset: zero crossings of the windowed sinc on
+# each side (filter length) and Kaiser window beta (stopband attenuation).
+# 'standard' matches the scipy.signal.resample_poly defaults.
+QUALITY_PRESETS = {
+    'fast': {'zero_crossings': 4, 'beta': 5.0},
+    'standard': {'zero_crossings': 10, 'beta': 5.0},
+    'high': {'zero_crossings': 32, 'beta': 9.0},
+}
+
+
+@functools.lru_cache(maxsize=32)
+def _filter_bank(up, down, quality):
+    """
+    Build the windowed-sinc lowpass and split it into polyphase branches.
+
+    Banks are cached per ratio and preset: a pitch ratio with a large
+    denominator takes tens of milliseconds to design, and each parallel
+    render segment would otherwise design it again.
+
+    Returns:
+        tuple: ``(delay, branch_len, branches)``; ``branches`` is read-only.
+    """
+    import scipy.signal
+
+    preset = QUALITY_PRESETS[quality]
+    max_rate = max(up, down)
+    half_len = preset['zero_crossings'] * max_rate
+    taps = scipy.signal.firwin(
+        2 * half_len + 1, 1.0 / max_rate, window=('kaiser', preset['beta'])
+    ) * up
+
+    # branches[p, i] = taps[p + i * up], reversed so that a window of
+    # consecutive input samples can be dotted with it directly.
+    branch_len = -(-len(taps) // up)
+    padded = np.zeros(branch_len * up)
+    padded[:len(taps)] = taps
+    branches = np.ascontiguousarray(
+        padded.reshape(branch_len, up).T[:, ::-1], dtype=np.float32
+    )
+    branches.flags.writeable = False
+    return half_len, branch_len, branches
+
+
+class PolyphaseResampler:
+    """
+    Stateful rational-ratio resampler.
+
+    Output sample ``k`` is the filtered, zero-stuffed input evaluated at
+    input time ``k * down / up``. Each output only needs one polyphase
+    branch of the filter, so the cost per output sample is the filter
+    length divided by ``up``.
+    """
+
+    def __init__(self, source_rate, target_rate, quality=None):
+        """
+        Design the filter bank.
+
+        Args:
+            source_rate (int): Input sample rate.
+            target_rate (int): Output sample rate.
+            quality (str): One of ``QUALITY_PRESETS``
+                (default ``Config.RESAMPLE_QUALITY``).
+
+        Raises:
+            ValueError: If the quality preset is unknown.
+        """
+        if quality is None:
+            quality = Config.RESAMPLE_QUALITY
+        if quality not in QUALITY_PRESETS:
+            raise ValueError(f'Unknown resampling quality {quality}')
+
+        ratio = math.gcd(int(source_rate), int(target_rate))
+        self.up = int(target_rate) // ratio
+        self.down = int(source_rate) // ratio
+        self.quality = quality
+
+        self.delay = 0
+        self.branch_len = 1
+        self.branches = None
+        if self.up != self.down:
+            self.delay, self.branch_len, self.branches = _filter_bank(
+                self.up, self.down, quality
+            )
+        self.reset()
+
+    def reset(self):
+        """
+        Clear the filter history to start a new stream.
+        """
+        # Input before the stream start is zero. The pending input is a view
+        # of a storage array that is only reallocated when it must grow.
+        self._storage = np.zeros(self.branch_len - 1, dtype=np.float32)
+        self._start = 0
+        self._buffer = self._storage
+        self._base = -(self.branch_len - 1)
+        self._consumed = 0
+        self._produced = 0
+
+    @property
+    def passthrough(self):
+        """
+        bool: True if the rates are equal.
+        """
+        return self.up == self.down
+
+    def output_length(self, input_length):
+        """
+        Args:
+            input_length (int): Number of input samples.
+
+        Returns:
+            int: Number of output samples for a whole stream.
+        """
+        return -(-input_length * self.up // self.down)
+
+    def _last_input(self, k):
+        """
+        Index of the newest input sample needed for output ``k``.
+        """
+        return (k * self.down + self.delay) // self.up
+
+    def _append(self, samples):
+        """
+        Append input samples to the buffer, reusing its storage.
+        """
+        length = len(self._buffer)
+        total = length + len(samples)
+        if self._start + total > len(self._storage):
+            storage = self._storage
+            if total > len(storage):
+                storage = np.empty(max(total, 2 * len(storage)), dtype=np.float32)
+            # Move the pending input to the front
+            storage[:length] = self._buffer
+            self._storage = storage
+            self._start = 0
+        self._storage[self._start + length:self._start + total] = samples
+        self._buffer = self._storage[self._start:self._start + total]
+
+    def _render(self, stop, out=None):
+        """
+        Compute outputs ``_produced .. stop - 1`` from the buffered input,
+        into ``out`` when it is large enough.
+        """
+        start = self._produced
+        count = max(stop - start, 0)
+        if out is None or len(out) < count:
+            out = np.empty(count, dtype=np.float32)
+        out = out[:count]
+        if count <= 0:
+            return out
+
+        windows = np.lib.stride_tricks.sliding_window_view(self._buffer, self.branch_len)
+        # Outputs k and k + up use the same branch and inputs exactly `down` apart
+        for r in range(min(self.up, count)):
+            k = start + r
+            t = k * self.down + self.delay
+            first = t // self.up - (self.branch_len - 1) - self._base
+            n = -(-(count - r) // self.up)
+            rows = windows[first:first + (n - 1) * self.down + 1:self.down]
+            np.matmul(rows, self.branches[t % self.up], out=out[r::self.up])
+        self._produced = stop
+        return out
+
+    def _drop_history(self):
+        """
+        Discard input that no future output needs.
+        """
+        first = self._last_input(self._produced) - (self.branch_len - 1) - self._base
+        if first > 0:
+            self._buffer = self._buffer[first:]
+            self._start += first
+            self._base += first
+
+    def process(self, block, out=None):
+        """
+        Resample one block.
+
+        Args:
+            block (np.ndarray): Mono input block.
+            out (np.ndarray): Optional float32 buffer for the output, used
+                when it is large enough.
+
+        Returns:
+            np.ndarray: Float32 output samples that are fully determined by
+            the input seen so far (possibly empty; a view of ``out`` when it
+            was used). Equal rates return ``block`` itself.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if self.passthrough:
+            return block
+
+        self._append(block)
+        self._consumed += len(block)
+
+        # Largest k whose newest input sample has arrived
+        available = self._consumed - 1
+        stop = ((available + 1) * self.up - self.delay - 1) // self.down + 1
+        stop = min(stop, self.output_length(self._consumed))
+        out = self._render(stop, out)
+        self._drop_history()
+        return out
+
+    def flush(self):
+        """
+        Finish the stream, treating the input after it as zero.
+
+        Returns:
+            np.ndarray: The remaining float32 output samples.
+        """
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+
+        stop = self.output_length(self._consumed)
+        if stop > self._produced:
+            needed = self._last_input(stop - 1) - (self._base + len(self._buffer) - 1)
+            if needed > 0:
+                self._append(np.zeros(needed, dtype=np.float32))
+        out = self._render(stop)
+        self.reset()
+        return out
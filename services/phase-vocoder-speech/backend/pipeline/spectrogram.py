@@ -0,0 +1,294 @@
+"""
+Spectrogram images.
+
+Reduces STFT magnitudes to a log-magnitude (linear or mel frequency)
+image with a bounded number of rows, at several time zoom levels, and cuts
+each level into fixed-width PNG tiles that a client can load on demand.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from config import Config
+from .analysis import STFTAnalyzer
+
+SCALES = ('linear', 'mel')
+
+# Anchor colors of the palette (magma), from silence to full scale
+PALETTE_ANCHORS = np.array([
+    (0, 0, 4), (28, 16, 68), (79, 18, 123), (129, 37, 129), (181, 54, 122),
+    (229, 80, 100), (251, 135, 97), (254, 194, 135), (252, 253, 191),
+], dtype=np.float64)
+
+
+def _palette():
+    """
+    256-entry RGB palette interpolated from ``PALETTE_ANCHORS``.
+    """
+    positions = np.linspace(0.0, 1.0, len(PALETTE_ANCHORS))
+    levels = np.linspace(0.0, 1.0, 256)
+    channels = [np.interp(levels, positions, PALETTE_ANCHORS[:, c]) for c in range(3)]
+    return np.round(np.stack(channels, axis=1)).astype(np.uint8)
+
+
+PALETTE = _palette()
+
+
+def encode_png(pixels, palette=PALETTE):
+    """
+    Encode an 8-bit indexed image as PNG.
+
+    Args:
+        pixels (np.ndarray): ``(height, width)`` uint8 palette indices.
+        palette (np.ndarray): ``(256, 3)`` uint8 RGB palette.
+
+    Returns:
+        bytes: PNG file content.
+    """
+    height, width = pixels.shape
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+    # Each scanline starts with filter type 0 (none)
+    scanlines = np.zeros((height, width + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        chunk(b'PLTE', palette.tobytes()),
+        chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)),
+        chunk(b'IEND', b''),
+    ])
+
+
+class Spectrogram:
+    """
+    Multi-resolution spectrogram image.
+
+    Level 0 has one column per STFT frame; each following level keeps the
+    loudest of ``factor`` columns of the previous one. Values are uint8:
+    0 is ``top_db`` below full scale (or quieter), 255 is a full-scale sine.
+    """
+
+    def __init__(self, levels, sample_rate, n_fft, hop_length, scale, factor, top_db,
+                 num_samples):
+        """
+        Args:
+            levels (list[np.ndarray]): ``(columns, rows)`` uint8 arrays, finest
+                first; row 0 is the lowest frequency.
+            sample_rate (int): Sample rate of the signal.
+            n_fft (int): STFT frame size.
+            hop_length (int): STFT hop size.
+            scale (str): 'linear' or 'mel'.
+            factor (int): Columns merged from one level to the next.
+            top_db (float): Dynamic range of the image.
+            num_samples (int): Length of the signal.
+        """
+        self.levels = levels
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.scale = scale
+        self.factor = factor
+        self.top_db = top_db
+        self.num_samples = num_samples
+
+    @property
+    def height(self):
+        """
+        int: Number of frequency rows.
+        """
+        return self.levels[0].shape[1]
+
+    def frames_per_column(self, level):
+        """
+        Args:
+            level (int): Level index.
+
+        Returns:
+            int: STFT frames merged into one column at ``level``.
+        """
+        return self.factor ** level
+
+    def level_for_width(self, width):
+        """
+        Coarsest level that still has at least ``width`` columns.
+
+        Args:
+            width (int): Number of pixels to draw.
+
+        Returns:
+            int: Level index.
+        """
+        for level in range(len(self.levels) - 1, -1, -1):
+            if len(self.levels[level]) >= width:
+                return level
+        return 0
+
+    def to_db(self, values):
+        """
+        Args:
+            values (np.ndarray): uint8 image values.
+
+        Returns:
+            np.ndarray: Levels in dB relative to a full-scale sine.
+        """
+        return values.astype(np.float32) / 255.0 * self.top_db - self.top_db
+
+    def tiles(self, level, tile_width=None):
+        """
+        Cut one level into PNG tiles, oldest first; the last tile may be
+        narrower. Images have the lowest frequency at the bottom.
+
+        Args:
+            level (int): Level index.
+            tile_width (int): Columns per tile (default
+                ``Config.SPECTROGRAM_TILE_WIDTH``).
+
+        Yields:
+            bytes: PNG content of each tile.
+        """
+        tile_width = tile_width or Config.SPECTROGRAM_TILE_WIDTH
+        columns = self.levels[level]
+        for start in range(0, len(columns), tile_width):
+            yield encode_png(np.ascontiguousarray(columns[start:start + tile_width].T[::-1]))
+
+
+class SpectrogramBuilder:
+    """
+    Builds a ``Spectrogram`` from STFT magnitudes, frame block by frame
+    block, so that only the reduced image is held in memory.
+
+    Linear spectrograms keep the loudest bin of each group of bins; mel
+    spectrograms apply a mel filter bank to the power spectrum.
+    """
+
+    def __init__(self, sample_rate, n_fft=None, hop_length=None, scale='linear',
+                 height=None, levels=None, factor=None, top_db=None):
+        """
+        Args:
+            sample_rate (int): Sample rate of the signal.
+            n_fft (int): STFT frame size (default ``Config.STFT_N_FFT``).
+            hop_length (int): STFT hop size (default ``Config.STFT_HOP_LENGTH``).
+            scale (str): 'linear' or 'mel'.
+            height (int): Number of frequency rows (default
+                ``Config.SPECTROGRAM_HEIGHT``, or ``SPECTROGRAM_MEL_BANDS`` for mel).
+            levels (int): Number of levels (default ``Config.SPECTROGRAM_LEVELS``).
+            factor (int): Columns merged per level
+                (default ``Config.SPECTROGRAM_LEVEL_FACTOR``).
+            top_db (float): Dynamic range (default ``Config.SPECTROGRAM_TOP_DB``).
+
+        Raises:
+            ValueError: If the scale is unknown.
+        """
+        if scale not in SCALES:
+            raise ValueError(f'Unknown frequency scale {scale}')
+        self.sample_rate = sample_rate
+        self.n_fft = int(n_fft or Config.STFT_N_FFT)
+        self.hop_length = int(hop_length or Config.STFT_HOP_LENGTH)
+        self.scale = scale
+        self.num_levels = levels or Config.SPECTROGRAM_LEVELS
+        self.factor = factor or Config.SPECTROGRAM_LEVEL_FACTOR
+        self.top_db = float(top_db or Config.SPECTROGRAM_TOP_DB)
+        bins = self.n_fft // 2 + 1
+
+        if scale == 'mel':
+            import librosa
+
+            self.height = height or Config.SPECTROGRAM_MEL_BANDS
+            self._filters = librosa.filters.mel(
+                sr=sample_rate, n_fft=self.n_fft, n_mels=self.height, norm=None
+            ).astype(np.float32).T
+        else:
+            self.height = min(height or Config.SPECTROGRAM_HEIGHT, bins)
+            self._edges = np.linspace(0, bins, self.height + 1).astype(np.int64)[:-1]
+
+        # Power of a full-scale sine: the peak of the window's spectrum
+        window = np.hanning(self.n_fft + 1)[:-1]
+        self._ref_db = 20.0 * np.log10(window.sum() / 2.0)
+        self._columns = []
+
+    def process(self, magnitude):
+        """
+        Add STFT frames.
+
+        Args:
+            magnitude (np.ndarray): ``(frames, n_fft // 2 + 1)`` magnitudes.
+        """
+        if not len(magnitude):
+            return
+        magnitude = np.asarray(magnitude, dtype=np.float32)
+        if self.scale == 'mel':
+            power = np.square(magnitude) @ self._filters
+        else:
+            power = np.square(np.maximum.reduceat(magnitude, self._edges, axis=1))
+        db = 10.0 * np.log10(np.maximum(power, 1e-20)) - self._ref_db
+        scaled = (np.clip(db, -self.top_db, 0.0) + self.top_db) * (255.0 / self.top_db)
+        self._columns.append(np.round(scaled).astype(np.uint8))
+
+    def finish(self, num_samples):
+        """
+        Build the levels.
+
+        Args:
+            num_samples (int): Length of the analyzed signal.
+
+        Returns:
+            Spectrogram: The spectrogram.
+        """
+        columns = (np.concatenate(self._columns) if self._columns
+                   else np.zeros((0, self.height), dtype=np.uint8))
+        levels = [columns]
+        while len(levels) < self.num_levels and len(levels[-1]) > 1:
+            previous = levels[-1]
+            padded = -len(previous) % self.factor
+            if padded:
+                # Repeat the last column so that the final group is complete
+                previous = np.concatenate([previous, np.repeat(previous[-1:], padded, axis=0)])
+            levels.append(previous.reshape(-1, self.factor, self.height).max(axis=1))
+
+        return Spectrogram(levels, self.sample_rate, self.n_fft, self.hop_length, self.scale,
+                           self.factor, self.top_db, num_samples)
+
+    def build(self, blocks):
+        """
+        Analyze (Hann window) and reduce a stream of samples.
+
+        Args:
+            blocks (iterable[np.ndarray]): Mono blocks.
+
+        Returns:
+            Spectrogram: The spectrogram.
+        """
+        analyzer = STFTAnalyzer(self.n_fft, self.hop_length, 'hann')
+        num_samples = 0
+        for block in blocks:
+            num_samples += len(block)
+            self.process(analyzer.process(block)[0])
+        self.process(analyzer.flush()[0])
+        return self.finish(num_samples)
+
+    def build_from_analysis(self, analysis, frames_per_block=1024):
+        """
+        Reduce a precomputed analysis (e.g. memory-mapped from the cache).
+
+        Args:
+            analysis (STFTAnalysis): Hann-window analysis with this builder's
+                frame and hop sizes.
+            frames_per_block (int): Frames read at a time.
+
+        Returns:
+            Spectrogram: The spectrogram.
+
+        Raises:
+            ValueError: If the analysis has other STFT settings.
+        """
+        if analysis.settings != (self.n_fft, self.hop_length, 'hann'):
+            raise ValueError('Analysis does not match the spectrogram settings')
+        for start in range(0, analysis.num_frames, frames_per_block):
+            self.process(analysis.magnitude[start:start + frames_per_block])
+        return self.finish(analysis.num_samples)
@@ -0,0 +1,26 @@
+"""
+Storage module for the Audio Vocoder application.
+
+Contains the on-disk stores used by the API:
+- Result cache (content-addressed processed audio)
+- Decoded-audio cache (memory-mapped .npy sidecars)
+- Analysis cache (STFT magnitude/phase per upload and STFT setting)
+- Spectrogram cache (image tiles keyed by audio content hash)
+- Upload registry (SQLite index of uploads)
+- Upload sessions (streamed, size-limited, resumable uploads)
+- Storage janitor (TTL and quota cleanup)
+"""
+
+from .result_cache import ResultCache, file_digest, canonical_parameters
+from .decoded_cache import DecodedAudioCache
+from .analysis_cache import AnalysisCache
+from .spectrogram_cache import SpectrogramCache
+from .upload_registry import UploadRegistry, probe_audio
+from .janitor import StorageJanitor
+from .upload_sessions import (
+    UploadSessionStore,
+    UploadTooLargeError,
+    UploadOffsetError,
+    MultipartFileReader,
+    save_stream
+)
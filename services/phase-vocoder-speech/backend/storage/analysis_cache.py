@@ -0,0 +1,132 @@
+"""
+STFT analysis cache.
+
+Keeps the STFT of each decoded upload next to its decoded sidecar, once per
+(n_fft, hop, window), so that spectral effects and plots share a single
+analysis. Magnitude and phase are stored as float16 by default, which
+halves the size of a float32 analysis.
+"""
+
+import os
+import uuid
+
+import numpy as np
+
+from config import Config
+from pipeline.analysis import STFTAnalysis, STFTAnalyzer, num_frames
+
+
+class AnalysisCache:
+    """
+    Stores STFT analyses as memory-mappable ``.npy`` files.
+
+    Files are named
+    ``{upload stem}.{sample rate}hz.{duration}s.stft{n_fft}-{hop}-{window}.npy``
+    and hold a ``(2, frames, bins)`` array: magnitudes, then phases. They
+    share the stem of the upload, so they are removed with its decoded
+    sidecars.
+    """
+
+    def __init__(self, directory, dtype=None):
+        """
+        Initialize the cache.
+
+        Args:
+            directory (str): Directory holding the analyses.
+            dtype (str): Storage dtype (default ``Config.ANALYSIS_DTYPE``).
+        """
+        self.directory = directory
+        self.dtype = np.dtype(dtype or Config.ANALYSIS_DTYPE)
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, input_path, sample_rate, duration, n_fft, hop_length, window):
+        """
+        Args:
+            input_path (str): Path to the source audio file.
+            sample_rate (int): Sample rate of the analyzed signal.
+            duration (float): Duration limit used when decoding.
+            n_fft (int): Frame size.
+            hop_length (int): Hop size.
+            window (str): Window name.
+
+        Returns:
+            str: Path of the analysis file.
+        """
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        name = (f"{stem}.{int(sample_rate)}hz.{duration:g}s."
+                f"stft{int(n_fft)}-{int(hop_length)}-{window}.npy")
+        return os.path.join(self.directory, name)
+
+    def load(self, input_path, sample_rate, duration, num_samples, n_fft, hop_length, window):
+        """
+        Memory-map an analysis if it exists, is not older than its source
+        and matches the signal length.
+
+        Args:
+            input_path (str): Path to the source audio file.
+            sample_rate (int): Sample rate of the analyzed signal.
+            duration (float): Duration limit used when decoding.
+            num_samples (int): Length of the analyzed signal.
+            n_fft (int): Frame size.
+            hop_length (int): Hop size.
+            window (str): Window name.
+
+        Returns:
+            STFTAnalysis or None: Read-only analysis, None on a miss.
+        """
+        path = self.path_for(input_path, sample_rate, duration, n_fft, hop_length, window)
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(input_path):
+                return None
+            data = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if data.shape != (2, num_frames(num_samples, hop_length), n_fft // 2 + 1):
+            return None
+        return STFTAnalysis(data[0], data[1], n_fft, hop_length, window, num_samples)
+
+    def compute(self, input_path, sample_rate, duration, num_samples, blocks,
+                n_fft, hop_length, window):
+        """
+        Analyze a stream of decoded blocks and store the result.
+
+        Args:
+            input_path (str): Path to the source audio file.
+            sample_rate (int): Sample rate of the decoded signal.
+            duration (float): Duration limit used when decoding.
+            num_samples (int): Expected number of samples.
+            blocks (iterable[np.ndarray]): Decoded mono float32 blocks.
+            n_fft (int): Frame size.
+            hop_length (int): Hop size.
+            window (str): Window name.
+
+        Returns:
+            STFTAnalysis: The stored analysis (memory-mapped).
+
+        Raises:
+            ValueError: If the stream does not have the expected length.
+        """
+        path = self.path_for(input_path, sample_rate, duration, n_fft, hop_length, window)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        shape = (2, num_frames(num_samples, hop_length), n_fft // 2 + 1)
+        data = np.lib.format.open_memmap(partial_path, mode='w+', dtype=self.dtype, shape=shape)
+        complete = False
+        try:
+            analysis = STFTAnalyzer(n_fft, hop_length, window).analyze(
+                blocks, magnitude=data[0], phase=data[1]
+            )
+            if analysis.num_samples != num_samples:
+                raise ValueError(
+                    f'Expected {num_samples} samples, got {analysis.num_samples}'
+                )
+            complete = True
+        finally:
+            data.flush()
+            del data
+            if complete:
+                os.replace(partial_path, path)
+            else:
+                os.remove(partial_path)
+
+        return self.load(input_path, sample_rate, duration, num_samples,
+                         n_fft, hop_length, window)
@@ -0,0 +1,154 @@
+"""
+Decoded-audio cache.
+
+Keeps the normalized mono float32 signal of each upload as a ``.npy``
+sidecar, so later loads memory-map it instead of decoding and resampling
+the source file again.
+"""
+
+import glob
+import os
+import uuid
+
+import numpy as np
+
+
+class DecodedAudioCache:
+    """
+    Stores decoded uploads as memory-mappable ``.npy`` files.
+
+    Sidecars are named ``{upload stem}.{sample rate}hz.{duration}s.npy`` so
+    that one upload can have a sidecar per load setting.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize the cache.
+
+        Args:
+            directory (str): Directory holding the sidecars.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _stem(input_path):
+        return os.path.splitext(os.path.basename(input_path))[0]
+
+    def path_for(self, input_path, sample_rate, duration):
+        """
+        Args:
+            input_path (str): Path to the source audio file.
+            sample_rate (int): Sample rate of the decoded signal.
+            duration (float): Duration limit used when decoding.
+
+        Returns:
+            str: Path of the sidecar.
+        """
+        name = f"{self._stem(input_path)}.{int(sample_rate)}hz.{duration:g}s.npy"
+        return os.path.join(self.directory, name)
+
+    def load(self, input_path, sample_rate, duration):
+        """
+        Memory-map a sidecar if it exists and is not older than its source.
+
+        Args:
+            input_path (str): Path to the source audio file.
+            sample_rate (int): Sample rate of the decoded signal.
+            duration (float): Duration limit used when decoding.
+
+        Returns:
+            np.memmap or None: Read-only decoded signal, None on a miss.
+        """
+        path = self.path_for(input_path, sample_rate, duration)
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(input_path):
+                return None
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def tee(self, input_path, sample_rate, duration, num_samples, blocks):
+        """
+        Pass a stream of decoded blocks through while writing them to a
+        sidecar. The sidecar is only kept if the stream is fully consumed
+        and has the expected length.
+
+        Args:
+            input_path (str): Path to the source audio file.
+            sample_rate (int): Sample rate of the decoded signal.
+            duration (float): Duration limit used when decoding.
+            num_samples (int): Expected number of samples.
+            blocks (iterable[np.ndarray]): Decoded mono float32 blocks.
+
+        Yields:
+            np.ndarray: The same blocks.
+        """
+        path = self.path_for(input_path, sample_rate, duration)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        sidecar = np.lib.format.open_memmap(
+            partial_path, mode='w+', dtype=np.float32, shape=(num_samples,)
+        )
+        written = 0
+        complete = False
+        try:
+            for block in blocks:
+                n = min(len(block), num_samples - written)
+                sidecar[written:written + n] = block[:n]
+                written += len(block)
+                yield block
+            complete = written == num_samples
+        finally:
+            sidecar.flush()
+            del sidecar
+            if complete:
+                os.replace(partial_path, path)
+            else:
+                os.remove(partial_path)
+
+    def remove(self, input_path):
+        """
+        Delete every sidecar of an upload (decoded signals, analyses,
+        envelopes).
+
+        Args:
+            input_path (str): Path to the source audio file.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        freed = 0
+        pattern = os.path.join(self.directory, glob.escape(self._stem(input_path)) + '.*')
+        for path in glob.glob(pattern):
+            if path.endswith('.part'):
+                continue
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        return freed
+
+    def prune_orphans(self, upload_dir):
+        """
+        Delete sidecars whose upload no longer exists.
+
+        Args:
+            upload_dir (str): Directory holding the uploads.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        stems = {os.path.splitext(name)[0] for name in os.listdir(upload_dir)}
+        freed = 0
+        for name in os.listdir(self.directory):
+            if name.split('.', 1)[0] not in stems:
+                path = os.path.join(self.directory, name)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    freed += size
+                except OSError:
+                    pass
+        return freed
@@ -0,0 +1,162 @@
+"""
+Storage janitor for temp_audio.
+
+Deletes files older than a per-kind TTL, then evicts least-recently-used
+files until the total size fits the disk quota. Files used by running jobs
+are never deleted.
+"""
+
+import os
+import threading
+import time
+
+from config import Config
+
+
+class StorageJanitor:
+    """
+    Applies TTLs and a byte quota to the temporary audio directories.
+
+    Files are handled in groups sharing the same stem (the part of the name
+    before the first dot), e.g. an upload session's ``.part`` and ``.json``,
+    or all sidecars of one upload, and a group's last use is the newest
+    access or modification time of its files.
+    """
+
+    def __init__(self, directories, ttls=None, quota_bytes=None, is_protected=None,
+                 on_remove=None):
+        """
+        Initialize the janitor.
+
+        Args:
+            directories (dict): ``{kind: directory}`` to manage.
+            ttls (dict): ``{kind: seconds}`` (default ``Config.STORAGE_TTL``).
+                Kinds without a TTL are only subject to the quota.
+            quota_bytes (int): Total size budget across all kinds
+                (default ``Config.STORAGE_QUOTA_BYTES``).
+            is_protected (callable): ``is_protected(kind, stem)`` returning
+                True for groups that must be kept (e.g. used by a running job).
+            on_remove (dict): ``{kind: callback(stem, paths)}`` called after a
+                group has been deleted, to update indexes.
+        """
+        self.directories = directories
+        self.ttls = ttls if ttls is not None else Config.STORAGE_TTL
+        self.quota_bytes = quota_bytes or Config.STORAGE_QUOTA_BYTES
+        self.is_protected = is_protected or (lambda kind, stem: False)
+        self.on_remove = on_remove or {}
+        self.runs = 0
+        self.last_run = None
+        self.reclaimed = {kind: {'files': 0, 'bytes': 0} for kind in directories}
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """
+        Group the files of every kind by stem.
+
+        Returns:
+            list[dict]: Groups with kind, stem, paths, size and last use.
+        """
+        groups = {}
+        for kind, directory in self.directories.items():
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                stem = name.split('.', 1)[0]
+                group = groups.setdefault((kind, stem), {
+                    'kind': kind, 'stem': stem, 'paths': [], 'size': 0, 'last_used': 0.0,
+                })
+                group['paths'].append(path)
+                group['size'] += stat.st_size
+                group['last_used'] = max(group['last_used'], stat.st_atime, stat.st_mtime)
+        return list(groups.values())
+
+    def _remove(self, group, report):
+        """
+        Delete a group and account for it.
+        """
+        freed = 0
+        removed = 0
+        for path in group['paths']:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+                removed += 1
+            except OSError:
+                pass
+
+        callback = self.on_remove.get(group['kind'])
+        if callback is not None:
+            callback(group['stem'], group['paths'])
+
+        for totals in (self.reclaimed[group['kind']], report[group['kind']]):
+            totals['files'] += removed
+            totals['bytes'] += freed
+        return freed
+
+    def run_once(self):
+        """
+        Run one cleanup pass: TTL expiry first, then quota eviction (LRU).
+
+        Returns:
+            dict: Files and bytes reclaimed per kind in this pass.
+        """
+        with self._lock:
+            now = time.time()
+            report = {kind: {'files': 0, 'bytes': 0} for kind in self.directories}
+            remaining = []
+
+            for group in self._scan():
+                if self.is_protected(group['kind'], group['stem']):
+                    continue
+                ttl = self.ttls.get(group['kind'])
+                if ttl is not None and now - group['last_used'] > ttl:
+                    self._remove(group, report)
+                else:
+                    remaining.append(group)
+
+            total = sum(group['size'] for group in self._scan())
+            for group in sorted(remaining, key=lambda g: g['last_used']):
+                if total <= self.quota_bytes:
+                    break
+                total -= self._remove(group, report)
+
+            self.runs += 1
+            self.last_run = now
+            return report
+
+    def usage(self):
+        """
+        Returns:
+            dict: ``{kind: {'files': n, 'bytes': n}}`` currently on disk.
+        """
+        usage = {kind: {'files': 0, 'bytes': 0} for kind in self.directories}
+        for group in self._scan():
+            usage[group['kind']]['files'] += len(group['paths'])
+            usage[group['kind']]['bytes'] += group['size']
+        return usage
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current usage, quota, TTLs and cumulative reclaimed totals.
+        """
+        usage = self.usage()
+        return {
+            'usage': usage,
+            'total_bytes': sum(u['bytes'] for u in usage.values()),
+            'quota_bytes': self.quota_bytes,
+            'ttl_seconds': self.ttls,
+            'reclaimed': self.reclaimed,
+            'runs': self.runs,
+            'last_run': self.last_run,
+        }
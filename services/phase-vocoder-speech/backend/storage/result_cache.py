@@ -0,0 +1,261 @@
+"""
+Content-addressed cache of processed audio.
+
+A render is identified by the hash of its input audio, the effect name, the
+canonical effect parameters and the output encoding. Results are kept on disk under that key and
+evicted least-recently-used first once the cache exceeds its byte budget.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from config import Config
+from pipeline.peaks import envelope_path
+
+# Bump when rendering changes so stale results are not served.
+CACHE_VERSION = 2
+
+# Most recently used digests: path -> (size, mtime_ns, digest)
+MAX_DIGESTS = 1024
+
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's content, memoized by path while its size and mtime
+    are unchanged.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex digest.
+    """
+    stat = os.stat(path)
+    with _digests_lock:
+        memo = _digests.get(path)
+        if memo is not None and memo[:2] == (stat.st_size, stat.st_mtime_ns):
+            _digests.move_to_end(path)
+            return memo[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    with _digests_lock:
+        _digests[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+        _digests.move_to_end(path)
+        while len(_digests) > MAX_DIGESTS:
+            _digests.popitem(last=False)
+    return digest.hexdigest()
+
+
+def forget_digest(path):
+    """
+    Drop the memoized digest of a removed file.
+
+    Args:
+        path (str): Path to the file.
+    """
+    with _digests_lock:
+        _digests.pop(path, None)
+
+
+def canonical_parameters(parameters):
+    """
+    Serialize effect parameters so that equivalent requests compare equal
+    (sorted keys, numbers as floats).
+
+    Args:
+        parameters (dict): Effect parameters.
+
+    Returns:
+        str: Canonical JSON.
+    """
+    def normalize(value):
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    return json.dumps(normalize(parameters), sort_keys=True, separators=(',', ':'))
+
+
+class ResultCache:
+    """
+    Disk-backed LRU cache of processed audio files.
+    """
+
+    def __init__(self, directory, max_bytes=None, extensions=('.wav',)):
+        """
+        Initialize the cache and index the entries already on disk.
+
+        Args:
+            directory (str): Directory holding cached files.
+            max_bytes (int): Byte budget (default ``Config.RESULT_CACHE_BYTES``).
+            extensions (tuple[str]): File extensions of cached results; the
+                first one is assumed for keys that are not indexed.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes or Config.RESULT_CACHE_BYTES
+        self.extensions = tuple(extensions)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._extensions = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """
+        Rebuild the LRU order from file modification times.
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            key, extension = os.path.splitext(name)
+            if extension in self.extensions and '.' not in key:
+                stat = os.stat(os.path.join(self.directory, name))
+                found.append((stat.st_mtime, key, extension, stat.st_size))
+        for _, key, extension, size in sorted(found):
+            self._entries[key] = size
+            self._extensions[key] = extension
+
+    def key(self, input_path, effect, parameters, input_digest=None, encoding=None):
+        """
+        Compute the cache key of a render.
+
+        Args:
+            input_path (str): Path to the input audio.
+            effect (str): Effect name.
+            parameters (dict): Effect parameters.
+            input_digest (str): SHA-256 of the input if already known.
+            encoding (str): Output encoding (e.g. 'flac-16'); None for the
+                default WAV, which keeps the keys it had before encodings.
+
+        Returns:
+            str: Hex key.
+        """
+        parts = [
+            str(CACHE_VERSION),
+            input_digest or file_digest(input_path),
+            effect,
+            canonical_parameters(parameters),
+        ]
+        if encoding:
+            parts.append(encoding)
+        payload = '\n'.join(parts)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, extension=None):
+        """
+        Args:
+            key (str): Cache key.
+            extension (str): File extension of the result; by default the
+                one it was stored with.
+
+        Returns:
+            str: Path where the result for ``key`` is stored.
+        """
+        extension = extension or self._extensions.get(key, self.extensions[0])
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key):
+        """
+        Look up a result and mark it as recently used.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            str or None: Path to the cached file, None on a miss.
+        """
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                os.utime(path)
+                return path
+            self._entries.pop(key, None)
+            self._extensions.pop(key, None)
+            self.misses += 1
+            return None
+
+    def add(self, key, extension=None):
+        """
+        Register a result written to ``path_for(key, extension)`` and evict
+        old entries if the cache is over budget.
+
+        Args:
+            key (str): Cache key.
+            extension (str): File extension of the result.
+        """
+        path = self.path_for(key, extension)
+        if not os.path.exists(path):
+            return
+        with self._lock:
+            self._entries[key] = os.path.getsize(path)
+            self._extensions[key] = os.path.splitext(path)[1]
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def discard(self, key):
+        """
+        Forget an entry (used when its file is removed by someone else).
+
+        Args:
+            key (str): Cache key.
+        """
+        forget_digest(self.path_for(key))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._extensions.pop(key, None)
+
+    def _evict(self):
+        """
+        Remove least-recently-used entries, with their waveform envelopes,
+        until under budget. The newest entry is always kept.
+        """
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            path = self.path_for(key)
+            self._extensions.pop(key, None)
+            for removed in (path, envelope_path(self.directory, key)):
+                try:
+                    os.remove(removed)
+                except OSError:
+                    pass
+            forget_digest(path)
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss/eviction counters and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,150 @@
+"""
+Spectrogram tile cache.
+
+Stores the PNG tiles of spectrograms keyed by the hash of the audio
+content and the spectrogram settings, so that the same audio is only
+rendered once whatever name it is requested under.
+"""
+
+import json
+import os
+import re
+import uuid
+
+from config import Config
+
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.[0-9a-z.-]+$')
+
+
+class SpectrogramCache:
+    """
+    Flat directory of spectrogram tiles and manifests.
+
+    A spectrogram is identified by
+    ``{content sha256}.{sample rate}hz.{scale}{rows}.stft{n_fft}-{hop}``;
+    its tiles are ``{key}.z{level}.{index}.png`` and its manifest
+    ``{key}.json``. The manifest is written last, so a spectrogram is
+    complete once its manifest exists. All files share the content hash as
+    stem, so the storage janitor evicts them together.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize the cache.
+
+        Args:
+            directory (str): Directory holding the tiles.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(digest, sample_rate, scale, height, n_fft=None, hop_length=None):
+        """
+        Args:
+            digest (str): SHA-256 of the audio file.
+            sample_rate (int): Sample rate of the analyzed signal.
+            scale (str): 'linear' or 'mel'.
+            height (int): Number of frequency rows.
+            n_fft (int): STFT frame size (default ``Config.STFT_N_FFT``).
+            hop_length (int): STFT hop size (default ``Config.STFT_HOP_LENGTH``).
+
+        Returns:
+            str: Cache key.
+        """
+        n_fft = n_fft or Config.STFT_N_FFT
+        hop_length = hop_length or Config.STFT_HOP_LENGTH
+        return f"{digest}.{int(sample_rate)}hz.{scale}{int(height)}.stft{int(n_fft)}-{int(hop_length)}"
+
+    @staticmethod
+    def is_key(key):
+        """
+        Args:
+            key (str): Untrusted key (e.g. from a URL).
+
+        Returns:
+            bool: True if ``key`` is well-formed (no path components).
+        """
+        return bool(_KEY_PATTERN.match(key)) and '..' not in key
+
+    def manifest_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def tile_path(self, key, level, index):
+        """
+        Args:
+            key (str): Cache key.
+            level (int): Zoom level.
+            index (int): Tile index within the level.
+
+        Returns:
+            str: Path of the tile.
+        """
+        return os.path.join(self.directory, f"{key}.z{int(level)}.{int(index)}.png")
+
+    def manifest(self, key):
+        """
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            dict or None: Manifest of a complete spectrogram, None on a miss.
+        """
+        if not self.is_key(key):
+            return None
+        try:
+            with open(self.manifest_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, spectrogram, tile_width=None):
+        """
+        Write the tiles of every level, then the manifest.
+
+        Args:
+            key (str): Cache key.
+            spectrogram (Spectrogram): Spectrogram to store.
+            tile_width (int): Columns per tile (default
+                ``Config.SPECTROGRAM_TILE_WIDTH``).
+
+        Returns:
+            dict: The manifest.
+        """
+        tile_width = tile_width or Config.SPECTROGRAM_TILE_WIDTH
+        levels = []
+        for level, columns in enumerate(spectrogram.levels):
+            count = 0
+            for index, png in enumerate(spectrogram.tiles(level, tile_width)):
+                self._write(self.tile_path(key, level, index), png)
+                count += 1
+            frames = spectrogram.frames_per_column(level)
+            levels.append({
+                'level': level,
+                'columns': len(columns),
+                'tiles': count,
+                'frames_per_column': frames,
+                'seconds_per_column': frames * spectrogram.hop_length / spectrogram.sample_rate,
+            })
+
+        manifest = {
+            'key': key,
+            'sample_rate': spectrogram.sample_rate,
+            'num_samples': spectrogram.num_samples,
+            'n_fft': spectrogram.n_fft,
+            'hop_length': spectrogram.hop_length,
+            'scale': spectrogram.scale,
+            'height': spectrogram.height,
+            'top_db': spectrogram.top_db,
+            'tile_width': tile_width,
+            'levels': levels,
+        }
+        self._write(self.manifest_path(key), json.dumps(manifest).encode())
+        return manifest
+
+    @staticmethod
+    def _write(path, data):
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
@@ -0,0 +1,173 @@
+"""
+Upload registry.
+
+Records every upload (path, format, size, audio header and content hash)
+in a small SQLite database, so that requests find their input in O(1)
+and can be validated before any audio is decoded.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import soundfile as sf
+
+from .result_cache import file_digest
+
+_COLUMNS = (
+    'file_id', 'path', 'extension', 'original_name', 'size', 'duration',
+    'sample_rate', 'channels', 'frames', 'sha256', 'created_at',
+)
+
+
+def probe_audio(path):
+    """
+    Read the audio header of a file without decoding it.
+
+    Args:
+        path (str): Path to the audio file.
+
+    Returns:
+        dict: duration (s), sample_rate, channels and frames.
+
+    Raises:
+        IOError: If the file is not readable audio.
+    """
+    try:
+        info = sf.info(path)
+    except Exception as e:
+        raise IOError(f'Could not read audio header: {str(e)}') from e
+    return {
+        'duration': info.frames / info.samplerate if info.samplerate else 0.0,
+        'sample_rate': info.samplerate,
+        'channels': info.channels,
+        'frames': info.frames,
+    }
+
+
+class UploadRegistry:
+    """
+    SQLite index of uploaded files, keyed by file ID.
+    """
+
+    def __init__(self, db_path):
+        """
+        Open (or create) the registry.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    file_id TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    extension TEXT,
+                    original_name TEXT,
+                    size INTEGER,
+                    duration REAL,
+                    sample_rate INTEGER,
+                    channels INTEGER,
+                    frames INTEGER,
+                    sha256 TEXT,
+                    created_at REAL
+                )
+            ''')
+
+    def register(self, file_id, path, original_name=None, sha256=None):
+        """
+        Probe a saved upload and record it.
+
+        Args:
+            file_id (str): Upload identifier.
+            path (str): Path of the saved file.
+            original_name (str): Client-side file name.
+            sha256 (str): Content hash, computed here if not given.
+
+        Returns:
+            dict: The stored record.
+
+        Raises:
+            IOError: If the file is not readable audio.
+        """
+        record = {
+            'file_id': file_id,
+            'path': path,
+            'extension': os.path.splitext(path)[1].lower(),
+            'original_name': original_name,
+            'size': os.path.getsize(path),
+            'sha256': sha256 or file_digest(path),
+            'created_at': time.time(),
+        }
+        record.update(probe_audio(path))
+
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO uploads ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                [record[c] for c in _COLUMNS],
+            )
+        return record
+
+    def get(self, file_id):
+        """
+        Look up an upload.
+
+        Args:
+            file_id (str): Upload identifier.
+
+        Returns:
+            dict or None: The record, None if unknown or its file is gone.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT * FROM uploads WHERE file_id = ?', (file_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        if not os.path.exists(record['path']):
+            self.remove(file_id)
+            return None
+        return record
+
+    def remove(self, file_id):
+        """
+        Forget an upload (the file itself is not touched).
+
+        Args:
+            file_id (str): Upload identifier.
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM uploads WHERE file_id = ?', (file_id,))
+
+    def sync(self, upload_dir):
+        """
+        Reconcile the registry with the upload directory: register files
+        saved before the registry existed and drop rows whose file is gone.
+
+        Args:
+            upload_dir (str): Directory holding the uploads.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT file_id, path FROM uploads').fetchall()
+        known = set()
+        for row in rows:
+            if os.path.exists(row['path']):
+                known.add(row['path'])
+            else:
+                self.remove(row['file_id'])
+
+        for name in os.listdir(upload_dir):
+            path = os.path.join(upload_dir, name)
+            if path in known or not os.path.isfile(path):
+                continue
+            try:
+                self.register(os.path.splitext(name)[0], path)
+            except IOError:
+                pass
@@ -0,0 +1,428 @@
+"""
+Streaming and resumable uploads.
+
+Uploads are written in fixed-size chunks while their SHA-256 is computed,
+and are aborted as soon as they exceed the size limit. Writing and hashing
+run in a thread so that large uploads do not block the event loop. Form uploads are
+parsed as the request body arrives, so the limit applies while receiving.
+Large files can be sent in several requests through an upload session,
+which can be resumed from the last byte received.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from config import Config
+
+
+class UploadTooLargeError(Exception):
+    """
+    Raised when an upload exceeds ``Config.MAX_FILE_SIZE``.
+    """
+
+
+class UploadOffsetError(Exception):
+    """
+    Raised when a session chunk does not start where the previous one ended.
+    """
+
+
+def _write_block(f, digest, data):
+    """
+    Write and hash one chunk (run in a thread).
+    """
+    f.write(data)
+    digest.update(data)
+
+
+async def _write_chunk(f, digest, data):
+    """
+    Write and hash one chunk in a thread. If the caller is cancelled, the
+    write still completes before the cancellation propagates, so that the
+    file is never truncated or closed under the thread.
+    """
+    write = asyncio.ensure_future(asyncio.to_thread(_write_block, f, digest, data))
+    try:
+        await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await write
+        raise
+
+
+async def save_stream(chunks, path, max_bytes=None, digest=None, append=False):
+    """
+    Write an async stream of byte chunks to a file, hashing as it goes.
+    Chunks are gathered into ``Config.UPLOAD_CHUNK_SIZE`` writes, done in a
+    thread.
+
+    Args:
+        chunks (async iterable[bytes]): Data to write.
+        path (str): Destination file.
+        max_bytes (int): Size limit, counting bytes already in the file when
+            appending (default ``Config.MAX_FILE_SIZE``).
+        digest (hashlib object): Running hash to update (a new SHA-256 if None).
+        append (bool): Append to the file instead of truncating it.
+
+    Returns:
+        tuple: (size (int), digest (hashlib object))
+
+    Raises:
+        UploadTooLargeError: As soon as the limit is crossed. The bytes of
+            this call are not kept.
+    """
+    if max_bytes is None:
+        max_bytes = Config.MAX_FILE_SIZE
+    if digest is None:
+        digest = hashlib.sha256()
+
+    with open(path, 'ab' if append else 'wb') as f:
+        start = f.tell()
+        size = start
+        pending = bytearray()
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(
+                        f'File exceeds the {max_bytes // (1024 * 1024)} MB limit'
+                    )
+                pending += chunk
+                if len(pending) >= Config.UPLOAD_CHUNK_SIZE:
+                    await _write_chunk(f, digest, bytes(pending))
+                    pending.clear()
+            if pending:
+                await _write_chunk(f, digest, bytes(pending))
+        except BaseException:
+            f.truncate(start)
+            raise
+    return size, digest
+
+
+class MultipartFileReader:
+    """
+    Streams the file field of a ``multipart/form-data`` request body.
+
+    The body is parsed chunk by chunk as it is received: the file content is
+    passed on as it arrives and the body size is checked on the way, instead
+    of spooling the whole form before the handler runs.
+    """
+
+    def __init__(self, chunks, content_type, field='file', max_bytes=None):
+        """
+        Args:
+            chunks (async iterable[bytes]): Request body.
+            content_type (str): Content-Type header of the request.
+            field (str): Name of the file field.
+            max_bytes (int): Size limit of the whole body (default
+                ``Config.MAX_FILE_SIZE`` plus ``Config.MULTIPART_OVERHEAD``).
+
+        Raises:
+            ValueError: If the body is not multipart/form-data.
+        """
+        if max_bytes is None:
+            max_bytes = Config.MAX_FILE_SIZE + Config.MULTIPART_OVERHEAD
+        kind, options = parse_options_header(content_type or '')
+        if kind != b'multipart/form-data' or not options.get(b'boundary'):
+            raise ValueError('Expected a multipart/form-data body')
+
+        self.field = field.encode()
+        self.filename = None
+        self.max_bytes = max_bytes
+        self.received = 0
+        self._chunks = chunks.__aiter__()
+        self._pending = []
+        self._headers = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._in_file = False
+        self._file_done = False
+        self._finished = False
+        self._parser = MultipartParser(options[b'boundary'], callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if (self.filename is None and options.get(b'name') == self.field
+                and b'filename' in options):
+            self.filename = options[b'filename'].decode('utf-8', 'replace')
+            self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._pending.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
+
+    async def _feed(self):
+        """
+        Parse the next chunk of the body.
+
+        Raises:
+            UploadTooLargeError: As soon as the body exceeds the limit.
+            ValueError: If the body is malformed.
+        """
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._parser.finalize()
+            self._finished = True
+            return
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadTooLargeError(
+                f'File exceeds the {Config.MAX_FILE_SIZE // (1024 * 1024)} MB limit'
+            )
+        self._parser.write(chunk)
+
+    async def read_filename(self):
+        """
+        Read the body up to the headers of the file field.
+
+        Returns:
+            str: Client-side name of the file.
+
+        Raises:
+            UploadTooLargeError: If the body exceeds the limit first.
+            ValueError: If the form has no file field or is malformed.
+        """
+        while self.filename is None and not self._finished:
+            await self._feed()
+        if self.filename is None:
+            raise ValueError(f'No {self.field.decode()} field in the form')
+        return self.filename
+
+    async def read(self):
+        """
+        Iterate over the file content as it is received, then read the
+        rest of the body.
+
+        Yields:
+            bytes: File content.
+
+        Raises:
+            UploadTooLargeError: As soon as the body exceeds the limit.
+            ValueError: If the body ends before the file does.
+        """
+        await self.read_filename()
+        while True:
+            while self._pending:
+                yield self._pending.pop(0)
+            if self._file_done or self._finished:
+                break
+            await self._feed()
+        if not self._file_done:
+            raise ValueError('Incomplete multipart body')
+        while not self._finished:
+            await self._feed()
+
+
+class UploadSessionStore:
+    """
+    Resumable upload sessions.
+
+    Each session is a partial file ``{id}.part`` and a small ``{id}.json``
+    holding its metadata, so sessions survive a restart. Running hashes are
+    kept in memory and rebuilt from the partial file if lost.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize the store.
+
+        Args:
+            directory (str): Directory holding partial uploads.
+        """
+        self.directory = directory
+        self._digests = {}
+        self._locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, session_id):
+        base = os.path.join(self.directory, session_id)
+        return base + '.part', base + '.json'
+
+    def create(self, filename, total_size=None):
+        """
+        Start a session.
+
+        Args:
+            filename (str): Client-side file name.
+            total_size (int): Announced size in bytes, if known.
+
+        Returns:
+            dict: Session metadata.
+
+        Raises:
+            UploadTooLargeError: If the announced size is over the limit.
+        """
+        if total_size is not None and total_size > Config.MAX_FILE_SIZE:
+            raise UploadTooLargeError(
+                f'File exceeds the {Config.MAX_FILE_SIZE // (1024 * 1024)} MB limit'
+            )
+        session = {
+            'upload_id': str(uuid.uuid4()),
+            'filename': filename,
+            'total_size': total_size,
+            'created_at': time.time(),
+        }
+        part_path, meta_path = self._paths(session['upload_id'])
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump(session, f)
+        self._digests[session['upload_id']] = hashlib.sha256()
+        return self.status(session['upload_id'])
+
+    def status(self, session_id):
+        """
+        Describe a session.
+
+        Args:
+            session_id (str): Session identifier.
+
+        Returns:
+            dict or None: Metadata plus ``offset`` (bytes received), None if
+            the session does not exist.
+        """
+        try:
+            uuid.UUID(session_id)
+        except ValueError:
+            return None
+
+        part_path, meta_path = self._paths(session_id)
+        try:
+            with open(meta_path) as f:
+                session = json.load(f)
+            session['offset'] = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            return None
+        return session
+
+    def _lock(self, session_id):
+        """
+        Lock serializing the chunks and the completion of a session.
+        """
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    def _digest(self, session_id, part_path):
+        """
+        Running hash of a session, rebuilt from disk if not in memory.
+        """
+        if session_id not in self._digests:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(Config.UPLOAD_CHUNK_SIZE), b''):
+                    digest.update(block)
+            self._digests[session_id] = digest
+        return self._digests[session_id]
+
+    async def append(self, session_id, offset, chunks):
+        """
+        Append a chunk of the upload.
+
+        Args:
+            session_id (str): Session identifier.
+            offset (int): Byte offset the chunk starts at.
+            chunks (async iterable[bytes]): Chunk content.
+
+        Returns:
+            dict: Updated session status.
+
+        Raises:
+            KeyError: If the session does not exist (or was completed).
+            UploadOffsetError: If ``offset`` is not the current size.
+            UploadTooLargeError: If the upload exceeds the limit.
+        """
+        # Concurrent chunks of one session must not interleave, nor run
+        # while it is completed; a completed session no longer exists
+        async with self._lock(session_id):
+            session = self.status(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            if offset != session['offset']:
+                raise UploadOffsetError(f"Expected offset {session['offset']}, got {offset}")
+
+            part_path, _ = self._paths(session_id)
+            # Work on a copy so that a rejected chunk leaves the hash untouched
+            digest = (await asyncio.to_thread(self._digest, session_id, part_path)).copy()
+            _, digest = await save_stream(chunks, part_path, digest=digest, append=True)
+            self._digests[session_id] = digest
+            return self.status(session_id)
+
+    async def complete(self, session_id, destination):
+        """
+        Finish a session and move the file to its final location, after
+        any chunk being appended.
+
+        Args:
+            session_id (str): Session identifier.
+            destination (str): Final path of the upload.
+
+        Returns:
+            tuple: (session (dict), sha256 (str))
+
+        Raises:
+            KeyError: If the session does not exist.
+            UploadOffsetError: If fewer bytes than announced were received.
+        """
+        async with self._lock(session_id):
+            session = self.status(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            if session['total_size'] is not None and session['offset'] != session['total_size']:
+                raise UploadOffsetError(
+                    f"Upload incomplete: {session['offset']} of {session['total_size']} bytes"
+                )
+
+            part_path, _ = self._paths(session_id)
+            digest = await asyncio.to_thread(self._digest, session_id, part_path)
+            sha256 = digest.hexdigest()
+            os.replace(part_path, destination)
+            self.discard(session_id)
+            return session, sha256
+
+    def discard(self, session_id):
+        """
+        Delete a session and its partial data.
+
+        Args:
+            session_id (str): Session identifier.
+        """
+        for path in self._paths(session_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._digests.pop(session_id, None)
+        self._locks.pop(session_id, None)
@@ -8,8 +8,9 @@ and comparisons using matplotlib and Streamlit.
 import streamlit as st
 import matplotlib.pyplot as plt
 import numpy as np
-import librosa
-import librosa.display
+
+from pipeline.peaks import PeakBuilder
+from pipeline.spectrogram import SpectrogramBuilder
 
 
 def plot_audio_waveform(audio_data, sample_rate, title='Audio Waveform'):
@@ -23,9 +24,16 @@ def plot_audio_waveform(audio_data, sample_rate, title='Audio Waveform'):
     """
     fig, ax = plt.subplots(figsize=(10, 3))
 
-    times = np.arange(len(audio_data)) / sample_rate
-
-    ax.plot(times, audio_data, linewidth=0.5)
+    # Long signals are drawn from their min / max envelope, not every sample
+    envelope = PeakBuilder(sample_rate).build([audio_data])
+    level = envelope.level_for_width(2000)
+    if len(audio_data) > 2 * len(envelope.levels[level]):
+        rows = envelope.level(level) / 32767.0
+        times = np.arange(len(rows)) * envelope.bucket_size(level) / sample_rate
+        ax.fill_between(times, rows[:, 0], rows[:, 1], linewidth=0.5)
+    else:
+        times = np.arange(len(audio_data)) / sample_rate
+        ax.plot(times, audio_data, linewidth=0.5)
 
     ax.set_xlabel('Time (s)')
     ax.set_ylabel('Amplitude')
@@ -36,7 +44,7 @@ def plot_audio_waveform(audio_data, sample_rate, title='Audio Waveform'):
     plt.close()
 
 
-def plot_spectrogram(audio_data, sample_rate, title='Spectrogram'):
+def plot_spectrogram(audio_data, sample_rate, title='Spectrogram', analysis=None):
     """
     Plot the spectrogram of an audio signal.
 
@@ -44,20 +52,28 @@ def plot_spectrogram(audio_data, sample_rate, title='Spectrogram'):
         audio_data (np.ndarray): Audio signal data.
         sample_rate (int): Sampling rate of the audio.
         title (str): Title of the plot.
+        analysis (STFTAnalysis): Optional precomputed analysis of
+            ``audio_data`` (e.g. from ``AudioProcessor.analyze``); the STFT
+            is only computed when it is not given.
     """
     fig, ax = plt.subplots(figsize=(10, 4))
 
-    spectrogram_db = librosa.amplitude_to_db(
-        np.abs(librosa.stft(audio_data)), ref=np.max
-    )
-
-    img = librosa.display.specshow(
-        spectrogram_db,
-        x_axis='time',
-        y_axis='hz',
-        sr=sample_rate,
-        ax=ax,
+    # Log-magnitude image reduced to at most a few thousand columns
+    if analysis is not None:
+        spectrogram = SpectrogramBuilder(sample_rate).build_from_analysis(analysis)
+    else:
+        spectrogram = SpectrogramBuilder(sample_rate).build([audio_data])
+    columns = spectrogram.levels[spectrogram.level_for_width(2000)]
+
+    img = ax.imshow(
+        spectrogram.to_db(columns.T),
+        origin='lower',
+        aspect='auto',
+        cmap='magma',
+        extent=(0, spectrogram.num_samples / sample_rate, 0, sample_rate / 2),
     )
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Hz')
 
     ax.set_title(title)
 